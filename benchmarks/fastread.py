@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+Validate the fast header-only tag reader against mutagen and compare the
+speed of both for all MP3, FLAC and Ogg Vorbis files in a directory.
+
+Files the fast reader rejects are counted as fallbacks. The script exits
+with an error if the fast reader returns different tags for any file.
+
+Usage: benchmarks/fastread.py DIRECTORY
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pogo.media import mFormats
+from pogo.media.format import fastReader
+from pogo.media.track import TAG_RES
+
+
+def findFiles(directory):
+    files = []
+    for (root, dirs, names) in os.walk(directory):
+        files.extend(os.path.join(root, name) for name in sorted(names) if fastReader.isSupported(name))
+    return files
+
+
+def readMutagen(file):
+    return mFormats[os.path.splitext(file.lower())[1]].getTrack(file)
+
+
+def timeReader(getTrack, files):
+    start = time.perf_counter()
+    for file in files:
+        getTrack(file)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    files = findFiles(sys.argv[1])
+
+    fallbacks = 0
+    mismatches = 0
+    for file in files:
+        fast = fastReader.getTrack(file)
+        if fast is None:
+            fallbacks += 1
+            continue
+
+        expected = readMutagen(file).tags
+        for tag in sorted(set(fast.tags) | set(expected)):
+            if tag != TAG_RES and fast.tags.get(tag) != expected.get(tag):
+                mismatches += 1
+                print('%s: tag %d is %r, mutagen says %r' % (file, tag, fast.tags.get(tag), expected.get(tag)))
+
+    print()
+    print('Validated %d files (%d fallbacks to mutagen): %d mismatches' % (len(files), fallbacks, mismatches))
+
+    print('Reading the tags of %d files' % len(files))
+    for (name, getTrack) in [('mutagen', readMutagen), ('fast reader', fastReader.getTrack)]:
+        print(' * with %-11s: %.3fs' % (name, timeReader(getTrack, files)))
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+"""
+Compare the cached row labels of Track.get_label() with the previous
+implementation, which normalized the parent label and the tags of the
+track with eleven str.replace() calls on every call.
+
+The previous Tracktree.insertTrack() labelled each track without a
+parent first and then with the label of its album node, now the track is
+only labelled for its album node. Moving the rows afterwards labels each
+track again. The script exits with an error if the labels differ.
+
+Usage: benchmarks/labels.py [NUMBER_OF_TRACKS] [TRACKS_PER_ALBUM]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pogo import tools
+from pogo.media.track import TAG_ALB, TAG_ART, TAG_LEN, TAG_NUM, TAG_TIT
+from pogo.media.track.fileTrack import FileTrack
+from pogo.tools import consts
+
+
+def oldGetLabel(track, parent_label=None, playing=False):
+    """ The previous Track.get_label() """
+    title = track._Track__get(TAG_TIT, '')
+    artist = track._Track__get(TAG_ART, '')
+
+    album = track.getExtendedAlbum()
+    if album == consts.UNKNOWN_ALBUM:
+        album = ''
+
+    number = track._Track__get(TAG_NUM, '')
+    length = track.getLength()
+
+    if number:
+        number = str(number).zfill(2)
+
+    connectors = ['the', 'and', '&', ',', '.', '?', '!', "'", ':', '-', ' ']
+
+    if parent_label:
+        parent_label = parent_label.lower()
+        short_album = album.lower()
+        short_artist = artist.lower()
+        for connector in connectors:
+            parent_label = parent_label.replace(connector, '')
+            short_album = short_album.replace(connector, '')
+            short_artist = short_artist.replace(connector, '')
+        if short_album.strip() in parent_label:
+            album = ''
+        if short_artist.strip() in parent_label:
+            artist = ''
+
+    if title:
+        label = ' - '.join([part for part in [artist, album, number, title] if part])
+    else:
+        label = track.getBasename()
+
+    label = tools.htmlEscape(label)
+    if playing:
+        label = '<b>%s</b>' % label
+    label += ' [%s]' % tools.sec2str(length)
+    return label
+
+
+def newGetLabel(track, parent_label=None, playing=False):
+    return track.get_label(parent_label, playing)
+
+
+def createAlbums(nbTracks, tracksPerAlbum):
+    """ Return a list of (album node label, tracks) """
+    albums = []
+    for index in range(nbTracks):
+        albumIndex = index // tracksPerAlbum
+        if index % tracksPerAlbum == 0:
+            artist = 'The Artist & Band %d' % (albumIndex // 5)
+            album = 'Album: Part %d' % albumIndex
+            albums.append(('%s - %s' % (artist, album), []))
+        track = FileTrack('/music/%d/%02d track.mp3' % (albumIndex, index % tracksPerAlbum))
+        track.setTags({
+            TAG_ART: artist, TAG_ALB: album, TAG_TIT: 'Title %d' % index,
+            TAG_NUM: index % tracksPerAlbum + 1, TAG_LEN: 180 + index % 120})
+        albums[-1][1].append(track)
+    return albums
+
+
+def insert(albums, getLabel, labelWithoutParent):
+    """ Label the tracks like Tracktree.insertTrack() and then like TrackTreeView.move_selected_rows() """
+    labels = []
+    start = time.perf_counter()
+    for (albumLabel, tracks) in albums:
+        for track in tracks:
+            if labelWithoutParent:
+                getLabel(track)
+            labels.append(getLabel(track, albumLabel))
+    inserted = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for (albumLabel, tracks) in albums:
+        for track in tracks:
+            getLabel(track, albumLabel)
+    moved = time.perf_counter() - start
+    return (labels, inserted, moved)
+
+
+if __name__ == '__main__':
+    nbTracks = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    tracksPerAlbum = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+    albums = createAlbums(nbTracks, tracksPerAlbum)
+    print('Labelling %d tracks in %d albums' % (nbTracks, len(albums)))
+    results = {}
+    for (name, getLabel, labelWithoutParent) in [('str.replace', oldGetLabel, True), ('cached', newGetLabel, False)]:
+        (labels, inserted, moved) = insert(albums, getLabel, labelWithoutParent)
+        results[name] = labels
+        print(' * %-12s: %.3fs for inserting, %.3fs for moving' % (name, inserted, moved))
+
+    if results['str.replace'] != results['cached']:
+        sys.exit('The labels differ')
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Compare the memory used by the slotted Track objects with the previous
+Track objects, which stored their tags in a per-instance dictionary.
+
+The tags of the files in the given directory are repeated until there are
+NUMBER_OF_TRACKS tracks. Each track gets its own copy of every string, as
+if it had been parsed from its own file.
+
+Usage: benchmarks/memory.py DIRECTORY [NUMBER_OF_TRACKS]
+"""
+
+import os
+import pickle
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pogo import media
+from pogo.media.track import TAG_RES, TAG_TIT
+from pogo.media.track.fileTrack import FileTrack
+
+
+class DictTrack:
+    """ The previous representation of a track """
+
+    def __init__(self, tags):
+        self.tags = {}
+        self.tags.update(tags)
+
+
+def copy(value):
+    """ Return a new object equal to value, strings are not shared """
+    if type(value) is str:
+        return (value + '.')[:-1]
+    return value
+
+
+def loadTemplates(directory):
+    """ Return the tags of all files in directory """
+    files = [file for (name, files) in media.walkPaths(directory, '') for file in files]
+    return [track.tags for track in media.getTracksFromFiles(files)]
+
+
+def generateTags(templates, index):
+    """ Return the tags of a new track based on the templates """
+    tags = {tag: copy(value) for (tag, value) in templates[index % len(templates)].items()}
+    tags[TAG_RES] = '%s.%d' % (tags[TAG_RES], index)
+    if TAG_TIT in tags:
+        tags[TAG_TIT] = '%s %d' % (tags[TAG_TIT], index)
+    return tags
+
+
+def newTrack(tags):
+    track = FileTrack(tags[TAG_RES])
+    track.setTags(tags)
+    return track
+
+
+def measure(create, templates, number):
+    """ Return the number of bytes used per track and the pickled size per track """
+    tracemalloc.start()
+    tracks = [create(generateTags(templates, index)) for index in range(number)]
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    pickled = len(pickle.dumps(tracks))
+    return (used / number, pickled / number)
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1]
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    templates = loadTemplates(directory)
+    print('Memory used by %d tracks (the tags themselves are included)' % number)
+    for (name, create) in [('dictionary', DictTrack), ('slots', newTrack)]:
+        (memory, pickled) = measure(create, templates, number)
+        print(' * with %-10s: %6.0f bytes per track, %4.0f bytes per pickled track' % (name, memory, pickled))
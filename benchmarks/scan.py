@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+"""
+Compare serial and parallel tag extraction for media.getTracks().
+
+Usage: benchmarks/scan.py DIRECTORY [WORKERS]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pogo import media
+from pogo.media import tagcache
+
+DIRECTORY = sys.argv[1]
+WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+
+def scan(workers, processes, fast=False):
+    # Start with empty caches, so that every file has to be parsed
+    tagcache.close()
+    tagcache.DB_FILE = ':memory:'
+    media._track_cache.clear()
+
+    start = time.perf_counter()
+    tracks = media.getTracks([DIRECTORY], workers=workers, processes=processes, fast=fast)
+    return time.perf_counter() - start, len(tracks)
+
+
+if __name__ == '__main__':
+    # Start the pools before measuring
+    scan(WORKERS, True)
+    scan(WORKERS, False)
+
+    print()
+    print('Reading the tags of all files in %s' % DIRECTORY)
+    serial, nb_tracks = scan(1, False)
+    print(' * serially (%d tracks):   %.3fs' % (nb_tracks, serial))
+    duration, nb_tracks = scan(1, False, fast=True)
+    print(' * serially, fast reader:  %.3fs (speedup: %.2f)' % (duration, serial / duration))
+    for name, processes in [('processes', True), ('threads', False)]:
+        duration, nb_tracks = scan(WORKERS, processes)
+        print(' * %d %-9s:          %.3fs (speedup: %.2f)' % (WORKERS, name, duration, serial / duration))
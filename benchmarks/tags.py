@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""
+Compare the table-driven tag extraction of pogo.media.format with the
+previous extraction, which used one try/except block per tag (and parsed
+MP3 files twice).
+
+Usage: benchmarks/tags.py DIRECTORY [FILES_PER_FORMAT]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mutagen.asf import ASF
+from mutagen.flac import FLAC
+from mutagen.id3 import ID3
+from mutagen.monkeysaudio import MonkeysAudio
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4
+from mutagen.musepack import Musepack
+from mutagen.oggvorbis import OggVorbis
+from mutagen.wavpack import WavPack
+
+from pogo.media import mFormats
+from pogo.media.format import createFileTrack
+
+NB_ITERS = 20
+
+
+def lookup(tags, lookups):
+    """ The previous way of reading tags: one exception per missing tag """
+    args = {}
+    for (name, get) in lookups:
+        try:
+            args[name] = get(tags)
+        except:
+            args[name] = None
+    return args
+
+
+VORBIS = [(name, lambda tags, key=key: str(tags[key][0])) for (name, key) in [
+    ('title', 'title'), ('album', 'album'), ('artist', 'artist'), ('albumArtist', 'albumartist'),
+    ('genre', 'genre'), ('musicbrainzId', 'musicbrainz_trackid'), ('trackNumber', 'tracknumber'),
+    ('discNumber', 'discnumber'), ('date', 'date')]]
+
+ID3_TEXT = [(name, lambda tags, key=key: str(tags[key])) for (name, key) in [
+    ('title', 'TIT2'), ('album', 'TALB'), ('artist', 'TPE1'), ('albumArtist', 'TPE2'),
+    ('genre', 'TCON'), ('trackNumber', 'TRCK'), ('discNumber', 'TPOS')]]
+ID3_LOOKUPS = ID3_TEXT + [
+    ('musicbrainzId', lambda tags: tags['UFID:http://musicbrainz.org'].data),
+    ('date', lambda tags: str(tags['TDRC'][0].year))]
+
+MP4_LOOKUPS = [
+    ('trackNumber', lambda tags: str(tags['trkn'][0][0])),
+    ('discNumber', lambda tags: str(tags['disk'][0][0])),
+    # The previous code used only the first character of the date
+    ('date', lambda tags: str(tags['\xa9day'][0]))] + [
+    (name, lambda tags, key=key: str(tags[key][0])) for (name, key) in [
+        ('title', '\xa9nam'), ('album', '\xa9alb'), ('artist', '\xa9ART'), ('genre', '\xa9gen'),
+        ('albumArtist', 'aART')]]
+
+ASF_LOOKUPS = [(name, lambda tags, key=key: str(tags[key][0])) for (name, key) in [
+    ('trackNumber', 'WM/TrackNumber'), ('discNumber', 'WM/PartOfSet'), ('date', 'WM/Year'),
+    ('title', 'Title'), ('album', 'WM/AlbumTitle'), ('artist', 'Author'),
+    ('albumArtist', 'WM/AlbumArtist'), ('genre', 'WM/Genre'), ('musicbrainzId', 'MusicBrainz/Track Id')]]
+
+APE_KEYS = [
+    ('trackNumber', 'Track'), ('discNumber', 'Discnumber'), ('date', 'Year'), ('title', 'Title'),
+    ('genre', 'Genre'), ('musicbrainzId', 'MUSICBRAINZ_TRACKID'), ('album', 'Album'),
+    ('artist', 'Artist'), ('albumArtist', 'Album Artist')]
+MPC_LOOKUPS = [(name, lambda tags, key=key: str(tags[key])) for (name, key) in APE_KEYS]
+APE_LOOKUPS = [(name, lambda tags, key=key: str(tags[key][0])) for (name, key) in APE_KEYS
+               if name not in ('discNumber', 'musicbrainzId', 'albumArtist')]
+WV_LOOKUPS = [(name, lambda tags, key=key: str(tags[key][0])) for (name, key) in [
+    ('title', 'Title'), ('album', 'Album'), ('artist', 'Artist'), ('albumArtist', 'Album Artist'),
+    ('genre', 'genre'), ('trackNumber', 'Track'), ('discNumber', 'Disc'), ('date', 'Year')]]
+
+
+def oldMP3(filename):
+    mp3File = MP3(filename)
+    info = mp3File.info
+    try:
+        args = lookup(ID3(filename), ID3_LOOKUPS)
+    except:
+        args = {}
+    return createFileTrack(filename, int(info.bitrate), int(round(info.length)), int(info.sample_rate), False, **args)
+
+
+def old(cls, lookups, bitrate, isVBR):
+    def getTrack(filename):
+        fileobj = cls(filename)
+        info = fileobj.info
+        return createFileTrack(filename, bitrate(info), int(round(info.length)), int(info.sample_rate), isVBR,
+                               **lookup(fileobj, lookups))
+    return getTrack
+
+
+OLD = {
+    '.mp3': oldMP3,
+    '.flac': old(FLAC, VORBIS, lambda info: -1, False),
+    '.ogg': old(OggVorbis, VORBIS, lambda info: int(info.bitrate), True),
+    '.m4a': old(MP4, MP4_LOOKUPS, lambda info: int(info.bitrate), False),
+    '.wma': old(ASF, ASF_LOOKUPS, lambda info: int(info.bitrate), False),
+    '.mpc': old(Musepack, MPC_LOOKUPS, lambda info: int(info.bitrate * 1000), False),
+    '.ape': old(MonkeysAudio, APE_LOOKUPS, lambda info: -1, False),
+    '.wv': old(WavPack, WV_LOOKUPS, lambda info: -1, False),
+}
+
+
+def findFiles(directory, limit):
+    """ Return up to limit files per extension """
+    files = {}
+    for (root, dirs, names) in os.walk(directory):
+        for name in sorted(names):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in OLD and len(files.setdefault(ext, [])) < limit:
+                files[ext].append(os.path.join(root, name))
+    return files
+
+
+def run(getTrack, files):
+    for file in files:
+        getTrack(file)
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1]
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    for (ext, files) in sorted(findFiles(directory, limit).items()):
+        new = mFormats[ext].getTrack
+        for file in files:
+            assert new(file).tags == OLD[ext](file).tags, file
+
+        print()
+        print('Reading the tags of %d %s files %d times' % (len(files), ext, NB_ITERS))
+        for (name, getTrack) in [('try/except', OLD[ext]), ('tables', new)]:
+            duration = timeit.timeit(lambda: run(getTrack, files), number=NB_ITERS)
+            print(' * with %-10s: %.3fs' % (name, duration))
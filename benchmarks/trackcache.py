@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+Stress the track cache of pogo.media from several threads.
+
+Each thread reads the tracks of all files in the given directory in its own
+random order, half of the threads file by file with getTrackFromFile() (like
+preloadTracks()) and the others with getTracksFromFiles() and a pool of
+worker threads (like the TrackLoader). Some of the latter stop early. The
+script checks that no file is parsed twice and that all threads get the
+same Track objects, and it exits with an error otherwise.
+
+Usage: benchmarks/trackcache.py DIRECTORY [THREADS] [ROUNDS]
+"""
+
+import collections
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pogo import media
+from pogo.media import tagcache
+
+parses = collections.Counter()
+parsesLock = threading.Lock()
+
+
+def countParses(parseFile):
+    def counted(file, fast=False):
+        with parsesLock:
+            parses[file] += 1
+        return parseFile(file, fast)
+    return counted
+
+
+def readOneByOne(files, results):
+    for file in files:
+        results.append(media.getTrackFromFile(file))
+
+
+def readInParallel(files, results, stop):
+    for track in media.getTracksFromFiles(files, workers=4, processes=False):
+        results.append(track)
+        if len(results) == stop:
+            break
+
+
+def runRound(files, nbThreads):
+    """ Return the number of errors of one round with empty caches """
+    media._track_cache.clear()
+    parses.clear()
+
+    threads = []
+    results = []
+    for index in range(nbThreads):
+        order = random.sample(files, len(files))
+        tracks = []
+        if index % 2:
+            target = readOneByOne
+            args = (order, tracks)
+        else:
+            target = readInParallel
+            args = (order, tracks, random.choice([len(files), len(files) // 3]))
+        threads.append(threading.Thread(target=target, args=args))
+        results.append((order, tracks))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    errors = 0
+    for (file, count) in parses.items():
+        if count > 1:
+            print('%s has been parsed %d times' % (file, count))
+            errors += 1
+    for (order, tracks) in results:
+        for (file, track) in zip(order, tracks):
+            if track is not media._track_cache.get(file) or track.getFilePath() != file:
+                print('%s: got a different Track object' % file)
+                errors += 1
+    if media._in_flight:
+        print('Files still in flight: %s' % list(media._in_flight))
+        errors += 1
+    return errors
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1]
+    nbThreads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    nbRounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    files = [file for (name, files) in media.walkPaths(directory, '') for file in files]
+    media._parseFile = countParses(media._parseFile)
+
+    errors = 0
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for round in range(nbRounds):
+            # Start each round with an empty tag cache
+            tagcache.close()
+            tagcache.DB_FILE = os.path.join(tmpDir, 'tag-cache-%d.sqlite' % round)
+            start = time.perf_counter()
+            roundErrors = runRound(files, nbThreads)
+            print('Round %d: %d threads read %d files in %.3fs, %d errors' % (
+                round + 1, nbThreads, len(files), time.perf_counter() - start, roundErrors))
+            errors += roundErrors
+        tagcache.close()
+
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Measure the transcoding export of pogo.media.export with different
+numbers of parallel GStreamer pipelines.
+
+The source files are FLAC files generated by audiotestsrc, each with its
+own artist and title tags. The script checks that the tags have been
+carried over to the exported files and that exporting again skips all
+files.
+
+Usage: benchmarks/transcode.py [FILES] [SECONDS] [FORMAT]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from pogo import media
+from pogo.media import export
+
+
+def generateFile(path, seconds, index):
+    """ Write a FLAC file with a sine tone of the given length """
+    samplesPerBuffer = 1024
+    pipeline = Gst.parse_launch(
+        'audiotestsrc num-buffers=%d samplesperbuffer=%d freq=%d ! audio/x-raw,rate=44100,channels=2 ! '
+        'audioconvert ! taginject tags="artist=Artist %d,title=Title %d" ! flacenc ! filesink location="%s"' % (
+            seconds * 44100 // samplesPerBuffer, samplesPerBuffer, 220 + 10 * index, index, index, path))
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if msg.type == Gst.MessageType.ERROR:
+        sys.exit('Cannot generate %s: %s' % (path, msg.parse_error()[0].message))
+
+
+def runExport(files, workers, transcoder):
+    job = export.ExportJob(files, workers, transcoder=transcoder)
+    start = time.perf_counter()
+    job.start()
+    job.thread.join()
+    return (job, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    nbFiles = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    format = sys.argv[3] if len(sys.argv) > 3 else 'mp3'
+
+    Gst.init(None)
+    transcoder = export.Transcoder(format)
+    workerCounts = sorted({1, 2, export.TRANSCODE_WORKERS})
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        srcDir = os.path.join(tmpDir, 'src')
+        os.mkdir(srcDir)
+        files = []
+        for index in range(nbFiles):
+            src = os.path.join(srcDir, '%02d.flac' % index)
+            generateFile(src, seconds, index)
+            files.append(src)
+        print('Transcoding %d files of %d seconds to %s at %d kbit/s' % (
+            nbFiles, seconds, format, export.TRANSCODE_BITRATE))
+
+        errors = 0
+        for workers in workerCounts:
+            outDir = os.path.join(tmpDir, 'out-%d' % workers)
+            pairs = [(src, os.path.join(outDir, os.path.basename(src))) for src in files]
+            (job, duration) = runExport(pairs, workers, transcoder)
+            print(' * %2d pipelines: %6.2fs, %5.1f files/s, %d failed' % (
+                workers, duration, nbFiles / duration, job.failed))
+            errors += job.failed
+
+            for (index, (dest, src)) in enumerate(job.files):
+                # The sources are FLAC files, so they all get the extension of the transcoder
+                dest = os.path.splitext(dest)[0] + transcoder.extension
+                track = media.getTrackFromFile(dest)
+                if track.getArtist() != 'Artist %d' % index or track.getTitle() != 'Title %d' % index:
+                    print('Tags of %s have not been carried over' % dest)
+                    errors += 1
+
+            (job, duration) = runExport(pairs, workers, transcoder)
+            if job.skipped != nbFiles:
+                print('Exporting again skipped only %d files' % job.skipped)
+                errors += 1
+
+    sys.exit(1 if errors else 0)
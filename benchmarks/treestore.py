@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+Compare filling the playlist with Tracktree.insertDir() with the previous
+implementation, which inserted one row at a time relative to the previous
+row with insert_before() and insert_after() and looked up and unescaped
+the label of the parent row for each track, while the view was attached
+to the model.
+
+The view is shown in an offscreen window and the pending events are
+processed before the time is taken, so the work done by the view is
+included. The script exits with an error if the rows differ.
+
+Usage: benchmarks/treestore.py [NUMBER_OF_TRACKS] [TRACKS_PER_ALBUM] [ALBUMS_PER_ARTIST]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import GdkPixbuf, GObject, Gtk
+
+from pogo import media, tools
+from pogo.media.track import TAG_ALB, TAG_ART, TAG_LEN, TAG_NUM, TAG_TIT
+from pogo.media.track.fileTrack import FileTrack
+from pogo.modules.Tracktree import Tracktree
+from pogo.gui.widgets import TrackTreeView
+from pogo.media import playlistIndex
+from pogo.tools import icons, searchIndex
+
+
+class Playlist:
+    """ The parts of Tracktree used by insertDir() """
+
+    insertDir = Tracktree.insertDir
+    insertRows = Tracktree.insertRows
+    indexRow = Tracktree.indexRow
+    getSearchKey = Tracktree.getSearchKey
+
+    def __init__(self):
+        columns = (('', [(Gtk.CellRendererPixbuf(), GdkPixbuf.Pixbuf), (Gtk.CellRendererText(), GObject.TYPE_STRING)], True),
+                   (None, [(None, GObject.TYPE_PYOBJECT)], False),
+                   )
+        self.tree = TrackTreeView(columns, use_markup=True)
+        self.window = Gtk.OffscreenWindow()
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(self.tree)
+        self.window.add(scrolled)
+        self.window.set_default_size(800, 600)
+        self.window.show_all()
+
+        self.playtime = 0
+        self.lastDirs = {}
+        self.lazyRows = {}
+        self.playlistIndex = playlistIndex.PlaylistIndex()
+        self.searchIndex = searchIndex.SearchIndex()
+
+    def oldInsertDir(self, trackdir, target=None, drop_mode=None):
+        """ The previous Tracktree.insertDir() """
+        model = self.tree.store
+        if trackdir.flat:
+            new = target
+        else:
+            string = tools.htmlEscape(trackdir.dirname.replace('_', ' '))
+            new = self.oldInsert(target, (icons.mediaDirMenuIcon(), string, None), drop_mode)
+            self.indexRow(new)
+            self.lastDirs[None] = Gtk.TreeRowReference(model, model.get_path(new))
+            drop_mode = Gtk.TreeViewDropPosition.INTO_OR_AFTER
+
+        dest = new
+        for index, subdir in enumerate(trackdir.subdirs):
+            drop = drop_mode if index == 0 else Gtk.TreeViewDropPosition.AFTER
+            dest = self.oldInsertDir(subdir, dest, drop)
+
+        dest = new
+        for index, track in enumerate(trackdir.tracks):
+            drop = drop_mode if index == 0 else Gtk.TreeViewDropPosition.AFTER
+            dest = self.oldInsertTrack(track, dest, drop)
+
+        if not trackdir.flat:
+            if target is None or model.iter_depth(new) == 0:
+                self.tree.expand(new)
+        return new
+
+    def oldInsertTrack(self, track, target, drop_mode):
+        """ The previous Tracktree.insertTrack() """
+        self.playtime += track.getLength()
+        if target is not None and drop_mode in (Gtk.TreeViewDropPosition.BEFORE, Gtk.TreeViewDropPosition.AFTER):
+            parent = self.tree.store.iter_parent(target)
+        else:
+            parent = target
+        parent_label = self.tree.getLabel(parent) if parent else None
+        new_iter = self.oldInsert(target, (icons.nullMenuIcon(), track.get_label(parent_label), track), drop_mode)
+        self.indexRow(new_iter)
+        return new_iter
+
+    def oldInsert(self, target, source_row, drop_mode):
+        """ The previous TrackTreeView.insert() """
+        model = self.tree.store
+        if drop_mode == Gtk.TreeViewDropPosition.INTO_OR_BEFORE:
+            return model.prepend(target, source_row)
+        elif drop_mode == Gtk.TreeViewDropPosition.INTO_OR_AFTER or drop_mode is None:
+            return model.append(target, source_row)
+        elif drop_mode == Gtk.TreeViewDropPosition.BEFORE:
+            return model.insert_before(None, target, source_row)
+        return model.insert_after(None, target, source_row)
+
+    def getRows(self, rows=None):
+        """ Return the list of (depth, label, file path) rows in depth-first order """
+        result = []
+        for row in (self.tree.store if rows is None else rows):
+            track = row[2]
+            result.append((row.path.get_depth(), row[1], track.getFilePath() if track else None))
+            result.extend(self.getRows(row.iterchildren()))
+        return result
+
+
+def createTrackDir(nbTracks, tracksPerAlbum, albumsPerArtist):
+    """ Return a flat TrackDir with artist directories that contain album directories """
+    root = media.TrackDir(None, flat=True)
+    for index in range(nbTracks):
+        albumIndex = index // tracksPerAlbum
+        artist = 'The Artist & Band %d' % (albumIndex // albumsPerArtist)
+        album = 'Album: Part %d' % albumIndex
+        if index % tracksPerAlbum == 0:
+            if albumIndex % albumsPerArtist == 0:
+                artistDir = media.TrackDir(artist.replace(' ', '_'))
+                root.add_subdir(artistDir)
+            albumDir = media.TrackDir(album)
+            artistDir.add_subdir(albumDir)
+        track = FileTrack('/music/%d/%02d track.mp3' % (albumIndex, index % tracksPerAlbum))
+        track.setTags({
+            TAG_ART: artist, TAG_ALB: album, TAG_TIT: 'Title %d' % index,
+            TAG_NUM: index % tracksPerAlbum + 1, TAG_LEN: 180 + index % 120})
+        albumDir.add_track(track)
+    return root
+
+
+def insert(trackdir, old):
+    """ Fill an empty playlist, return the playlist and the duration """
+    playlist = Playlist()
+    start = time.perf_counter()
+    if old:
+        playlist.oldInsertDir(trackdir)
+    else:
+        playlist.insertDir(trackdir)
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+    return (playlist, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    nbTracks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tracksPerAlbum = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    albumsPerArtist = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    print('Inserting %d tracks in %d albums' % (nbTracks, -(-nbTracks // tracksPerAlbum)))
+    results = {}
+    for (name, old) in [('row by row', True), ('bulk', False)]:
+        # New tracks for each run, since the tracks cache their labels
+        trackdir = createTrackDir(nbTracks, tracksPerAlbum, albumsPerArtist)
+        (playlist, duration) = insert(trackdir, old)
+        results[name] = playlist.getRows()
+        print(' * %-10s: %.2fs' % (name, duration))
+        playlist.window.destroy()
+
+    if results['row by row'] != results['bulk']:
+        sys.exit('The rows differ')
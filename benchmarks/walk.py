@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""
+Count the system calls needed to walk a synthetic music collection with
+the scandir-based walker of pogo.tools and with the previous listDir()
+walker, which called os.path.isdir() and os.path.isfile() for each entry.
+
+Calls to os.stat(), os.lstat(), os.access(), os.listdir() and os.scandir()
+are counted, including the ones made by os.path. On file systems that
+don't report file types in directory listings (d_type), os.DirEntry needs
+an extra stat call per entry. These calls are not counted, and neither
+are the inotify calls of the directory cache.
+
+Usage: benchmarks/walk.py [DEPTH] [SUBDIRS] [FILES]
+"""
+
+import collections
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pogo import media, tools
+from pogo.tools import dirCache
+
+COUNTED = ['stat', 'lstat', 'access', 'listdir', 'scandir']
+
+calls = collections.Counter()
+
+
+def count(name):
+    function = getattr(os, name)
+
+    def counted(*args, **kwargs):
+        calls[name] += 1
+        return function(*args, **kwargs)
+    setattr(os, name, counted)
+
+
+def createTree(directory, depth, subdirs, files):
+    """ Create depth levels of subdirs directories, each with files files """
+    for index in range(files):
+        open(os.path.join(directory, '%02d track.mp3' % index), 'w').close()
+    open(os.path.join(directory, 'cover.jpg'), 'w').close()
+    if depth > 0:
+        for index in range(subdirs):
+            subdir = os.path.join(directory, 'dir %02d' % index)
+            os.mkdir(subdir)
+            createTree(subdir, depth - 1, subdirs, files)
+
+
+oldDirCache = {}
+
+
+def oldListDir(directory):
+    if directory in oldDirCache:
+        cachedMTime, list = oldDirCache[directory]
+    else:
+        cachedMTime, list = None, None
+
+    if os.path.exists(directory):
+        mTime = os.stat(directory).st_mtime
+    else:
+        mTime = 0
+
+    if mTime != cachedMTime:
+        if os.access(directory, os.R_OK | os.X_OK):
+            list = sorted(os.listdir(directory), key=lambda file: file.lower())
+        else:
+            list = []
+        oldDirCache[directory] = (mTime, list)
+
+    return [(filename, os.path.join(directory, filename)) for filename in list if not filename.startswith('.')]
+
+
+def oldWalkPaths(path):
+    """ The previous media.walkPaths() """
+    files = []
+    dirs = []
+    for (subname, subpath) in oldListDir(path):
+        if os.path.isdir(subpath):
+            dirs.append(subpath)
+        elif media.isSupported(subpath):
+            files.append(subpath)
+    if files:
+        yield files
+    for subpath in sorted(dirs):
+        yield from oldWalkPaths(subpath)
+
+
+def oldExplore(directory):
+    """ The previous FileExplorer.getDirContents() and updateDirNodes() for all directories """
+    directories = []
+    for (file, path) in oldListDir(directory):
+        if os.path.isdir(path):
+            directories.append(path)
+        elif os.path.isfile(path):
+            media.isSupported(file)
+    for path in directories:
+        if os.access(path, os.R_OK | os.X_OK):
+            for (file, subpath) in oldListDir(path):
+                if os.path.isdir(subpath) or (os.path.isfile(subpath) and media.isSupported(file)):
+                    break
+        oldExplore(path)
+
+
+def newWalkPaths(path):
+    for (name, files) in media.walkPaths(path, ''):
+        yield files
+
+
+def newExplore(directory):
+    """ FileExplorer.getDirContents() and updateDirNodes() for all directories """
+    directories = []
+    for entry in tools.scanDir(directory):
+        if entry.is_dir():
+            directories.append(entry.path)
+        elif entry.is_file():
+            media.isSupported(entry.name)
+    for path in directories:
+        for entry in tools.scanDir(path):
+            if entry.is_dir() or (entry.is_file() and media.isSupported(entry.name)):
+                break
+        newExplore(path)
+
+
+def measure(function, cold):
+    """ Run function, with empty directory caches if cold is True, return the number of calls and the duration """
+    if cold:
+        oldDirCache.clear()
+        dirCache.getCache().clear()
+    calls.clear()
+    start = time.perf_counter()
+    function()
+    return (sum(calls.values()), time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    subdirs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    files = int(sys.argv[3]) if len(sys.argv) > 3 else 12
+
+    with tempfile.TemporaryDirectory() as root:
+        createTree(root, depth, subdirs, files)
+        for name in COUNTED:
+            count(name)
+
+        nbDirs = sum(subdirs ** level for level in range(depth + 1))
+        print('Tree with %d directories and %d files' % (nbDirs, nbDirs * (files + 1)))
+        for (task, old, new) in [
+                ('Scanning', lambda: sum(1 for files in oldWalkPaths(root)), lambda: sum(1 for files in newWalkPaths(root))),
+                ('Exploring', lambda: oldExplore(root), lambda: newExplore(root))]:
+            print()
+            print(task)
+            for (name, function) in [('listDir', old), ('scandir', new)]:
+                for (state, cold) in [('cold', True), ('warm', False)]:
+                    (nbCalls, duration) = measure(function, cold)
+                    print(' * with %-8s (%s cache): %6d system calls, %.3fs' % (name, state, nbCalls, duration))
+
+        print()
+        print('Directory cache: %s' % dirCache.getCache().getStats())
@@ -17,7 +17,7 @@ modules.ThreadedModule.gtkExecute
 modules.ThreadedModule.threadExecute
 
 from pogo.modules import Covers, CtrlPanel, DBus, DesktopNotification, Equalizer, \
-    FileExplorer, GnomeMediaKeys, GSTPlayer, Search, StatusbarTitlebar, \
+    FileExplorer, GnomeMediaKeys, GSTPlayer, Library, Prefetcher, Search, StatusbarTitlebar, \
     TrackLoader, TrackPanel, Tracktree
 
 Covers.Covers
@@ -28,6 +28,8 @@ Equalizer.Equalizer
 FileExplorer.FileExplorer
 GnomeMediaKeys.GnomeMediaKeys
 GSTPlayer.GSTPlayer
+Library.Library
+Prefetcher.Prefetcher
 Search.Search
 StatusbarTitlebar.StatusbarTitlebar
 TrackLoader.TrackLoader
@@ -64,7 +66,11 @@ dbop.GetCaps
 dbop.PositionSet
 dbop.PositionGet
 
-from pogo.media.track import Track
+from pogo.media.track import Track, TAG_RES
 
 Track.getAlbumArtist
 Track.getMBTrackId
+# Tag slots are accessed by name through TAG_SLOTS
+Track.mbTrackId
+Track.encMode
+TAG_RES
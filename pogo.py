@@ -27,5 +27,7 @@ app_dir = get_app_dir()
 print('Using pogo version at {}'.format(app_dir))
 sys.path.insert(0, os.path.dirname(app_dir))
 
-from pogo import __main__
-__main__.main()
+# Worker processes re-import this script, so only start the GUI when run directly
+if __name__ == '__main__':
+    from pogo import __main__
+    __main__.main()
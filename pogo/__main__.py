@@ -137,6 +137,8 @@ def realStartup(window, paned):
     import dbus.mainloop.glib
 
     from pogo import modules
+    from pogo.media import tagcache
+    from pogo.tools import dirCache
 
     modules.load_enabled_modules()
 
@@ -171,6 +173,8 @@ def realStartup(window, paned):
         Final function, called just before exiting the Python interpreter
         """
         prefs.save()
+        tagcache.close()
+        dirCache.logStats()
         log.logger.info('Stopped')
 
     # D-Bus
@@ -74,17 +74,27 @@ class TrackTreeView(ExtTreeView):
         self.mark = None
         self.dir_selected = True
 
-    def insert(self, target, source_row, drop_mode=None):
-        model = self.store
+    def get_insert_position(self, target, drop_mode=None):
+        """
+        Return the tuple (parent, position) where a row dropped on target
+        is inserted, position is -1 for the end of the children of parent
+        """
         if drop_mode == Gtk.TreeViewDropPosition.INTO_OR_BEFORE:
-            new = model.prepend(target, source_row)
-        elif drop_mode == Gtk.TreeViewDropPosition.INTO_OR_AFTER or drop_mode is None:
-            new = model.append(target, source_row)
-        elif drop_mode == Gtk.TreeViewDropPosition.BEFORE:
-            new = model.insert_before(None, target, source_row)
-        elif drop_mode == Gtk.TreeViewDropPosition.AFTER:
-            new = model.insert_after(None, target, source_row)
-        return new
+            return (target, 0)
+        if drop_mode == Gtk.TreeViewDropPosition.INTO_OR_AFTER or drop_mode is None:
+            return (target, -1)
+        if target is None:
+            return (None, -1 if drop_mode == Gtk.TreeViewDropPosition.BEFORE else 0)
+        index = self.store.get_path(target).get_indices()[-1]
+        if drop_mode == Gtk.TreeViewDropPosition.AFTER:
+            index += 1
+        return (self.store.iter_parent(target), index)
+
+    def insert(self, target, source_row, drop_mode=None):
+        # Unlike insert_before() and insert_after(), insert() sets the values
+        # of the new row before the row-inserted signal is emitted
+        (parent, position) = self.get_insert_position(target, drop_mode)
+        return self.store.insert(parent, position, source_row)
 
     def appendRow(self, row, parent_iter=None):
         """ Append a row to the tree """
@@ -136,12 +146,6 @@ class TrackTreeView(ExtTreeView):
     def scroll(self, iter):
         self.scroll_to_cell(self.store.get_path(iter))
 
-    def scroll_to_first_selection(self):
-        iter = self.getFirstSelectedRow()
-        if not iter:
-            return
-        self.scroll(iter)
-
     def expand(self, iter):
         self.expand_to_path(self.store.get_path(iter))
 
@@ -17,11 +17,18 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
+import collections
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import multiprocessing
 import os
 import sys
+import threading
+import time
 import traceback
 import logging
-from collections import defaultdict
 from os.path import splitext
 
 if __name__ == '__main__':
@@ -29,9 +36,12 @@ if __name__ == '__main__':
     sys.path.insert(0, base_dir)
 
 from pogo.media.format import monkeysaudio, asf, flac, mp3, mp4, mpc, ogg, wav, wavpack
+from pogo.media.format import fastReader
+from pogo.media import tagcache
 from pogo.tools.log import logger
 from pogo.media.track.fileTrack import FileTrack
 from pogo import tools
+from pogo.tools import dirCache
 
 
 # Supported formats with associated modules
@@ -48,81 +58,359 @@ def isSupported(file):
         return False
 
 
-# It seems a lock is not really necessary here. It does slow down execution
-# a little bit though, so we currently don't use a lock.
+# Number of workers used for parsing files in parallel (None: one per CPU)
+SCAN_WORKERS = None
+
+# Parse files in worker processes (True) or worker threads (False)
+SCAN_PROCESSES = True
+
+# Files that are in none of the caches are only parsed in parallel if there
+# are at least this many of them
+MIN_PARALLEL_FILES = 16
+
+# Maximum number of files that are parsed ahead of the track which is
+# handed out next
+SCAN_WINDOW = 256
+
+# Read MP3, FLAC and Ogg Vorbis files with the fast header-only reader
+# during scans (other files and files it rejects are read by mutagen)
+SCAN_FAST = False
+
+# Maximum number of tracks in the chunks yielded by iterTracks()
+CHUNK_SIZE = 200
+
+# Budget of a PreloadJob: maximum number of files and seconds
+PRELOAD_MAX_FILES = 2000
+PRELOAD_MAX_SECONDS = 30
+
+# The pools of workers used by getTracksFromFiles(), one per configuration
+_executors = {}
+
+
+# The Track objects of all files that have been read. Lookups don't need a
+# lock: _track_lock only protects _in_flight, which maps the files that are
+# being read to a Future of their Track object. Concurrent callers wait for
+# this Future instead of reading the same file again.
 _track_cache = {}
+_track_lock = threading.Lock()
+_in_flight = {}
 
 
-def _getTrackFromFile(file):
+def _dropTracks(directory, name):
+    """ Remove the tracks of changed files from the cache """
+    if directory is None:
+        _track_cache.clear()
+    elif name is not None:
+        _track_cache.pop(os.path.join(directory, name), None)
+    else:
+        for file in [file for file in list(_track_cache) if os.path.dirname(file) == directory]:
+            _track_cache.pop(file, None)
+
+
+dirCache.addListener(_dropTracks)
+
+
+def _claimTrack(file):
     """
-        Return a Track object, based on the tags of the given file
-        The 'file' parameter must be a real file (not a playlist or a directory)
+    Return a tuple (track, flight, owner) for file. track is the cached
+    Track object or None. Otherwise, flight is the Future of the Track
+    object. If owner is True, the caller has to read the file and pass
+    the result to _publishTrack() or _abandonTrack().
+    """
+    track = _track_cache.get(file)
+    if track is not None:
+        return (track, None, False)
+
+    with _track_lock:
+        track = _track_cache.get(file)
+        if track is not None:
+            return (track, None, False)
+        flight = _in_flight.get(file)
+        if flight is not None:
+            return (None, flight, False)
+        flight = _in_flight[file] = concurrent.futures.Future()
+        return (None, flight, True)
+
+
+def _publishTrack(file, flight, track):
+    """ Cache the track read for file and hand it to the waiting callers """
+    _track_cache[file] = track
+    with _track_lock:
+        del _in_flight[file]
+    flight.set_result(track)
+    return track
+
+
+def _abandonTrack(file, flight, error):
+    """
+    Reading file has failed with the given error, hand it to the waiting
+    callers. If error is None, the file has not been read at all.
+    """
+    with _track_lock:
+        del _in_flight[file]
+    if error is None:
+        flight.cancel()
+    else:
+        flight.set_exception(error)
+
+
+def _waitForTrack(file, flight):
+    """ Return the Track object of file once another thread has read it """
+    try:
+        return flight.result()
+    except concurrent.futures.CancelledError:
+        # The other thread has given up, read the file ourselves
+        return getTrackFromFile(file)
+
+
+def _parseFile(file, fast=False):
+    """
+        Return a Track object, based on the tags of the given file, or None
+        if the tags could not be read
     """
     try:
+        # The fast reader only handles parsing errors, e.g. a missing file is reported here
+        if fast and fastReader.isSupported(file):
+            track = fastReader.getTrack(file)
+            if track is not None:
+                return track
         return mFormats[splitext(file.lower())[1]].getTrack(file)
     except:
         logger.error('Unable to extract information from %s\n\n%s' % (file, traceback.format_exc()))
+        return None
+
+
+def _getTrackFromFile(file):
+    """
+        Return a Track object, based on the tags of the given file
+        The 'file' parameter must be a real file (not a playlist or a directory)
+
+        Tags are taken from the persistent tag cache if the file has not
+        changed since it was last parsed.
+    """
+    try:
+        stat = os.stat(file)
+    except OSError:
+        stat = None
+
+    if stat is not None:
+        tags = tagcache.getCache().get(file, stat)
+        if tags is not None:
+            track = FileTrack(file)
+            track.setTags(tags)
+            return track
+
+    track = _parseFile(file)
+    if track is None:
         return FileTrack(file)
 
+    if stat is not None:
+        tagcache.getCache().put(file, stat, track.tags)
+    return track
+
 
 def getTrackFromFile(file):
     """
         Return a Track object, based on the tags of the given file
         The 'file' parameter must be a real file (not a playlist or a directory)
     """
-    if file in _track_cache:
-        return _track_cache[file]
-    track = _getTrackFromFile(file)
-    _track_cache[file] = track
-    return track
+    (track, flight, owner) = _claimTrack(file)
+    if track is not None:
+        return track
+    if not owner:
+        return _waitForTrack(file, flight)
+
+    try:
+        track = _getTrackFromFile(file)
+    except BaseException as error:
+        _abandonTrack(file, flight, error)
+        raise
+    return _publishTrack(file, flight, track)
+
+
+def getLazyTrack(file):
+    """
+        Return the cached Track object for file, or a lazy one that reads
+        the tags of the file when they are needed
+    """
+    track = _track_cache.get(file)
+    if track is not None:
+        return track
+    return FileTrack(file, lazy=True)
 
 
 class TrackDir(object):
+    """
+    A directory of tracks and subdirectories. The number of tracks, their
+    playtime and the flattened list of all tracks are cached. Adding
+    tracks and subdirectories with add_track() and add_subdir() updates
+    the counts of all parent directories and invalidates their lists.
+    Removing them invalidates the directory and its parents only, the
+    other subdirectories keep their counts.
+    """
+
     def __init__(self, name='', dir=None, flat=False):
         self.dirname = name or (tools.dirname(dir) if dir else '') or 'noname'
 
         # If flat is True, add files without directories
         self.flat = flat
 
-        self.tracks = []
-        self.subdirs = []
+        # If continued is True, the tracks belong to the directory of the
+        # previous chunk yielded by iterTracks()
+        self.continued = False
+
+        self.parent = None
+        self._tracks = []
+        self._subdirs = []
+
+        # Aggregates over all tracks, None if they have to be recomputed.
+        # The lengths of unloaded tracks are added once they are loaded.
+        self._count = 0
+        self._playtime = 0
+        self._unloaded = []
+        self._allTracks = []
+
+    @property
+    def tracks(self):
+        """ The tracks of this directory, use add_track() to add tracks """
+        return self._tracks
+
+    @tracks.setter
+    def tracks(self, tracks):
+        self._tracks = list(tracks)
+        self._invalidate()
+
+    @property
+    def subdirs(self):
+        """ The subdirectories, use add_subdir() to add subdirectories """
+        return self._subdirs
+
+    def _invalidate(self):
+        """ Recompute the aggregates of this directory and its parents when they are needed """
+        node = self
+        while node is not None:
+            node._count = node._playtime = node._unloaded = node._allTracks = None
+            node = node.parent
+
+    def _update(self):
+        """ Recompute the aggregates if needed """
+        if self._count is not None:
+            return
+        self._count = len(self._tracks)
+        self._playtime = 0
+        self._unloaded = []
+        for track in self._tracks:
+            if track.isLoaded():
+                self._playtime += track.getLength()
+            else:
+                self._unloaded.append(track)
+        for subdir in self._subdirs:
+            subdir._update()
+            self._count += subdir._count
+            self._playtime += subdir._playtime
+            self._unloaded.extend(subdir._unloaded)
+
+    def add_track(self, track, index=None):
+        """ Append track to this directory, or insert it before the given index """
+        if index is None:
+            self._tracks.append(track)
+        else:
+            self._tracks.insert(index, track)
+        loaded = track.isLoaded()
+        length = track.getLength() if loaded else 0
+
+        node = self
+        while node is not None:
+            if node._count is not None:
+                node._count += 1
+                if loaded:
+                    node._playtime += length
+                else:
+                    node._unloaded.append(track)
+            node._allTracks = None
+            node = node.parent
+
+    def add_subdir(self, subdir, index=None):
+        """ Append subdir to the subdirectories, or insert it before the given index """
+        subdir.parent = self
+        if index is None:
+            self._subdirs.append(subdir)
+        else:
+            self._subdirs.insert(index, subdir)
+        subdir._update()
+
+        node = self
+        while node is not None:
+            if node._count is not None:
+                node._count += subdir._count
+                node._playtime += subdir._playtime
+                node._unloaded.extend(subdir._unloaded)
+            node._allTracks = None
+            node = node.parent
+
+    def remove_track(self, index):
+        """ Remove the track at the given index """
+        del self._tracks[index]
+        self._invalidate()
+
+    def remove_subdir(self, index):
+        """ Remove the subdirectory at the given index """
+        self._subdirs.pop(index).parent = None
+        self._invalidate()
 
     def empty(self):
-        return not self.tracks and not self.subdirs
+        return not self._tracks and not self._subdirs
+
+    def extend(self, trackdir):
+        """ Add the contents of trackdir, merge continued subdirectories """
+        for track in trackdir.tracks:
+            self.add_track(track)
+        for subdir in trackdir.subdirs:
+            if subdir.continued and self._subdirs:
+                for track in subdir.tracks:
+                    self._subdirs[-1].add_track(track)
+            else:
+                self.add_subdir(subdir)
 
     def get_all_tracks(self):
-        tracks = []
-        for track in self.tracks:
-            tracks.append(track)
-        for subdir in self.subdirs:
-            tracks.extend(subdir.get_all_tracks())
-        return tracks
+        """ Return the list of all tracks (including the subdirectories), it must not be modified """
+        if self._allTracks is None:
+            tracks = list(self._tracks)
+            for subdir in self._subdirs:
+                tracks.extend(subdir.get_all_tracks())
+            self._allTracks = tracks
+        return self._allTracks
 
     def get_playtime(self):
-        time = 0
-        for track in self.get_all_tracks():
-            time += track.getLength()
-        return time
-
-    def export_to_dir(self, outdir):
-        import shutil
+        """ Return the length of all tracks whose tags have been read """
+        self._update()
+        if self._unloaded:
+            unloaded = []
+            for track in self._unloaded:
+                if track.isLoaded():
+                    self._playtime += track.getLength()
+                else:
+                    unloaded.append(track)
+            self._unloaded = unloaded
+        return self._playtime
+
+    def get_export_files(self, outdir):
+        """ Return the (source, destination) pairs for exporting the tracks to outdir """
         sub_outdir = outdir if self.flat else os.path.join(outdir, self.dirname)
+        files = []
         for track in self.tracks:
             src = track.getFilePath()
-            if not os.path.exists(src):
-                logging.info('Skipping non-existent file %s.' % src)
-                continue
-            dest = os.path.join(sub_outdir, os.path.basename(src))
-            logging.info('Copying %s to %s' % (src, dest))
-            tools.makedirs(sub_outdir)
-            shutil.copy2(src, dest)
+            files.append((src, os.path.join(sub_outdir, os.path.basename(src))))
         for subdir in self.subdirs:
-            subdir.export_to_dir(sub_outdir)
-        if self.flat:
-            logging.info('Export finished')
+            files.extend(subdir.get_export_files(sub_outdir))
+        return files
 
     def __len__(self):
-        return len(self.get_all_tracks())
+        self._update()
+        return self._count
+
+    def __getitem__(self, index):
+        return self.get_all_tracks()[index]
 
     def __str__(self, indent=0):
         res = ''
@@ -135,50 +423,289 @@ class TrackDir(object):
         return res
 
 
+class PreloadJob:
+    """
+    Read the tracks of the given paths in a background thread, so that
+    they are cached when they are loaded. A priority queue hands out the
+    files in the order in which iterTracks() loads them and directories
+    are only listed once their first file is due. The job stops after
+    maxFiles files or maxSeconds seconds, or when it is cancelled.
+    """
+
+    def __init__(self, paths, maxFiles=PRELOAD_MAX_FILES, maxSeconds=PRELOAD_MAX_SECONDS):
+        """ Constructor """
+        self.maxFiles = maxFiles
+        self.maxSeconds = maxSeconds
+        self.cancelled = threading.Event()
+
+        # Items are (priority, path, isDir). The priorities are tuples
+        # that sort like the load order: iterTracks() loads directories
+        # before single files and walkPaths() yields the files of a
+        # directory before its subdirectories.
+        self.queue = []
+        for (index, path) in enumerate(sorted(paths)):
+            if os.path.isdir(path):
+                self.queue.append(((0, index), path, True))
+            elif isSupported(path):
+                self.queue.append(((1, index), path, False))
+        heapq.heapify(self.queue)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name='preload')
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        """ Stop the job as soon as possible """
+        self.cancelled.set()
+
+    def run(self):
+        deadline = time.monotonic() + self.maxSeconds
+        nbFiles = 0
+
+        while self.queue and not self.cancelled.is_set():
+            if nbFiles >= self.maxFiles or time.monotonic() >= deadline:
+                logging.info('Preloading stopped after %d files' % nbFiles)
+                return
+
+            (priority, path, isDir) = heapq.heappop(self.queue)
+            if not isDir:
+                getTrackFromFile(path)
+                nbFiles += 1
+                continue
+
+            entries = tools.scanDir(path)
+            files = [entry.path for entry in entries if not entry.is_dir() and isSupported(entry.path)]
+            dirs = sorted((entry.name, entry.path) for entry in entries if entry.is_dir())
+            for (index, file) in enumerate(files):
+                heapq.heappush(self.queue, (priority + (0, index), file, False))
+            for (index, (name, subpath)) in enumerate(dirs):
+                heapq.heappush(self.queue, (priority + (1, index), subpath, True))
+
+
 def preloadTracks(paths):
-    '''
-    Function for preloading tracks. It is invoked when a dnd action starts
-    and preloads the selected tracks in reverse order, so that the tracks are
-    loaded, when the real loading function comes to them.
-    '''
-    for path in reversed(paths):
-        if os.path.isdir(path):
-            subpaths = [path for (name, path) in tools.listDir(path)]
-            preloadTracks(subpaths)
-        elif isSupported(path):
-            getTrackFromFile(path)
-
-
-def scanPaths(dir_info, name='', tracks=None):
-    if tracks is None:
-        tracks = defaultdict(list)
-
-    for (subname, subpath) in dir_info:
-        if os.path.isdir(subpath):
-            subname = name + ' / ' + subname if name else subname
-            tracks.update(scanPaths(tools.listDir(subpath), subname, tracks))
-        elif isSupported(subpath):
-            track = getTrackFromFile(subpath)
-            tracks[name].append(track)
-    return tracks
+    """
+    Start to read the tracks of the given paths in the background. This is
+    invoked when a drag'n'drop action starts. Return the PreloadJob.
+    """
+    job = PreloadJob(paths)
+    job.start()
+    return job
 
 
-def getTracks(filenames):
-    """ Same as getTracksFromFiles(), but works for any kind of filenames (files, playlists, directories) """
-    assert isinstance(filenames, list), 'filenames has to be a list'
+def walkPaths(path, name):
+    """
+    Yield tuples (name, files) for the directory path and all its
+    subdirectories, where files are the supported files located directly
+    in the directory. The names of subdirectories are appended to name.
+    """
+    files = []
+    dirs = []
+    for entry in tools.scanDir(path):
+        if entry.is_dir():
+            dirs.append((entry.name, entry.path))
+        elif isSupported(entry.path):
+            files.append(entry.path)
+
+    if files:
+        yield (name, files)
+    for (subname, subpath) in sorted(dirs):
+        yield from walkPaths(subpath, name + ' / ' + subname)
+
+
+def _parseTags(file, fast=False):
+    """ Return the tags of the given file, or None. Executed by the workers of the scan pool """
+    track = _parseFile(file, fast)
+    if track is None:
+        return None
+    return track.tags
+
+
+def _getExecutor(workers, processes):
+    """ Return a (shared) pool of workers for parsing files """
+    key = (workers, processes)
+    if key not in _executors:
+        if processes:
+            # Never fork the multi-threaded GTK process itself. The workers
+            # only need this module, not the application's main script.
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload([__name__])
+            _executors[key] = concurrent.futures.ProcessPoolExecutor(workers, mp_context=context)
+        else:
+            _executors[key] = concurrent.futures.ThreadPoolExecutor(workers)
+    return _executors[key]
+
+
+def _createTrack(file, stat, tags):
+    """ Create the Track object for file from the parsed tags, store them in the tag cache """
+    # Set the tags directly instead of calling all setters again
+    track = FileTrack(file)
+    if tags is not None:
+        track.setTags(tags)
+        tagcache.getCache().put(file, stat, tags)
+    return track
 
-    tracks = TrackDir(flat=True)
 
-    for path in sorted(filenames):
-        if os.path.isdir(path):
-            dirname = tools.dirname(path)
-            track_dict = scanPaths(tools.listDir(path), name=dirname)
-            for name, track_list in sorted(track_dict.items()):
+def _readTrack(file, stat, tags, fast):
+    """ Return the Track object for file, parse the file if the cached tags are None """
+    if stat is None:
+        return _getTrackFromFile(file)
+    if tags is not None:
+        track = FileTrack(file)
+        track.setTags(tags)
+        return track
+    return _createTrack(file, stat, _parseTags(file, fast))
+
+
+def _onParsed(file, stat, flight, parse):
+    """ A worker has parsed file, hand its Track object to the waiting callers """
+    if parse.cancelled():
+        _abandonTrack(file, flight, None)
+        return
+
+    try:
+        track = _createTrack(file, stat, parse.result())
+    except BaseException as error:
+        _abandonTrack(file, flight, error)
+    else:
+        _publishTrack(file, flight, track)
+
+
+def getTracksFromFiles(files, workers=SCAN_WORKERS, processes=SCAN_PROCESSES, fast=SCAN_FAST):
+    """
+    Iterate over the Track objects for the given files (in the same order).
+    The files may be given lazily.
+
+    Files that are in none of the caches are parsed in parallel by a pool of
+    worker processes (or threads if processes is False), up to SCAN_WINDOW
+    files ahead of the track that is handed out next. Use workers=1 to parse
+    everything in the calling thread. If fast is True, the fast reader
+    is tried first. Files that another thread is reading are not parsed
+    again, their Track objects are shared.
+    """
+    executor = None
+    nbMisses = 0
+    pending = collections.deque()
+
+    try:
+        for file in files:
+            stat = None
+            parse = None
+            (track, flight, owner) = _claimTrack(file)
+            if owner:
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    pass
+
+                tags = None if stat is None else tagcache.getCache().get(file, stat)
+                if stat is not None and tags is None:
+                    nbMisses += 1
+
+                # Starting the workers does not pay off for a few files
+                if stat is None or tags is not None or workers == 1 or nbMisses <= MIN_PARALLEL_FILES:
+                    try:
+                        track = _readTrack(file, stat, tags, fast)
+                    except BaseException as error:
+                        _abandonTrack(file, flight, error)
+                        raise
+                    _publishTrack(file, flight, track)
+                else:
+                    executor = executor or _getExecutor(workers, processes)
+                    parse = executor.submit(_parseTags, file, fast)
+                    parse.add_done_callback(functools.partial(_onParsed, file, stat, flight))
+
+            pending.append((file, track, flight, parse))
+
+            # Hand out finished tracks while the workers keep parsing
+            while pending and (len(pending) > SCAN_WINDOW or pending[0][1] is not None or pending[0][2].done()):
+                (file, track, flight, parse) = pending.popleft()
+                yield track or _waitForTrack(file, flight)
+
+        while pending:
+            (file, track, flight, parse) = pending.popleft()
+            yield track or _waitForTrack(file, flight)
+    finally:
+        # The caller may stop iterating early, the files that are not
+        # being parsed yet are released
+        for (file, track, flight, parse) in pending:
+            if parse is not None:
+                parse.cancel()
+
+
+def parseFiles(files, workers=SCAN_WORKERS, processes=SCAN_PROCESSES, fast=SCAN_FAST):
+    """
+    Return the list of the tags of the given files (None if they could not
+    be read), parsed by the pool of workers. Unlike getTracksFromFiles(),
+    this neither uses nor fills the track and tag caches.
+    """
+    if workers == 1 or len(files) <= MIN_PARALLEL_FILES:
+        return [_parseTags(file, fast) for file in files]
+    return list(_getExecutor(workers, processes).map(_parseTags, files, itertools.repeat(fast)))
+
+
+def iterTracks(filenames, workers=SCAN_WORKERS, processes=SCAN_PROCESSES, chunkSize=CHUNK_SIZE, fast=SCAN_FAST,
+               lazy=False):
+    """
+    Generator version of getTracks(): yield flat TrackDirs with at most
+    chunkSize tracks each, as soon as their tags have been read.
+
+    Each chunk contains either the tracks of one directory or some of the
+    given single files, which come last. The tracks of a directory that do
+    not fit into one chunk are yielded in the following chunks, whose
+    subdirectory is then marked as continued.
+
+    If lazy is True, no tags are read: the chunks contain lazy tracks.
+    """
+    assert isinstance(filenames, list), 'filenames has to be a list'
+
+    paths = sorted(filenames)
+    dirs = [path for path in paths if os.path.isdir(path)]
+    isDir = set(dirs)
+    files = [path for path in paths if path not in isDir and isSupported(path)]
+
+    # The directories are walked lazily, so we have to remember which
+    # files belong together
+    groups = collections.deque()
+
+    def iterFiles():
+        for path in dirs:
+            for group in walkPaths(path, tools.dirname(path)):
+                groups.append(group)
+                yield from group[1]
+        if files:
+            groups.append((None, files))
+            yield from files
+
+    if lazy:
+        tracks = (getLazyTrack(file) for file in iterFiles())
+    else:
+        tracks = getTracksFromFiles(iterFiles(), workers, processes, fast)
+    for first in tracks:
+        name, groupFiles = groups.popleft()
+        groupTracks = itertools.chain([first], itertools.islice(tracks, len(groupFiles) - 1))
+        continued = False
+
+        while True:
+            chunkTracks = list(itertools.islice(groupTracks, chunkSize))
+            if not chunkTracks:
+                break
+
+            chunk = TrackDir(flat=True)
+            if name is None:
+                chunk.tracks = chunkTracks
+            else:
                 trackdir = TrackDir(name=name)
-                trackdir.tracks = track_list
-                tracks.subdirs.append(trackdir)
-        elif isSupported(path):
-            track = getTrackFromFile(path)
-            tracks.tracks.append(track)
+                trackdir.tracks = chunkTracks
+                trackdir.continued = continued
+                chunk.add_subdir(trackdir)
+            continued = True
+            yield chunk
+
 
+def getTracks(filenames, workers=SCAN_WORKERS, processes=SCAN_PROCESSES, fast=SCAN_FAST):
+    """ Same as getTracksFromFiles(), but works for any kind of filenames (files, playlists, directories) """
+    tracks = TrackDir(flat=True)
+    for chunk in iterTracks(filenames, workers, processes, fast=fast):
+        tracks.extend(chunk)
     return tracks
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+Export of playlists to directories.
+
+An ExportJob copies the files in parallel in the background. Destination
+files with the same size and modification time as their source are
+skipped, so exporting a playlist again only copies the changed tracks.
+The data is copied by the kernel with copy_file_range() or sendfile()
+where possible.
+
+With a Transcoder, files are converted to MP3 or Opus by GStreamer
+pipelines running in the worker threads. Files that already use the
+target codec are copied, unless their bitrate is higher than the target
+one. The codec is read from the headers of the files by the workers,
+since the extension doesn't tell it (e.g., Ogg files may contain Opus).
+"""
+
+import concurrent.futures
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+from gi.repository import Gst
+
+from pogo import tools
+
+
+# Number of files that are copied at the same time
+EXPORT_WORKERS = 4
+
+# Number of files that are transcoded at the same time
+TRANSCODE_WORKERS = os.cpu_count() or 1
+
+# Target bitrate of transcoded files in kbit/s
+TRANSCODE_BITRATE = 192
+
+# Seconds between two checks for cancellation while transcoding
+TRANSCODE_POLL_INTERVAL = 0.1
+
+# The tags sent downstream by decodebin are written by the tag setting
+# elements (id3v2mux and opusenc)
+TRANSCODE_PIPELINE = 'filesrc name=src ! decodebin ! audioconvert ! audioresample ! %s ! filesink name=sink'
+
+# Format -> (extension of the exported files, GStreamer encoder with the bitrate in kbit/s,
+#            name of the mutagen class of the files that already use the codec)
+TRANSCODE_FORMATS = {
+    'mp3': ('.mp3', 'lamemp3enc target=bitrate cbr=true bitrate={kbps} ! id3v2mux', 'MP3'),
+    'opus': ('.opus', 'opusenc bitrate={bps} ! oggmux', 'OggOpus'),
+}
+
+# Files that already use the target codec are copied unless their bitrate
+# exceeds the target one by more than this ratio (VBR files vary a bit)
+TRANSCODE_BITRATE_TOLERANCE = 0.1
+
+# Number of bytes copied between two checks for cancellation
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# FAT file systems (e.g., on USB sticks) store modification times with a
+# precision of two seconds
+MTIME_TOLERANCE = 2
+
+# Errors meaning that a zero-copy system call is not supported for the given files
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ETXTBSY, errno.EBADF)
+
+# The zero-copy system calls, they are disabled once they have failed
+__zeroCopy = {
+    'copy_file_range': hasattr(os, 'copy_file_range'),
+    'sendfile': hasattr(os, 'sendfile'),
+}
+
+
+def isUpToDate(src, dest, sameSize=True):
+    """ Return True if dest has the same modification time as src, and the same size if sameSize is True """
+    try:
+        srcStat = os.stat(src)
+        destStat = os.stat(dest)
+    except OSError:
+        return False
+    if sameSize and srcStat.st_size != destStat.st_size:
+        return False
+    return abs(srcStat.st_mtime - destStat.st_mtime) <= MTIME_TOLERANCE
+
+
+def _copyData(fsrc, fdst, size, isCancelled, onCopied):
+    """ Copy size bytes from fsrc to fdst, return False if the copy has been cancelled """
+    for (name, copy) in [
+            ('copy_file_range', lambda count: os.copy_file_range(fsrc.fileno(), fdst.fileno(), count)),
+            ('sendfile', lambda count: os.sendfile(fdst.fileno(), fsrc.fileno(), None, count)),
+            (None, lambda count: fdst.write(fsrc.read(count)))]:
+        if name is not None and not __zeroCopy[name]:
+            continue
+
+        copied = 0
+        try:
+            while copied < size:
+                if isCancelled():
+                    return False
+                count = copy(min(COPY_CHUNK_SIZE, size - copied))
+                if not count:
+                    if name is not None and not copied:
+                        # Some file systems don't support the system call, but report no error
+                        break
+                    # The file has been truncated meanwhile
+                    return True
+                copied += count
+                onCopied(count)
+            if copied == size:
+                return True
+        except OSError as error:
+            # Only fall back to the next method if nothing has been copied yet
+            if name is None or copied or error.errno not in UNSUPPORTED_ERRORS:
+                raise
+            logging.info('Cannot use %s for exporting: %s' % (name, error))
+            __zeroCopy[name] = False
+
+
+def writeFile(src, dest, write):
+    """
+    Create dest from src with write(tmp), which writes a temporary file
+    and returns False if it has been cancelled. Give dest the permissions
+    and the modification time of src, so that it is skipped by the next
+    export. Return the result of write(). dest is never left incomplete.
+    """
+    tools.makedirs(os.path.dirname(dest))
+    # A unique name, since a cancelled job may still be writing to the same directory
+    (fd, tmp) = tempfile.mkstemp('.part', '.' + os.path.basename(dest) + '.', os.path.dirname(dest))
+    os.close(fd)
+    try:
+        if not write(tmp):
+            return False
+        shutil.copystat(src, tmp)
+        os.replace(tmp, dest)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def copyFile(src, dest, isCancelled=lambda: False, onCopied=lambda count: None):
+    """ Copy src to dest, return False if the copy has been cancelled """
+    def write(tmp):
+        with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+            return _copyData(fsrc, fdst, os.fstat(fsrc.fileno()).st_size, isCancelled, onCopied)
+
+    return writeFile(src, dest, write)
+
+
+class Transcoder:
+    """ Convert audio files to one of the TRANSCODE_FORMATS with GStreamer """
+
+    def __init__(self, format, bitrate=TRANSCODE_BITRATE):
+        """ Constructor, bitrate is given in kbit/s """
+        (self.extension, encoder, self.fileType) = TRANSCODE_FORMATS[format]
+        self.bitrate = bitrate
+        self.pipeline = TRANSCODE_PIPELINE % encoder.format(kbps=bitrate, bps=bitrate * 1000)
+
+    def getMissingElements(self):
+        """ Return the names of the GStreamer elements of the pipeline that are not installed """
+        names = [part.split()[0] for part in self.pipeline.split('!')]
+        return [name for name in names if Gst.ElementFactory.find(name) is None]
+
+    def isNeeded(self, src):
+        """ Return False if src already uses the target codec with at most the target bitrate """
+        import mutagen
+
+        try:
+            audio = mutagen.File(src)
+        except Exception:
+            # GStreamer may still be able to decode it
+            return True
+        if audio is None or type(audio).__name__ != self.fileType:
+            return True
+        # The bitrate of Opus files is unknown, they are copied
+        bitrate = getattr(audio.info, 'bitrate', 0)
+        return bitrate > self.bitrate * 1000 * (1 + TRANSCODE_BITRATE_TOLERANCE)
+
+    def transcode(self, src, dest, isCancelled=lambda: False):
+        """ Convert src to dest, return False if the conversion has been cancelled """
+        def write(tmp):
+            pipeline = Gst.parse_launch(self.pipeline)
+            pipeline.get_by_name('src').set_property('location', src)
+            pipeline.get_by_name('sink').set_property('location', tmp)
+            bus = pipeline.get_bus()
+            pipeline.set_state(Gst.State.PLAYING)
+            try:
+                while not isCancelled():
+                    msg = bus.timed_pop_filtered(
+                        TRANSCODE_POLL_INTERVAL * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+                    if msg is None:
+                        continue
+                    if msg.type == Gst.MessageType.ERROR:
+                        (error, debug) = msg.parse_error()
+                        raise IOError('%s (%s)' % (error.message, debug))
+                    return True
+                return False
+            finally:
+                pipeline.set_state(Gst.State.NULL)
+
+        return writeFile(src, dest, write)
+
+
+class ExportJob:
+    """
+    Copy or transcode files to their destinations with a pool of worker threads.
+    onProgress(job) is called from the worker threads after each file and
+    once the job has finished (job.finished is then True).
+    """
+
+    def __init__(self, files, workers=EXPORT_WORKERS, onProgress=None, transcoder=None):
+        """
+        Constructor, files is a list of (source, destination) pairs. If a
+        Transcoder is given, the files are converted if needed and the
+        destinations of the converted files get its extension.
+        """
+        # When several files have the same destination, the last one wins. Whether a file is converted is only
+        # known once a worker has read it, so the extensions of the destinations are ignored when transcoding.
+        if transcoder is None:
+            self.files = list({dest: (dest, src) for (src, dest) in files}.values())
+        else:
+            self.files = list({os.path.splitext(dest)[0]: (dest, src) for (src, dest) in files}.values())
+        self.transcoder = transcoder
+        self.workers = workers
+        self.onProgress = onProgress
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.finished = False
+
+        self.startTime = None
+        self.duration = 0
+        self.done = 0
+        self.copied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+
+    def start(self):
+        """ Start to copy the files in the background """
+        self.thread = threading.Thread(target=self.run, name='export')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """ Stop the job as soon as possible, partially copied files are removed """
+        self.cancelled.set()
+
+    def getThroughput(self):
+        """ Return the number of bytes copied per second, the job must have been started """
+        duration = self.duration if self.finished else time.monotonic() - self.startTime
+        return self.bytes / duration if duration > 0 else 0
+
+    def onCopied(self, count):
+        with self.lock:
+            self.bytes += count
+
+    def export(self, dest, src):
+        """ Copy or transcode src to dest unless it is up to date, executed by the workers """
+        if self.cancelled.is_set():
+            return
+
+        try:
+            transcode = self.transcoder is not None and self.transcoder.isNeeded(src)
+            if transcode:
+                dest = os.path.splitext(dest)[0] + self.transcoder.extension
+            if not os.path.exists(src):
+                logging.info('Skipping non-existent file %s.' % src)
+                result = 'failed'
+            elif isUpToDate(src, dest, sameSize=not transcode):
+                result = 'skipped'
+            elif transcode:
+                if not self.transcoder.transcode(src, dest, self.cancelled.is_set):
+                    return
+                # The throughput is measured in source bytes
+                self.onCopied(os.path.getsize(src))
+                result = 'copied'
+            elif copyFile(src, dest, self.cancelled.is_set, self.onCopied):
+                result = 'copied'
+            else:
+                return
+        except Exception:
+            # Besides I/O errors, GStreamer raises GLib.Error, e.g. if the pipeline cannot be created. Errors
+            # must not escape, since nobody reads the results of the workers and the file would not be counted.
+            logging.error('Unable to copy %s to %s\n\n%s' % (src, dest, traceback.format_exc()))
+            result = 'failed'
+
+        with self.lock:
+            self.done += 1
+            setattr(self, result, getattr(self, result) + 1)
+        if self.onProgress is not None:
+            self.onProgress(self)
+
+    def run(self):
+        self.startTime = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            for (dest, src) in self.files:
+                executor.submit(self.export, dest, src)
+        self.duration = time.monotonic() - self.startTime
+        self.finished = True
+
+        logging.info('Export %s: %d files exported, %d up to date, %d failed, %.1f MB in %.1fs (%.1f MB/s)' % (
+            'cancelled' if self.cancelled.is_set() else 'finished', self.copied, self.skipped, self.failed,
+            self.bytes / 1e6, self.duration, self.getThroughput() / 1e6))
+        if self.onProgress is not None:
+            self.onProgress(self)
+
+
+def exportFiles(files, workers=EXPORT_WORKERS, onProgress=None, transcoder=None):
+    """ Start to export the given (source, destination) pairs in the background, return the ExportJob """
+    job = ExportJob(files, workers, onProgress, transcoder)
+    job.start()
+    return job
@@ -75,3 +75,28 @@ def createFileTrack(file, bitrate, length, samplerate, isVBR, title=None, album=
             pass
 
     return track
+
+
+def first(value):
+    """ Return the first entry of a multi-valued tag as a string """
+    return str(value[0])
+
+
+def getTags(items, mapping):
+    """
+    Return the keyword arguments for createFileTrack() that can be extracted
+    from the (key, value) pairs of the tags in items. mapping associates
+    keys with (argument, convert) pairs: convert(value) is passed as the
+    given argument to createFileTrack(). The first value of each argument
+    wins, the other ones are ignored. A value that cannot be converted
+    (e.g., an empty frame) is skipped, it doesn't discard the other tags.
+    """
+    args = {}
+    for (key, value) in items:
+        field = mapping.get(key)
+        if field is not None and field[0] not in args:
+            try:
+                args[field[0]] = field[1](value)
+            except Exception:
+                continue
+    return args
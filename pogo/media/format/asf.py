@@ -16,7 +16,21 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, getTags
+
+
+# ASF attributes and the corresponding arguments of createFileTrack()
+TAGS = {
+    'WM/TrackNumber': ('trackNumber', str),
+    'WM/PartOfSet': ('discNumber', str),
+    'WM/Year': ('date', str),
+    'Title': ('title', str),
+    'WM/AlbumTitle': ('album', str),
+    'Author': ('artist', str),
+    'WM/AlbumArtist': ('albumArtist', str),
+    'WM/Genre': ('genre', str),
+    'MusicBrainz/Track Id': ('musicbrainzId', str),
+}
 
 
 def getTrack(filename):
@@ -29,50 +43,7 @@ def getTrack(filename):
     bitrate = int(asfFile.info.bitrate)
     samplerate = int(asfFile.info.sample_rate)
 
-    try:
-        trackNumber = str(asfFile['WM/TrackNumber'][0])
-    except:
-        trackNumber = None
-
-    try:
-        discNumber = str(asfFile['WM/PartOfSet'][0])
-    except:
-        discNumber = None
-
-    try:
-        date = str(asfFile['WM/Year'][0])
-    except:
-        date = None
-
-    try:
-        title = str(asfFile['Title'][0])
-    except:
-        title = None
-
-    try:
-        album = str(asfFile['WM/AlbumTitle'][0])
-    except:
-        album = None
-
-    try:
-        artist = str(asfFile['Author'][0])
-    except:
-        artist = None
-
-    try:
-        albumArtist = str(asfFile['WM/AlbumArtist'][0])
-    except:
-        albumArtist = None
-
-    try:
-        genre = str(asfFile['WM/Genre'][0])
-    except:
-        genre = None
-
-    try:
-        musicbrainzId = str(asfFile['MusicBrainz/Track Id'][0])
-    except:
-        musicbrainzId = None
+    # The attributes are a list of (key, value) pairs
+    tags = getTags(asfFile.tags or (), TAGS)
 
-    return createFileTrack(filename, bitrate, length, samplerate, False, title, album, artist, albumArtist,
-                           musicbrainzId, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, bitrate, length, samplerate, False, **tags)
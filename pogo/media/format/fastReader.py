@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+Fast tag reader for bulk scans of MP3, FLAC and Ogg Vorbis files.
+
+Only the region at the start of the file that holds the tags and the
+stream information is mapped into memory (Ogg files are mapped entirely,
+but only the header pages and the end of the file are accessed). Embedded
+pictures are skipped without being read. Files with features that are not handled here (e.g.
+compressed ID3 frames) are rejected, so that the caller can fall back to
+the mutagen based readers in the other format modules.
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import re
+import struct
+
+from pogo.media.format import createFileTrack, getTags
+from pogo.media.format.ogg import TAGS as VORBIS_TAGS
+
+
+# Number of bytes after the ID3v2 tag in which the first MPEG frame is searched
+MPEG_SEARCH_SIZE = 64 * 1024
+
+# Number of bytes at the end of Ogg files in which the last page is searched
+OGG_TAIL_SIZE = 64 * 1024
+
+
+class UnsupportedError(Exception):
+    """ Raised for files that have to be read by mutagen """
+    pass
+
+
+class _TruncatedError(Exception):
+    """ Raised if the mapped region is too small for the headers """
+    pass
+
+
+def _map(file, size):
+    """ Map the first size bytes (at most) of the open file read-only """
+    return mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ)
+
+
+# --== MP3 ==--
+
+
+# ID3v2.3/2.4 frames and the corresponding arguments of createFileTrack()
+ID3_FRAMES = {
+    'TIT2': 'title',
+    'TALB': 'album',
+    'TPE1': 'artist',
+    'TPE2': 'albumArtist',
+    'TCON': 'genre',
+    'TRCK': 'trackNumber',
+    'TPOS': 'discNumber',
+    'TDRC': 'date',
+    'TYER': 'date',
+}
+
+# The same for ID3v2.2
+ID3V22_FRAMES = {
+    'TT2': 'title',
+    'TAL': 'album',
+    'TP1': 'artist',
+    'TP2': 'albumArtist',
+    'TCO': 'genre',
+    'TRK': 'trackNumber',
+    'TPA': 'discNumber',
+    'TYE': 'date',
+}
+
+ID3_ENCODINGS = ('latin1', 'utf-16', 'utf-16-be', 'utf-8')
+
+MUSICBRAINZ_OWNER = b'http://musicbrainz.org\x00'
+
+MPEG_VERSIONS = (2.5, None, 2, 1)
+
+MPEG_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+MPEG_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+YEAR = re.compile(r'[0-9]{4}')
+
+
+def _syncsafe(data):
+    """ Return the integer stored in the 7 lower bits of each byte """
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decodeText(data):
+    """ Return the text of an ID3 text frame """
+    if not data or data[0] >= len(ID3_ENCODINGS):
+        raise UnsupportedError('invalid text encoding')
+    text = data[1:].decode(ID3_ENCODINGS[data[0]])
+    # The last value may be terminated as well
+    if text.endswith('\x00'):
+        text = text[:-1]
+    return text
+
+
+def _readID3(region, size, version):
+    """ Return the arguments for createFileTrack() stored in the ID3v2 tag of the given size """
+    if version == 2:
+        (headerSize, frameNames) = (6, ID3V22_FRAMES)
+    else:
+        (headerSize, frameNames) = (10, ID3_FRAMES)
+
+    tags = {}
+    pos = 10
+    end = 10 + size
+    while pos + headerSize <= end:
+        if version == 2:
+            frameId = region[pos:pos + 3]
+            frameSize = int.from_bytes(region[pos + 3:pos + 6], 'big')
+            flags = 0
+        else:
+            frameId = region[pos:pos + 4]
+            if version == 4:
+                frameSize = _syncsafe(region[pos + 4:pos + 8])
+            else:
+                frameSize = int.from_bytes(region[pos + 4:pos + 8], 'big')
+            flags = int.from_bytes(region[pos + 8:pos + 10], 'big')
+
+        if frameId[0] == 0:
+            # Padding
+            break
+        if not frameId.isalnum() or not frameId.isupper() and not frameId.isdigit():
+            raise UnsupportedError('invalid frame id %r' % frameId)
+
+        start = pos + headerSize
+        pos = start + frameSize
+        if pos > end:
+            raise UnsupportedError('frame exceeds the tag')
+
+        frameId = frameId.decode('ascii')
+        if frameId not in frameNames and frameId not in ('UFID', 'UFI'):
+            # Skip pictures, lyrics and everything else without reading it
+            continue
+
+        if version == 4:
+            # Compression, encryption or unsynchronisation
+            if flags & 0x000e:
+                raise UnsupportedError('unsupported frame flags')
+            # Grouping identity and data length indicator
+            start += (1 if flags & 0x0040 else 0) + (4 if flags & 0x0001 else 0)
+        elif version == 3:
+            if flags & 0x00c0:
+                raise UnsupportedError('unsupported frame flags')
+            start += 1 if flags & 0x0020 else 0
+
+        data = region[start:pos]
+        if frameId in ('UFID', 'UFI'):
+            if data.startswith(MUSICBRAINZ_OWNER):
+                tags['musicbrainzId'] = data[len(MUSICBRAINZ_OWNER):]
+            continue
+
+        text = _decodeText(data)
+        name = frameNames[frameId]
+        if name == 'genre' and any(genre.isdigit() or genre.startswith('(') for genre in text.split('\x00')):
+            # Genres referenced by number are translated by mutagen
+            raise UnsupportedError('numerical genre')
+        if name == 'date':
+            if frameId != 'TDRC' and 'date' in tags:
+                continue
+            match = YEAR.match(text)
+            if match is None:
+                continue
+            text = match.group()
+        tags[name] = text
+
+    return tags
+
+
+def _readMPEGInfo(region, start, fileSize):
+    """ Return (bitrate, length, samplerate) from the first MPEG frame at or after start """
+    pos = region.find(b'\xff', start)
+    while pos != -1 and pos + 4 <= len(region):
+        header = int.from_bytes(region[pos:pos + 4], 'big')
+        version = (header >> 19) & 0x3
+        layer = (header >> 17) & 0x3
+        bitrateIndex = (header >> 12) & 0xf
+        rateIndex = (header >> 10) & 0x3
+        if (header >> 21) == 0x7ff and version != 1 and layer != 0 and rateIndex != 3 and bitrateIndex not in (0, 15):
+            break
+        pos = region.find(b'\xff', pos + 1)
+    else:
+        raise UnsupportedError('no MPEG frame found')
+
+    version = MPEG_VERSIONS[version]
+    layer = 4 - layer
+    padding = (header >> 9) & 0x1
+    mode = (header >> 6) & 0x3
+    bitrate = MPEG_BITRATES[(min(version, 2), layer)][bitrateIndex] * 1000
+    samplerate = MPEG_RATES[version][rateIndex]
+
+    if layer == 1:
+        (frameSize, slot) = (384, 4)
+    elif version >= 2 and layer == 3:
+        (frameSize, slot) = (576, 1)
+    else:
+        (frameSize, slot) = (1152, 1)
+    frameLength = ((frameSize // 8 * bitrate) // samplerate + padding) * slot
+
+    length = None
+    if layer == 3:
+        if version == 1:
+            xing = pos + (36 if mode != 3 else 21)
+        else:
+            xing = pos + (21 if mode != 3 else 13)
+        vbri = pos + 36
+
+        if xing + 8 > len(region) or vbri + 18 > len(region):
+            raise _TruncatedError()
+
+        if region[xing:xing + 4] in (b'Xing', b'Info'):
+            flags = int.from_bytes(region[xing + 4:xing + 8], 'big')
+            xing += 8
+            frames = nbBytes = None
+            if flags & 0x1:
+                frames = int.from_bytes(region[xing:xing + 4], 'big')
+                xing += 4
+            if flags & 0x2:
+                nbBytes = int.from_bytes(region[xing:xing + 4], 'big')
+                xing += 4
+            xing += (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+
+            if frames is not None:
+                samples = frameSize * frames
+                if nbBytes is not None and samples > 0:
+                    audioBytes = max(0, nbBytes - frameLength)
+                    bitrate = int(round(audioBytes * 8 * samplerate / samples))
+                # Encoder delay and padding of the LAME extended header
+                if region[xing:xing + 4] == b'LAME' and xing + 24 <= len(region) and region[xing + 9] >> 4 == 0:
+                    delays = int.from_bytes(region[xing + 21:xing + 24], 'big')
+                    samples -= (delays >> 12) + (delays & 0xfff)
+                length = max(0, samples) / samplerate
+        elif region[vbri:vbri + 4] == b'VBRI':
+            (nbBytes, frames) = struct.unpack('>II', region[vbri + 10:vbri + 18])
+            length = frameSize * frames / samplerate
+            if length:
+                bitrate = int(nbBytes * 8 / length)
+
+    if length is None:
+        # Without a VBR header, the next frame has to be valid as well
+        next = pos + frameLength
+        if next + 2 > len(region):
+            raise _TruncatedError()
+        if region[next] != 0xff or region[next + 1] & 0xe0 != 0xe0:
+            raise UnsupportedError('no second MPEG frame')
+        length = 8 * (fileSize - pos) / bitrate
+
+    return (bitrate, length, samplerate)
+
+
+def _readMP3(file, fileSize):
+    """ Return the Track for the MP3 file """
+    header = file.read(10)
+    tags = {}
+    start = 0
+    if header[:3] == b'ID3':
+        version = header[3]
+        if version not in (2, 3, 4):
+            raise UnsupportedError('unsupported ID3 version')
+        # Unsynchronisation, extended header or compression (ID3v2.2)
+        if header[5] & 0xc0:
+            raise UnsupportedError('unsupported ID3 flags')
+        start = 10 + _syncsafe(header[6:10]) + (10 if header[5] & 0x10 else 0)
+
+    with _map(file, min(fileSize, start + MPEG_SEARCH_SIZE)) as region:
+        if start:
+            tags = _readID3(region, start - 10, header[3])
+            if region[start:start + 3] == b'ID3':
+                raise UnsupportedError('multiple ID3 tags')
+        (bitrate, length, samplerate) = _readMPEGInfo(region, start, fileSize)
+
+    # An ID3v1 tag at the end of the file provides missing values
+    if fileSize >= 128:
+        file.seek(-128, os.SEEK_END)
+        v1Names = ('title', 'artist', 'album', 'date', 'genre', 'trackNumber')
+        if file.read(3) == b'TAG' and not all(name in tags for name in v1Names):
+            raise UnsupportedError('ID3v1 tag')
+
+    # Don't set VBR information for MP3 files (#1202195)
+    return createFileTrack(file.name, bitrate, int(round(length)), samplerate, False, **tags)
+
+
+# --== Vorbis comments ==--
+
+
+def _readUInt32(data, pos):
+    """ Return the little-endian 32 bit integer at data[pos:pos + 4] """
+    value = data[pos:pos + 4]
+    if len(value) != 4:
+        raise UnsupportedError('truncated comment')
+    return int.from_bytes(value, 'little')
+
+
+def _readComments(data, pos, end):
+    """
+    Return the (key, value) pairs of the Vorbis comment in data[pos:end], with lower case keys.
+    data may be any object that returns bytes for slices (e.g., a mapped region or an _OggPacket).
+    """
+    pos += 4 + _readUInt32(data, pos)
+    count = _readUInt32(data, pos)
+    pos += 4
+
+    comments = []
+    for i in range(count):
+        length = _readUInt32(data, pos)
+        start = pos + 4
+        pos = start + length
+        if pos > end:
+            raise UnsupportedError('comment exceeds the block')
+
+        # Only look at the beginning of the comment to find its key, so
+        # that pictures are never copied
+        key = bytes(data[start:min(pos, start + 32)]).partition(b'=')[0].lower()
+        try:
+            key = key.decode('ascii')
+        except UnicodeDecodeError:
+            continue
+        if key in VORBIS_TAGS:
+            value = bytes(data[start + len(key) + 1:pos]).decode('utf-8', 'replace')
+            comments.append((key, value))
+    return comments
+
+
+# --== FLAC ==--
+
+
+def _readFLAC(file, fileSize):
+    """ Return the Track for the FLAC file """
+    if file.read(4) != b'fLaC':
+        raise UnsupportedError('no FLAC header')
+
+    # Find the STREAMINFO and VORBIS_COMMENT blocks without reading the others
+    blocks = {}
+    pos = 4
+    while True:
+        header = file.read(4)
+        if len(header) != 4:
+            raise UnsupportedError('truncated metadata')
+        (blockType, length) = (header[0] & 0x7f, int.from_bytes(header[1:], 'big'))
+        if blockType in (0, 4) and blockType not in blocks:
+            blocks[blockType] = (pos + 4, length)
+        pos += 4 + length
+        if header[0] & 0x80 or len(blocks) == 2:
+            break
+        file.seek(pos)
+
+    if 0 not in blocks:
+        raise UnsupportedError('no STREAMINFO block')
+
+    end = max(start + length for (start, length) in blocks.values())
+    with _map(file, min(fileSize, end)) as region:
+        start = blocks[0][0]
+        info = int.from_bytes(region[start + 10:start + 18], 'big')
+        samplerate = info >> 44
+        totalSamples = info & 0xfffffffff
+
+        tags = {}
+        if 4 in blocks:
+            (start, length) = blocks[4]
+            tags = getTags(_readComments(region, start, start + length), VORBIS_TAGS)
+
+    length = totalSamples / samplerate if samplerate else 0
+    return createFileTrack(file.name, -1, int(round(length)), samplerate, False, **tags)
+
+
+# --== Ogg Vorbis ==--
+
+
+class _OggPacket:
+    """
+    A packet of an Ogg stream, which may span several pages. The packet
+    only stores the ranges of the mapped region that hold its segments,
+    slices are copied from them on demand.
+    """
+
+    def __init__(self, region):
+        """ Constructor """
+        self.region = region
+        # The positions of the ranges in the packet and their (start, end) in the region
+        self.offsets = []
+        self.ranges = []
+        self.size = 0
+
+    def addSegment(self, start, length):
+        """ Append the segment at region[start:start + length] """
+        if self.ranges and self.ranges[-1][1] == start:
+            # The segments of a page are contiguous
+            self.ranges[-1] = (self.ranges[-1][0], start + length)
+        else:
+            self.offsets.append(self.size)
+            self.ranges.append((start, start + length))
+        self.size += length
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        """ Return the bytes of the slice key of the packet """
+        (start, stop) = key.indices(self.size)[:2]
+        if stop <= start:
+            return b''
+        index = bisect.bisect_right(self.offsets, start) - 1
+        parts = []
+        while start < stop:
+            (rangeStart, rangeEnd) = self.ranges[index]
+            begin = rangeStart + start - self.offsets[index]
+            end = min(rangeEnd, begin + stop - start)
+            parts.append(self.region[begin:end])
+            start += end - begin
+            index += 1
+        return b''.join(parts)
+
+
+def _readOggPackets(region, count):
+    """ Return the first count packets (as _OggPackets) and the serial number of the Ogg stream """
+    packets = []
+    packet = _OggPacket(region)
+    pos = 0
+    serial = None
+    while len(packets) < count:
+        if pos + 27 > len(region):
+            raise UnsupportedError('truncated headers')
+        if region[pos:pos + 4] != b'OggS':
+            raise UnsupportedError('invalid Ogg page')
+        pageSerial = int.from_bytes(region[pos + 14:pos + 18], 'little')
+        if serial is None:
+            serial = pageSerial
+        elif pageSerial != serial:
+            raise UnsupportedError('multiplexed Ogg stream')
+
+        nbSegments = region[pos + 26]
+        segments = region[pos + 27:pos + 27 + nbSegments]
+        pos += 27 + nbSegments
+        if pos + sum(segments) > len(region):
+            raise UnsupportedError('truncated headers')
+
+        for lacing in segments:
+            packet.addSegment(pos, lacing)
+            pos += lacing
+            if lacing < 255:
+                packets.append(packet)
+                packet = _OggPacket(region)
+    return (packets[:count], serial)
+
+
+def _readOgg(file, fileSize):
+    """ Return the Track for the Ogg Vorbis file """
+    # Mapping the whole file does not read it: only the pages of the headers
+    # and the end of the file are accessed, embedded pictures are skipped
+    with _map(file, fileSize) as region:
+        ((identPacket, comments), serial) = _readOggPackets(region, 2)
+        ident = identPacket[:]
+        if not ident.startswith(b'\x01vorbis') or len(ident) < 28 or comments[:7] != b'\x03vorbis':
+            raise UnsupportedError('not an Ogg Vorbis stream')
+        tags = getTags(_readComments(comments, 7, len(comments)), VORBIS_TAGS)
+        tail = region[max(0, fileSize - OGG_TAIL_SIZE):]
+
+    (samplerate, maxBitrate, nominalBitrate, minBitrate) = struct.unpack('<I3i', ident[12:28])
+    if samplerate == 0:
+        raise UnsupportedError('invalid sample rate')
+    (maxBitrate, nominalBitrate, minBitrate) = (max(0, maxBitrate), max(0, nominalBitrate), max(0, minBitrate))
+    if nominalBitrate == 0:
+        bitrate = (maxBitrate + minBitrate) // 2
+    elif maxBitrate and maxBitrate < nominalBitrate:
+        bitrate = maxBitrate
+    elif minBitrate > nominalBitrate:
+        bitrate = minBitrate
+    else:
+        bitrate = nominalBitrate
+
+    # The length is the granule position of the last page of the stream
+    pos = tail.rfind(b'OggS')
+    while pos != -1 and int.from_bytes(tail[pos + 14:pos + 18], 'little') != serial:
+        pos = tail.rfind(b'OggS', 0, pos)
+    if pos == -1:
+        raise UnsupportedError('last page not found')
+    length = int.from_bytes(tail[pos + 6:pos + 14], 'little') / samplerate
+
+    return createFileTrack(file.name, bitrate, int(round(length)), samplerate, True, **tags)
+
+
+# Supported formats with associated readers
+READERS = {'.flac': _readFLAC, '.mp2': _readMP3, '.mp3': _readMP3, '.oga': _readOgg, '.ogg': _readOgg}
+
+
+def isSupported(filename):
+    """ Return True if the fast reader handles files with this extension """
+    return os.path.splitext(filename.lower())[1] in READERS
+
+
+def getTrack(filename):
+    """ Return a Track created from the file, or None if it has to be read by mutagen """
+    try:
+        with open(filename, 'rb') as file:
+            fileSize = os.fstat(file.fileno()).st_size
+            return READERS[os.path.splitext(filename.lower())[1]](file, fileSize)
+    except (UnsupportedError, _TruncatedError, ValueError, IndexError, UnicodeDecodeError, struct.error) as e:
+        logging.debug('Falling back to mutagen for %s: %s' % (filename, e or e.__class__.__name__))
+        return None
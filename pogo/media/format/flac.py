@@ -16,7 +16,8 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, getTags
+from pogo.media.format.ogg import TAGS
 
 
 def getTrack(filename):
@@ -28,50 +29,7 @@ def getTrack(filename):
     length = int(round(flacFile.info.length))
     samplerate = int(flacFile.info.sample_rate)
 
-    try:
-        title = str(flacFile['title'][0])
-    except:
-        title = None
+    # FLAC files use Vorbis comments as well
+    tags = getTags(((key.lower(), value) for (key, value) in flacFile.tags or ()), TAGS)
 
-    try:
-        album = str(flacFile['album'][0])
-    except:
-        album = None
-
-    try:
-        artist = str(flacFile['artist'][0])
-    except:
-        artist = None
-
-    try:
-        albumArtist = str(flacFile['albumartist'][0])
-    except:
-        albumArtist = None
-
-    try:
-        genre = str(flacFile['genre'][0])
-    except:
-        genre = None
-
-    try:
-        musicbrainzId = str(flacFile['musicbrainz_trackid'][0])
-    except:
-        musicbrainzId = None
-
-    try:
-        trackNumber = str(flacFile['tracknumber'][0])
-    except:
-        trackNumber = None
-
-    try:
-        discNumber = str(flacFile['discnumber'][0])
-    except:
-        discNumber = None
-
-    try:
-        date = str(flacFile['date'][0])
-    except:
-        date = None
-
-    return createFileTrack(filename, -1, length, samplerate, False, title, album, artist, albumArtist,
-                           musicbrainzId, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, -1, length, samplerate, False, **tags)
@@ -16,7 +16,18 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, first, getTags
+
+
+# APEv2 keys (in lower case) and the corresponding arguments of createFileTrack()
+TAGS = {
+    'track': ('trackNumber', first),
+    'year': ('date', first),
+    'title': ('title', first),
+    'album': ('album', first),
+    'artist': ('artist', first),
+    'genre': ('genre', first),
+}
 
 
 def getTrack(filename):
@@ -28,35 +39,7 @@ def getTrack(filename):
     length = int(round(mFile.info.length))
     samplerate = int(mFile.info.sample_rate)
 
-    try:
-        trackNumber = str(mFile['Track'][0])
-    except:
-        trackNumber = None
-
-    try:
-        date = str(mFile['Year'][0])
-    except:
-        date = None
-
-    try:
-        title = str(mFile['Title'][0])
-    except:
-        title = None
-
-    try:
-        album = str(mFile['Album'][0])
-    except:
-        album = None
-
-    try:
-        artist = str(mFile['Artist'][0])
-    except:
-        artist = None
-
-    try:
-        genre = str(mFile['Genre'][0])
-    except:
-        genre = None
-
-    return createFileTrack(filename, -1, length, samplerate, False, title, album, artist, None,
-                           None, genre, trackNumber, date, None)
+    # APEv2 keys are case-insensitive
+    tags = getTags(((key.lower(), value) for (key, value) in mFile.tags.items()) if mFile.tags is not None else (), TAGS)
+
+    return createFileTrack(filename, -1, length, samplerate, False, **tags)
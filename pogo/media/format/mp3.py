@@ -16,14 +16,28 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, getTags
+
+
+# ID3 frames and the corresponding arguments of createFileTrack()
+TAGS = {
+    'TIT2': ('title', str),
+    'TALB': ('album', str),
+    'TPE1': ('artist', str),
+    'TPE2': ('albumArtist', str),
+    'UFID:http://musicbrainz.org': ('musicbrainzId', lambda frame: frame.data),
+    'TCON': ('genre', str),
+    'TRCK': ('trackNumber', str),
+    'TDRC': ('date', lambda frame: str(frame.text[0].year)),
+    'TPOS': ('discNumber', str),
+}
 
 
 def getTrack(filename):
     """ Return a Track created from an mp3 file """
     from mutagen.mp3 import MP3
-    from mutagen.id3 import ID3
 
+    # The ID3 tags are read together with the audio information
     mp3File = MP3(filename)
 
     length = int(round(mp3File.info.length))
@@ -33,55 +47,6 @@ def getTrack(filename):
     # Don't set VBR information for MP3 files (#1202195)
     isVBR = False
 
-    try:
-        id3 = ID3(filename)
-    except:
-        return createFileTrack(filename, bitrate, length, samplerate, isVBR)
-
-    try:
-        title = str(id3['TIT2'])
-    except:
-        title = None
-
-    try:
-        album = str(id3['TALB'])
-    except:
-        album = None
-
-    try:
-        artist = str(id3['TPE1'])
-    except:
-        artist = None
-
-    try:
-        albumArtist = str(id3['TPE2'])
-    except:
-        albumArtist = None
-
-    try:
-        musicbrainzId = id3['UFID:http://musicbrainz.org'].data
-    except:
-        musicbrainzId = None
-
-    try:
-        genre = str(id3['TCON'])
-    except:
-        genre = None
-
-    try:
-        trackNumber = str(id3['TRCK'])
-    except:
-        trackNumber = None
-
-    try:
-        date = str(id3['TDRC'][0].year)
-    except:
-        date = None
-
-    try:
-        discNumber = str(id3['TPOS'])
-    except:
-        discNumber = None
+    tags = getTags(mp3File.tags.items() if mp3File.tags is not None else (), TAGS)
 
-    return createFileTrack(filename, bitrate, length, samplerate, isVBR, title, album, artist, albumArtist,
-                           musicbrainzId, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, bitrate, length, samplerate, isVBR, **tags)
@@ -16,7 +16,20 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, first, getTags
+
+
+# MP4 atoms and the corresponding arguments of createFileTrack()
+TAGS = {
+    'trkn': ('trackNumber', lambda value: str(value[0][0])),
+    'disk': ('discNumber', lambda value: str(value[0][0])),
+    '\xa9day': ('date', first),
+    '\xa9nam': ('title', first),
+    '\xa9alb': ('album', first),
+    '\xa9ART': ('artist', first),
+    '\xa9gen': ('genre', first),
+    'aART': ('albumArtist', first),
+}
 
 
 def getTrack(filename):
@@ -29,45 +42,6 @@ def getTrack(filename):
     bitrate = int(mp4File.info.bitrate)
     samplerate = int(mp4File.info.sample_rate)
 
-    try:
-        trackNumber = str(mp4File['trkn'][0][0])
-    except:
-        trackNumber = None
-
-    try:
-        discNumber = str(mp4File['disk'][0][0])
-    except:
-        discNumber = None
-
-    try:
-        date = str(mp4File['\xa9day'][0][0])
-    except:
-        date = None
-
-    try:
-        title = str(mp4File['\xa9nam'][0])
-    except:
-        title = None
-
-    try:
-        album = str(mp4File['\xa9alb'][0])
-    except:
-        album = None
-
-    try:
-        artist = str(mp4File['\xa9ART'][0])
-    except:
-        artist = None
-
-    try:
-        genre = str(mp4File['\xa9gen'][0])
-    except:
-        genre = None
-
-    try:
-        albumArtist = str(mp4File['aART'][0])
-    except:
-        albumArtist = None
+    tags = getTags(mp4File.tags.items() if mp4File.tags is not None else (), TAGS)
 
-    return createFileTrack(filename, bitrate, length, samplerate, False, title, album, artist, albumArtist,
-                           None, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, bitrate, length, samplerate, False, **tags)
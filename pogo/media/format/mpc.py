@@ -16,7 +16,21 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, getTags
+
+
+# APEv2 keys (in lower case) and the corresponding arguments of createFileTrack()
+TAGS = {
+    'track': ('trackNumber', str),
+    'discnumber': ('discNumber', str),
+    'year': ('date', str),
+    'title': ('title', str),
+    'genre': ('genre', str),
+    'musicbrainz_trackid': ('musicbrainzId', str),
+    'album': ('album', str),
+    'artist': ('artist', str),
+    'album artist': ('albumArtist', str),
+}
 
 
 def getTrack(filename):
@@ -29,50 +43,7 @@ def getTrack(filename):
     bitrate = int(mpcFile.info.bitrate * 1000)
     samplerate = int(mpcFile.info.sample_rate)
 
-    try:
-        trackNumber = str(mpcFile['Track'])
-    except:
-        trackNumber = None
-
-    try:
-        discNumber = str(mpcFile['Discnumber'])
-    except:
-        discNumber = None
-
-    try:
-        date = str(mpcFile['Year'])
-    except:
-        date = None
-
-    try:
-        title = str(mpcFile['Title'])
-    except:
-        title = None
-
-    try:
-        genre = str(mpcFile['Genre'])
-    except:
-        genre = None
-
-    try:
-        musicbrainzId = str(mpcFile['MUSICBRAINZ_TRACKID'])
-    except:
-        musicbrainzId = None
-
-    try:
-        album = str(mpcFile['Album'])
-    except:
-        album = None
-
-    try:
-        artist = str(mpcFile['Artist'])
-    except:
-        artist = None
-
-    try:
-        albumArtist = str(mpcFile['Album Artist'])
-    except:
-        albumArtist = None
+    # APEv2 keys are case-insensitive
+    tags = getTags(((key.lower(), value) for (key, value) in mpcFile.tags.items()) if mpcFile.tags is not None else (), TAGS)
 
-    return createFileTrack(filename, bitrate, length, samplerate, False, title, album, artist, albumArtist,
-                           musicbrainzId, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, bitrate, length, samplerate, False, **tags)
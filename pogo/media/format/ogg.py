@@ -16,7 +16,21 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, getTags
+
+
+# Vorbis comments (in lower case) and the corresponding arguments of createFileTrack()
+TAGS = {
+    'title': ('title', str),
+    'album': ('album', str),
+    'artist': ('artist', str),
+    'albumartist': ('albumArtist', str),
+    'genre': ('genre', str),
+    'musicbrainz_trackid': ('musicbrainzId', str),
+    'tracknumber': ('trackNumber', str),
+    'discnumber': ('discNumber', str),
+    'date': ('date', str),
+}
 
 
 def getTrack(filename):
@@ -29,50 +43,7 @@ def getTrack(filename):
     bitrate = int(oggFile.info.bitrate)
     samplerate = int(oggFile.info.sample_rate)
 
-    try:
-        title = str(oggFile['title'][0])
-    except:
-        title = None
-
-    try:
-        album = str(oggFile['album'][0])
-    except:
-        album = None
-
-    try:
-        artist = str(oggFile['artist'][0])
-    except:
-        artist = None
-
-    try:
-        albumArtist = str(oggFile['albumartist'][0])
-    except:
-        albumArtist = None
-
-    try:
-        genre = str(oggFile['genre'][0])
-    except:
-        genre = None
-
-    try:
-        musicbrainzId = str(oggFile['musicbrainz_trackid'][0])
-    except:
-        musicbrainzId = None
-
-    try:
-        trackNumber = str(oggFile['tracknumber'][0])
-    except:
-        trackNumber = None
-
-    try:
-        discNumber = str(oggFile['discnumber'][0])
-    except:
-        discNumber = None
-
-    try:
-        date = str(oggFile['date'][0])
-    except:
-        date = None
+    # The comments are a list of (key, value) pairs with keys in any case
+    tags = getTags(((key.lower(), value) for (key, value) in oggFile.tags or ()), TAGS)
 
-    return createFileTrack(filename, bitrate, length, samplerate, True, title, album, artist, albumArtist,
-                           musicbrainzId, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, bitrate, length, samplerate, True, **tags)
@@ -16,7 +16,20 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.format import createFileTrack
+from pogo.media.format import createFileTrack, first, getTags
+
+
+# APEv2 keys (in lower case) and the corresponding arguments of createFileTrack()
+TAGS = {
+    'title': ('title', first),
+    'album': ('album', first),
+    'artist': ('artist', first),
+    'album artist': ('albumArtist', first),
+    'genre': ('genre', first),
+    'track': ('trackNumber', first),
+    'disc': ('discNumber', first),
+    'year': ('date', first),
+}
 
 
 def getTrack(filename):
@@ -28,45 +41,7 @@ def getTrack(filename):
     length = int(round(wvFile.info.length))
     samplerate = int(wvFile.info.sample_rate)
 
-    try:
-        title = str(wvFile['Title'][0])
-    except:
-        title = None
-
-    try:
-        album = str(wvFile['Album'][0])
-    except:
-        album = None
-
-    try:
-        artist = str(wvFile['Artist'][0])
-    except:
-        artist = None
-
-    try:
-        albumArtist = str(wvFile['Album Artist'][0])
-    except:
-        albumArtist = None
-
-    try:
-        genre = str(wvFile['genre'][0])
-    except:
-        genre = None
-
-    try:
-        trackNumber = str(wvFile['Track'][0])
-    except:
-        trackNumber = None
-
-    try:
-        discNumber = str(wvFile['Disc'][0])
-    except:
-        discNumber = None
-
-    try:
-        date = str(wvFile['Year'][0])
-    except:
-        date = None
+    # APEv2 keys are case-insensitive
+    tags = getTags(((key.lower(), value) for (key, value) in wvFile.tags.items()) if wvFile.tags is not None else (), TAGS)
 
-    return createFileTrack(filename, -1, length, samplerate, False, title, album, artist, albumArtist,
-                           None, genre, trackNumber, date, discNumber)
+    return createFileTrack(filename, -1, length, samplerate, False, **tags)
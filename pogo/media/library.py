@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+Index of the audio files in the music folders.
+
+The index is the table of the tag cache: index() adds a row for each new
+or modified file of a music folder and removes the rows of deleted files.
+Once a folder has been indexed, queries about it don't need to access the
+file system.
+
+Rescans are incremental: the modification time of each directory is
+stored, and directories whose mtime is unchanged are not listed again,
+since no file has been added to or removed from them. Editing the tags
+of a file in place doesn't change the mtime of its directory though, so
+the known files of these directories are still stat'ed, which is much
+cheaper than listing the directories.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+from pogo import media, tools
+from pogo.media import tagcache
+from pogo.tools import dirCache
+
+
+# Number of files that are parsed between two progress reports
+BATCH_SIZE = 100
+
+__indexed = set()
+__indexedLock = threading.Lock()
+
+# Directories with changed files that have not been rescanned yet
+__changed = set()
+
+
+def _onDirChanged(directory, name):
+    """ Files in directory have changed, make the next rescan list it """
+    if directory is None:
+        # Anything may have changed, forget all directory mtimes
+        tagcache.getCache().clearDirs()
+        return
+    with __indexedLock:
+        __changed.add(directory)
+
+
+dirCache.addListener(_onDirChanged)
+
+
+def _takeChangedDirs(folder):
+    """ Return and forget the changed directories in folder """
+    prefix = folder.rstrip('/') + '/'
+    with __indexedLock:
+        changed = {directory for directory in __changed if directory == folder or directory.startswith(prefix)}
+        __changed.difference_update(changed)
+    return changed
+
+
+def _restoreChangedDirs(changed):
+    """ The rescan has been cancelled, remember the changed directories for the next one """
+    with __indexedLock:
+        __changed.update(changed)
+
+
+def index(folder, isCancelled=lambda: False, onProgress=None, workers=media.SCAN_WORKERS, throttle=0):
+    """
+    Bring the index of folder up to date. Return False if isCancelled()
+    has returned True before all files have been indexed, or if the tag
+    cache could not be written.
+
+    New and modified files are parsed in batches of BATCH_SIZE files with
+    the given number of workers, onProgress(done, total) is called after
+    each batch. Sleep throttle seconds between two batches.
+    """
+    start = time.monotonic()
+    folder = folder.rstrip('/') or '/'
+    cache = tagcache.getCache()
+    knownFiles = cache.getFiles(folder)
+    knownDirs = cache.getDirs(folder)
+    changed = _takeChangedDirs(folder)
+
+    filesByDir = collections.defaultdict(list)
+    for path in knownFiles:
+        filesByDir[os.path.dirname(path)].append(path)
+    subdirsByDir = collections.defaultdict(list)
+    for path in knownDirs:
+        if path != folder:
+            subdirsByDir[os.path.dirname(path)].append(path)
+
+    # Find the new and modified files
+    mtimes = {}
+    modified = []
+    todo = [folder]
+    while todo:
+        if isCancelled():
+            _restoreChangedDirs(changed)
+            return False
+
+        directory = todo.pop()
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue
+        mtimes[directory] = mtime
+
+        if knownDirs.get(directory) == mtime and directory not in changed:
+            # No file has been added or removed, but the known files may have been modified
+            for path in filesByDir[directory]:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Keep it in knownFiles, so that its entry is removed
+                    continue
+                if knownFiles.pop(path) != (stat.st_mtime_ns, stat.st_size):
+                    modified.append((path, stat))
+            todo.extend(subdirsByDir[directory])
+            continue
+
+        for entry in tools.scanDir(directory):
+            if entry.is_dir():
+                todo.append(entry.path)
+            elif media.isSupported(entry.path):
+                # The directory entry may be cached, don't use its stat result
+                try:
+                    stat = os.stat(entry.path)
+                except OSError:
+                    continue
+                if knownFiles.pop(entry.path, None) != (stat.st_mtime_ns, stat.st_size):
+                    modified.append((entry.path, stat))
+
+    # Parse them without creating Track objects, which the track cache would keep for the whole session
+    written = True
+    for offset in range(0, len(modified), BATCH_SIZE):
+        batch = modified[offset:offset + BATCH_SIZE]
+        allTags = media.parseFiles([file for (file, stat) in batch], workers=workers)
+        for ((file, stat), tags) in zip(batch, allTags):
+            # Files without readable tags are stored too, so that they are not parsed again by each rescan
+            written = cache.put(file, stat, {} if tags is None else tags) and written
+
+        if onProgress is not None:
+            onProgress(offset + len(batch), len(modified))
+        if isCancelled():
+            _restoreChangedDirs(changed)
+            return False
+        if throttle:
+            time.sleep(throttle)
+
+    # The remaining files and directories have been deleted
+    written = cache.remove(list(knownFiles)) and written
+    written = cache.setDirs(mtimes, [path for path in knownDirs if path not in mtimes]) and written
+    if not written:
+        # The folder is not indexed, the changed directories must be listed again by the next rescan
+        _restoreChangedDirs(changed)
+        return False
+
+    with __indexedLock:
+        __indexed.add(folder)
+    logging.info('Indexed %s in %.1fs: %d directories, %d new or modified files, %d deleted files' % (
+        folder, time.monotonic() - start, len(mtimes), len(modified), len(knownFiles)))
+    return True
+
+
+def setFolders(folders):
+    """ Forget the indexed folders that are not in folders any more """
+    folders = {folder.rstrip('/') or '/' for folder in folders}
+    with __indexedLock:
+        __indexed.intersection_update(folders)
+
+
+def isIndexed(path):
+    """ Return True if path is located in an indexed music folder """
+    path = path.rstrip('/') or '/'
+    with __indexedLock:
+        return any(path == folder or path.startswith(folder.rstrip('/') + '/') for folder in __indexed)
+
+
+def search(directory, query):
+    """
+    Return a tuple (results, dirs) for the indexed files below directory
+    whose path contains all whitespace-separated words of query (ignoring
+    case), like `find directory -iwholename *word*` would. For each
+    matching file, results contains its topmost matching parent directory
+    or the file itself. dirs is the set of the directories in results.
+    """
+    directory = directory.rstrip('/') or '/'
+    words = [word.lower() for word in query.split()]
+
+    def matches(path):
+        path = path.lower()
+        return all(word in path for word in words)
+
+    results = set()
+    dirs = set()
+    for path in tagcache.getCache().getFiles(directory):
+        if not matches(path):
+            continue
+
+        parent = directory
+        names = os.path.relpath(path, directory).split(os.sep)
+        for name in names:
+            if matches(parent):
+                results.add(parent)
+                dirs.add(parent)
+                break
+            parent = os.path.join(parent, name)
+        else:
+            results.add(path)
+
+    return (sorted(results, key=str.lower), dirs)
+
+
+def getAlbumDirs(artist, album):
+    """ Return the sorted directories that contain indexed files of the given artist and album """
+    return sorted({os.path.dirname(path) for path in tagcache.getCache().getAlbumFiles(artist, album)})
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+Storage of the saved playlist: a snapshot and a write-ahead journal.
+
+The snapshot is a pickled dictionary of plain lists:
+
+    version     FORMAT_VERSION
+    generation  the first journal that is not contained in the snapshot
+    strings     the table of all labels, directories and file names
+    tracks      flat list of (directory, file name) string IDs, one pair
+                per track, the directories end with a slash
+    rows        flat list of (depth, label, track) IDs in depth-first
+                order, track is -1 for directories
+
+The tags are not saved: the restored tracks are lazy and get their tags
+from the track and tag caches when they are needed. Files written before
+the introduction of this format contain a pickled tree with the full
+Track objects, they are still loaded and are converted by the next
+compaction.
+
+The modifications of the playlist are appended to the journal as they
+happen. Each record mirrors a change of the rows of the GTK tree store:
+rows are given by their path and their value, a tuple (label, file path)
+where the file path is None for directories. Rows with the value None
+(e.g., placeholders) are kept while replaying the journal, so that the
+paths stay valid, but they are not restored.
+
+The journal is split into generations. A compaction closes the current
+generation and merges the snapshot and the closed journals into a new
+snapshot in the background. The snapshot is written to a temporary file
+that is then renamed, and the merged journals are only deleted
+afterwards, so a crash at any point only loses the records that have not
+been flushed yet.
+"""
+
+import logging
+import os
+import pickle
+import threading
+import time
+
+from pogo import media
+
+
+# Bump this whenever the layout of the snapshot changes
+FORMAT_VERSION = 2
+
+# The records of the journal
+(
+    JOURNAL_INSERT,         # (JOURNAL_INSERT, path, value): a row has been inserted at path
+    JOURNAL_SET,            # (JOURNAL_SET, path, value): the row at path has changed
+    JOURNAL_DELETE,         # (JOURNAL_DELETE, path): the row at path and its children have been removed
+    JOURNAL_RESTORE_START,  # (JOURNAL_RESTORE_START,): the playlist is restored into an empty tree
+    JOURNAL_RESTORE_END,    # (JOURNAL_RESTORE_END,): the playlist has been completely restored
+) = list(range(5))
+
+
+def getJournalFile(file, generation):
+    """ Return the path of the given journal generation of the playlist saved in file """
+    return '%s.journal-%d' % (file, generation)
+
+
+def getJournalGenerations(file):
+    """ Return the sorted generations of the existing journals of the playlist saved in file """
+    (directory, name) = os.path.split(file)
+    prefix = name + '.journal-'
+    generations = []
+    for entry in os.listdir(directory or '.'):
+        if entry.startswith(prefix) and entry[len(prefix):].isdigit():
+            generations.append(int(entry[len(prefix):]))
+    return sorted(generations)
+
+
+# --== Snapshots ==--
+
+def encode(nodes, generation):
+    """
+    Return the snapshot of the given tree. The tree is a list of nodes
+    [value, children], where children is a list of nodes.
+    """
+    strings = []
+    stringIds = {}
+    tracks = []
+    trackIds = {}
+    rows = []
+
+    def getStringId(string):
+        id = stringIds.get(string)
+        if id is None:
+            id = stringIds[string] = len(strings)
+            strings.append(string)
+        return id
+
+    def getTrackId(path):
+        id = trackIds.get(path)
+        if id is None:
+            id = trackIds[path] = len(tracks) // 2
+            split = path.rfind('/') + 1
+            tracks.extend((getStringId(path[:split]), getStringId(path[split:])))
+        return id
+
+    def encodeNodes(nodes, depth):
+        for (value, children) in nodes:
+            if value is None:
+                continue
+            (label, path) = value
+            rows.extend((depth, getStringId(label), -1 if path is None else getTrackId(path)))
+            encodeNodes(children, depth + 1)
+
+    encodeNodes(nodes, 0)
+    return {'version': FORMAT_VERSION, 'generation': generation, 'strings': strings, 'tracks': tracks, 'rows': rows}
+
+
+def decode(data):
+    """ Return the tree stored in the given snapshot """
+    if data['version'] > FORMAT_VERSION:
+        raise ValueError('Unsupported playlist format version %d' % data['version'])
+
+    strings = data['strings']
+    files = data['tracks']
+    paths = [strings[directory] + strings[filename] for (directory, filename) in zip(files[::2], files[1::2])]
+
+    nodes = []
+    # The children of the last node on each level above the current row
+    levels = [nodes]
+    rows = data['rows']
+    for (depth, label, track) in zip(rows[::3], rows[1::3], rows[2::3]):
+        node = [(strings[label], None if track < 0 else paths[track]), []]
+        del levels[depth + 1:]
+        levels[depth].append(node)
+        levels.append(node[1])
+
+    return nodes
+
+
+def decodeLegacy(dump):
+    """ Return the tree of a playlist saved before the introduction of snapshots """
+    return [[(label, None if track is None else track.getFilePath()), decodeLegacy(children or [])]
+            for ((label, track), children) in dump]
+
+
+def loadSnapshot(file):
+    """ Return a tuple (tree, version, generation) for the snapshot saved in file """
+    if not os.path.exists(file):
+        return ([], FORMAT_VERSION, 0)
+    with open(file, 'rb') as f:
+        data = pickle.load(f)
+    if isinstance(data, list):
+        return (decodeLegacy(data), 0, 0)
+    return (decode(data), data['version'], data.get('generation', 0))
+
+
+def saveSnapshot(file, nodes, generation):
+    """ Save the tree to file, the previous snapshot is only replaced once the new one is complete """
+    tmp = file + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(encode(nodes, generation), f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, file)
+
+
+# --== Journal ==--
+
+def iterRecords(file):
+    """ Iterate over the records of the given journal """
+    with open(file, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+            except Exception:
+                # The last record is incomplete if the application has crashed while writing it
+                logging.info('Ignoring the incomplete end of the playlist journal %s' % file)
+                return
+
+
+def replay(nodes, records):
+    """ Apply the records of a journal to the tree, return the resulting tree """
+    # The tree before the current restore, it is kept if the restore has not been finished
+    base = None
+    for record in records:
+        try:
+            if record[0] in (JOURNAL_INSERT, JOURNAL_SET, JOURNAL_DELETE):
+                path = record[1]
+                siblings = nodes
+                for index in path[:-1]:
+                    siblings = siblings[index][1]
+                if record[0] == JOURNAL_INSERT:
+                    siblings.insert(path[-1], [record[2], []])
+                elif record[0] == JOURNAL_SET:
+                    siblings[path[-1]][0] = record[2]
+                else:
+                    del siblings[path[-1]]
+            elif record[0] == JOURNAL_RESTORE_START:
+                base = nodes
+                nodes = []
+            elif record[0] == JOURNAL_RESTORE_END:
+                base = None
+        except IndexError:
+            logging.error('Invalid record in the playlist journal: %s' % (record,))
+
+    if base is not None:
+        return base
+    return nodes
+
+
+def toDump(nodes):
+    """ Return the list of [(label, track), children] items of the tree, the tracks are lazy """
+    dump = []
+    for (value, children) in nodes:
+        if value is not None:
+            (label, path) = value
+            track = None if path is None else media.getLazyTrack(path)
+            dump.append([(label, track), toDump(children) or None])
+    return dump
+
+
+def load(file):
+    """
+    Load the snapshot saved in file and replay its journals. Return a tuple
+    (dump, version, generation): dump is a list of [(label, track), children]
+    items, version is the version of the snapshot (0 for the old format) and
+    generation is the one of the next journal.
+    """
+    (nodes, version, generation) = loadSnapshot(file)
+    nextGeneration = generation
+    for journal in getJournalGenerations(file):
+        if journal < generation:
+            # The journal has already been merged into the snapshot
+            os.remove(getJournalFile(file, journal))
+        else:
+            nodes = replay(nodes, iterRecords(getJournalFile(file, journal)))
+            nextGeneration = journal + 1
+    return (toDump(nodes), version, nextGeneration)
+
+
+def compact(file, generation):
+    """ Merge the snapshot and the journals up to the given generation into a new snapshot """
+    start = time.monotonic()
+    (nodes, version, first) = loadSnapshot(file)
+    journals = [journal for journal in getJournalGenerations(file) if journal <= generation]
+    for journal in journals:
+        if journal >= first:
+            nodes = replay(nodes, iterRecords(getJournalFile(file, journal)))
+    saveSnapshot(file, nodes, generation + 1)
+    for journal in journals:
+        os.remove(getJournalFile(file, journal))
+    logging.info('Compacted the playlist in %.2fs' % (time.monotonic() - start))
+
+
+def discard(file):
+    """
+    Move the snapshot and the journals of a playlist that cannot be loaded
+    out of the way (they are kept as file.broken for inspection), so that a
+    new playlist can start at generation 0
+    """
+    broken = file + '.broken'
+    for journal in getJournalGenerations(broken):
+        os.remove(getJournalFile(broken, journal))
+    if os.path.exists(file):
+        os.replace(file, broken)
+    for journal in getJournalGenerations(file):
+        os.replace(getJournalFile(file, journal), getJournalFile(broken, journal))
+
+
+class Journal:
+    """ The journal of the modifications of the playlist saved in file """
+
+    def __init__(self, file, generation):
+        """ Constructor, generation is the one returned by load() """
+        self.file = file
+        self.generation = generation
+        self.pending = []
+        # Number of records and bytes written to the current generation
+        self.records = 0
+        self.size = 0
+        self.compaction = None
+        self.stream = open(getJournalFile(file, generation), 'ab')
+
+    def append(self, record):
+        """ Append a record, it is written by the next flush() """
+        self.pending.append(record)
+
+    def flush(self):
+        """ Write the pending records to the disk, records appended after close() are dropped """
+        if not self.pending or self.stream is None:
+            return
+        data = b''.join([pickle.dumps(record, pickle.HIGHEST_PROTOCOL) for record in self.pending])
+        self.records += len(self.pending)
+        self.pending = []
+        self.stream.write(data)
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+        self.size += len(data)
+
+    def compact(self):
+        """ Start a new generation and merge the previous ones into the snapshot in the background """
+        self.flush()
+        if not self.records or self.stream is None or (self.compaction is not None and self.compaction.is_alive()):
+            return
+        self.stream.close()
+        self.compaction = threading.Thread(target=compact, args=(self.file, self.generation), name='playlist-compaction')
+        self.compaction.daemon = True
+        self.compaction.start()
+        self.generation += 1
+        self.records = 0
+        self.size = 0
+        self.stream = open(getJournalFile(self.file, self.generation), 'ab')
+
+    def close(self):
+        """ Write the pending records and close the journal """
+        self.flush()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
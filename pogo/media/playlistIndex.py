@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+Index of the playable rows of the playlist.
+
+The index mirrors the rows of the tree store: it is updated with the
+paths given by the "row-inserted" and "row-deleted" signals, so that
+every modification (inserting, removing, moving, restoring) is covered.
+Each row keeps an opaque handle (the tree iter, which stays valid as long
+as the row exists) and the playable rows are linked in playlist order,
+so the next and the previous track are found in constant time.
+
+Tracks that have failed to play are flagged explicitly. Their rows are
+unlinked lazily, when the navigation reaches them.
+
+The index also keeps the TrackDir of the playlist up to date, so that it
+can be sent to the other modules without walking the rows.
+"""
+
+from pogo import media
+
+
+class _Row:
+    """ A row of the playlist and its links to the previous and next playable rows """
+
+    __slots__ = ('track', 'trackdir', 'handle', 'children', 'prev', 'next')
+
+    def __init__(self, track, trackdir, handle):
+        """ Constructor, track is None for directories and placeholders, trackdir is None for tracks and placeholders """
+        self.track = track
+        self.trackdir = trackdir
+        self.handle = handle
+        self.children = []
+        # Both are None if the row is not linked
+        self.prev = None
+        self.next = None
+
+
+class PlaylistIndex:
+    """ The rows of the playlist with the playable ones linked in order """
+
+    def __init__(self):
+        """ Constructor """
+        self.failed = set()
+        self.clear()
+
+    def clear(self):
+        """ Forget all rows and failures, e.g. before the playlist is replaced """
+        self.root = _Row(None, media.TrackDir(name='playtree', flat=True), None)
+        # The list of playable rows is circular, head is neither the first nor the last row
+        self.head = _Row(None, None, None)
+        self.head.prev = self.head.next = self.head
+        self.failed.clear()
+
+    def getChain(self, path):
+        """ Return the list of the rows from the root to the row at path, raise IndexError if there is none """
+        chain = [self.root]
+        for index in path:
+            chain.append(chain[-1].children[index])
+        return chain
+
+    def getTrackDir(self):
+        """ Return the TrackDir of the playlist, it must not be modified """
+        return self.root.trackdir
+
+    def getPosition(self, parent, position, tracks):
+        """
+        Return the number of tracks (subdirectories if tracks is False)
+        among the children of parent before the given position, counting
+        on the shorter side of the position.
+        """
+        siblings = parent.children
+        if position <= len(siblings) // 2:
+            return sum(1 for row in siblings[:position] if (row.track if tracks else row.trackdir) is not None)
+        total = len(parent.trackdir.tracks if tracks else parent.trackdir.subdirs)
+        return total - sum(1 for row in siblings[position:] if (row.track if tracks else row.trackdir) is not None)
+
+    def addToTrackDir(self, parent, position, row):
+        """ Add the track or directory of row, which is going to be inserted at position, to the TrackDir of parent """
+        if row.track is not None:
+            parent.trackdir.add_track(row.track, self.getPosition(parent, position, True))
+        elif row.trackdir is not None:
+            parent.trackdir.add_subdir(row.trackdir, self.getPosition(parent, position, False))
+
+    def removeFromTrackDir(self, parent, position, row):
+        """ Remove the track or directory of the row at position from the TrackDir of parent """
+        if row.track is not None:
+            parent.trackdir.remove_track(self.getPosition(parent, position, True))
+        elif row.trackdir is not None:
+            parent.trackdir.remove_subdir(self.getPosition(parent, position, False))
+
+    def link(self, row, prev):
+        """ Link row after prev """
+        row.prev = prev
+        row.next = prev.next
+        prev.next.prev = row
+        prev.next = row
+
+    def unlink(self, row):
+        """ Remove row from the list of playable rows """
+        if row.next is not None:
+            row.prev.next = row.next
+            row.next.prev = row.prev
+            row.prev = row.next = None
+
+    def unlinkAll(self, row):
+        """ Unlink row and its descendants """
+        self.unlink(row)
+        for child in row.children:
+            self.unlinkAll(child)
+
+    def findLast(self, row):
+        """ Return the last linked row among row and its descendants, or None """
+        for child in reversed(row.children):
+            last = self.findLast(child)
+            if last is not None:
+                return last
+        return row if row.next is not None else None
+
+    def findPrevious(self, chain, path):
+        """
+        Return the last linked row before the row at path (excluding its
+        descendants), or the head. chain contains the parents of the row.
+        """
+        # The parents are directories, only the previous siblings on each level are searched
+        for depth in range(len(path) - 1, -1, -1):
+            siblings = chain[depth].children
+            for index in range(path[depth] - 1, -1, -1):
+                last = self.findLast(siblings[index])
+                if last is not None:
+                    return last
+        return self.head
+
+    def insert(self, path, track, handle, dirname=None):
+        """ A row has been inserted at path, dirname is the name of a directory row (None for placeholders) """
+        try:
+            chain = self.getChain(path[:-1])
+        except IndexError:
+            return
+        trackdir = media.TrackDir(name=dirname) if track is None and dirname is not None else None
+        row = _Row(track, trackdir, handle)
+        self.addToTrackDir(chain[-1], path[-1], row)
+        chain[-1].children.insert(path[-1], row)
+        if track is not None and track not in self.failed:
+            self.link(row, self.findPrevious(chain, path))
+
+    def update(self, path, track):
+        """ The row at path has changed, track is its (new) track """
+        try:
+            chain = self.getChain(path)
+        except IndexError:
+            return
+        row = chain[-1]
+        if row.track is not track and row.trackdir is None:
+            self.unlink(row)
+            self.removeFromTrackDir(chain[-2], path[-1], row)
+            # The row must not be counted while the position of its new track is computed
+            row.track = None
+            if track is not None:
+                chain[-2].trackdir.add_track(track, self.getPosition(chain[-2], path[-1], True))
+            row.track = track
+            if track is not None and track not in self.failed:
+                self.link(row, self.findPrevious(chain[:-1], path))
+
+    def remove(self, path):
+        """ The row at path and its descendants have been removed """
+        try:
+            chain = self.getChain(path)
+        except IndexError:
+            return
+        self.removeFromTrackDir(chain[-2], path[-1], chain[-1])
+        del chain[-2].children[path[-1]]
+        self.unlinkAll(chain[-1])
+
+    def setFailed(self, track):
+        """ The track cannot be played, skip its rows from now on """
+        self.failed.add(track)
+
+    def skipFailed(self, row, forward):
+        """ Return the first row from row on (in the given direction) whose track has not failed, unlink the others """
+        while row is not self.head and row.track in self.failed:
+            following = row.next if forward else row.prev
+            self.unlink(row)
+            row = following
+        return row
+
+    def getNext(self, path):
+        """ Return the handle of the first playable row after path (or of the first one if path is None), or None """
+        if path is None:
+            row = self.head.next
+        else:
+            try:
+                chain = self.getChain(path)
+            except IndexError:
+                return None
+            current = chain[-1]
+            if current.next is not None:
+                row = current.next
+            else:
+                # Directories are not linked, their first playable descendant comes next
+                row = self.findPrevious(chain[:-1], path).next
+        row = self.skipFailed(row, True)
+        return None if row is self.head else row.handle
+
+    def getPrevious(self, path):
+        """ Return the handle of the last playable row before path, or None """
+        try:
+            chain = self.getChain(path)
+        except IndexError:
+            return None
+        current = chain[-1]
+        if current.next is not None:
+            row = current.prev
+        else:
+            row = self.findPrevious(chain[:-1], path)
+        row = self.skipFailed(row, False)
+        return None if row is self.head else row.handle
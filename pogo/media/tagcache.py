@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+Persistent on-disk cache for the tags of audio files.
+
+Entries are keyed by path and are only valid as long as the modification
+time (in nanoseconds) and the size of the file are unchanged, so that a
+cache hit never has to touch the tag parsers.
+
+The table doubles as the index of the music library (see media.library):
+the rows of the files in the music folders are kept up to date, and the
+paths, artists and albums are indexed for queries. A second table stores
+the modification times of the directories in the music folders, so that
+rescans can skip unchanged directories.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import traceback
+
+from pogo.media.track import (
+    TAG_SCH, TAG_NUM, TAG_TIT, TAG_ART, TAG_ALB, TAG_LEN, TAG_AAR, TAG_DNB,
+    TAG_GEN, TAG_DAT, TAG_MBT, TAG_BTR, TAG_MOD, TAG_SMP)
+from pogo.tools import consts
+
+
+# Bump this whenever the layout of the table changes. Databases with a
+# different version are discarded and rebuilt.
+SCHEMA_VERSION = 3
+
+# Number of writes after which pending changes are committed
+COMMIT_INTERVAL = 500
+
+DB_FILE = os.path.join(consts.dirCfg, 'tag-cache.sqlite')
+
+# Each tag (except the path) is stored in its own column
+COLUMNS = (
+    (TAG_SCH, 'scheme'),
+    (TAG_NUM, 'number'),
+    (TAG_TIT, 'title'),
+    (TAG_ART, 'artist'),
+    (TAG_ALB, 'album'),
+    (TAG_LEN, 'length'),
+    (TAG_AAR, 'album_artist'),
+    (TAG_DNB, 'disc'),
+    (TAG_GEN, 'genre'),
+    (TAG_DAT, 'date'),
+    (TAG_MBT, 'mb_track_id'),
+    (TAG_BTR, 'bitrate'),
+    (TAG_MOD, 'enc_mode'),
+    (TAG_SMP, 'sample_rate'),
+)
+
+
+class TagCache:
+    """ An SQLite table with one row per audio file """
+
+    def __init__(self, filename):
+        """ Constructor """
+        # The connection is shared by all threads and protected by our lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+        self.errorLogged = False
+
+        try:
+            self.createTables(filename)
+        except sqlite3.Error:
+            self.connection.close()
+            raise
+
+        columns = ', '.join(name for (tag, name) in COLUMNS)
+        self.selectSQL = 'SELECT mtime, size, %s FROM tracks WHERE path=?' % columns
+        self.insertSQL = 'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, %s)' % ', '.join('?' * len(COLUMNS))
+
+    def createTables(self, filename):
+        """ Create the tables, or recreate them if the schema version has changed """
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            logging.info('Creating tag cache %s (schema version %d)' % (filename, SCHEMA_VERSION))
+            self.connection.execute('DROP TABLE IF EXISTS tracks')
+            self.connection.execute('DROP TABLE IF EXISTS dirs')
+        columns = ', '.join(name for (tag, name) in COLUMNS)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tracks (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, %s)' % columns)
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist COLLATE NOCASE)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album COLLATE NOCASE)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER)')
+        self.connection.execute('PRAGMA user_version=%d' % SCHEMA_VERSION)
+        self.connection.commit()
+
+    def logError(self):
+        """ A query has failed, only the first failure is logged since the cache may be used for every file """
+        if not self.errorLogged:
+            self.errorLogged = True
+            logging.error('Tag cache error, the tags are read from the files\n\n%s' % traceback.format_exc())
+
+    def get(self, path, stat):
+        """ Return the cached tags of path, or None if they are missing or outdated """
+        with self.lock:
+            try:
+                row = self.connection.execute(self.selectSQL, (path,)).fetchone()
+            except sqlite3.Error:
+                # E.g., the database is locked by another instance, treat this as a miss
+                self.logError()
+                row = None
+            valid = row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size
+            if valid:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if not valid:
+            return None
+        return {tag: value for ((tag, name), value) in zip(COLUMNS, row[2:]) if value is not None}
+
+    def put(self, path, stat, tags):
+        """ Store the tags of path, return False if the database cannot be written """
+        values = [path, stat.st_mtime_ns, stat.st_size] + [tags.get(tag) for (tag, name) in COLUMNS]
+        with self.lock:
+            try:
+                self.connection.execute(self.insertSQL, values)
+                self.pending += 1
+                if self.pending >= COMMIT_INTERVAL:
+                    self.connection.commit()
+                    self.pending = 0
+            except sqlite3.Error:
+                self.logError()
+                return False
+        return True
+
+    def remove(self, paths):
+        """ Remove the entries of the given paths, return False if the database cannot be written """
+        with self.lock:
+            try:
+                self.connection.executemany('DELETE FROM tracks WHERE path=?', ((path,) for path in paths))
+                self.connection.commit()
+                self.pending = 0
+            except sqlite3.Error:
+                self.logError()
+                return False
+        return True
+
+    def getFiles(self, directory):
+        """ Return a dictionary mapping the paths of the files below directory to their (mtime, size) """
+        # All paths below directory sort between "directory/" and "directory0"
+        prefix = directory.rstrip('/') + '/'
+        with self.lock:
+            try:
+                rows = self.connection.execute(
+                    'SELECT path, mtime, size FROM tracks WHERE path >= ? AND path < ?', (prefix, prefix[:-1] + '0'))
+                return {path: (mtime, size) for (path, mtime, size) in rows}
+            except sqlite3.Error:
+                self.logError()
+                return {}
+
+    def getDirs(self, directory):
+        """ Return a dictionary mapping directory and the directories below it to their stored mtime """
+        directory = directory.rstrip('/') or '/'
+        prefix = directory.rstrip('/') + '/'
+        with self.lock:
+            try:
+                rows = self.connection.execute(
+                    'SELECT path, mtime FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                    (directory, prefix, prefix[:-1] + '0'))
+                return dict(rows)
+            except sqlite3.Error:
+                # Without mtimes, all directories are listed again
+                self.logError()
+                return {}
+
+    def setDirs(self, mtimes, removed):
+        """
+        Store the mtimes of the given directories, remove the entries of
+        the removed ones. Return False if the database cannot be written.
+        """
+        with self.lock:
+            try:
+                self.connection.executemany('INSERT OR REPLACE INTO dirs VALUES (?, ?)', mtimes.items())
+                self.connection.executemany('DELETE FROM dirs WHERE path=?', ((path,) for path in removed))
+                self.connection.commit()
+                self.pending = 0
+            except sqlite3.Error:
+                self.logError()
+                return False
+        return True
+
+    def clearDirs(self):
+        """ Remove the mtimes of all directories, return False if the database cannot be written """
+        with self.lock:
+            try:
+                self.connection.execute('DELETE FROM dirs')
+                self.connection.commit()
+                self.pending = 0
+            except sqlite3.Error:
+                self.logError()
+                return False
+        return True
+
+    def getAlbumFiles(self, artist, album):
+        """ Return the paths of the files with the given artist and album (ignoring case) """
+        with self.lock:
+            try:
+                rows = self.connection.execute(
+                    'SELECT path FROM tracks WHERE artist = ? COLLATE NOCASE AND album = ? COLLATE NOCASE', (artist, album))
+                return [path for (path,) in rows]
+            except sqlite3.Error:
+                self.logError()
+                return []
+
+    def close(self):
+        """ Commit pending changes and close the database """
+        with self.lock:
+            try:
+                self.connection.commit()
+            except sqlite3.Error:
+                self.logError()
+            self.connection.close()
+        logging.info('Tag cache: %d hits, %d misses' % (self.hits, self.misses))
+
+
+__cache = None
+__cacheLock = threading.Lock()
+
+
+def openCache(filename):
+    """
+    Return the TagCache stored in filename. A corrupt database is moved
+    aside and recreated. If the database cannot be used at all (e.g., it
+    is locked by another instance), fall back to a cache in memory.
+    """
+    try:
+        return TagCache(filename)
+    except sqlite3.OperationalError:
+        logging.error('Unable to open the tag cache %s\n\n%s' % (filename, traceback.format_exc()))
+    except sqlite3.DatabaseError:
+        logging.error('The tag cache %s is corrupt, creating a new one\n\n%s' % (filename, traceback.format_exc()))
+        try:
+            os.replace(filename, filename + '.broken')
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(filename + suffix):
+                    os.remove(filename + suffix)
+            return TagCache(filename)
+        except (OSError, sqlite3.Error):
+            logging.error('Unable to recreate the tag cache %s\n\n%s' % (filename, traceback.format_exc()))
+    return TagCache(':memory:')
+
+
+def getCache():
+    """ Return the shared tag cache, open it if needed """
+    global __cache
+    with __cacheLock:
+        if __cache is None:
+            __cache = openCache(DB_FILE)
+        return __cache
+
+
+def close():
+    """ Close the shared tag cache if it has been opened """
+    global __cache
+    with __cacheLock:
+        if __cache is not None:
+            __cache.close()
+            __cache = None
@@ -17,7 +17,10 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
+import functools
 import os.path
+import re
+import sys
 from gettext import gettext as _
 
 from pogo import tools
@@ -44,6 +47,22 @@ from pogo.tools import consts, sec2str
     TAG_SMP,  # Sample rate
 ) = list(range(15))
 
+# Names of the slots that hold the tags, in the order of the constants above
+TAG_SLOTS = (
+    'resource', 'scheme', 'number', 'title', 'artist', 'album', 'length', 'albumArtist',
+    'discNumber', 'genre', 'date', 'mbTrackId', 'bitrate', 'encMode', 'sampleRate',
+)
+
+# Tags whose values are usually shared by all tracks of an album
+INTERNED_TAGS = (TAG_ART, TAG_ALB, TAG_AAR, TAG_GEN)
+
+
+def intern(value):
+    """ Return the shared copy of value if it is a string """
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
 
 # Special fields that may be used to call format()
 FIELDS = (
@@ -62,6 +81,72 @@ FIELDS = (
 )
 
 
+# Special field -> (function returning the value of a track, whether HTML must be escaped)
+FIELD_GETTERS = {
+    'track': (lambda track: str(track.getNumber()), False),
+    'title': (lambda track: track.getTitle(), True),
+    'artist': (lambda track: track.getArtist(), True),
+    'album': (lambda track: track.getAlbum(), True),
+    'genre': (lambda track: track.getGenre(), True),
+    'date': (lambda track: str(track.getDate()), False),
+    'disc': (lambda track: str(track.getDiscNumber()), False),
+    'bitrate': (lambda track: track.getBitrate(), False),
+    'sample_rate': (lambda track: track.getSampleRate(), False),
+    'duration_sec': (lambda track: str(track.getLength()), False),
+    'duration_str': (lambda track: sec2str(track.getLength()), False),
+    'path': (lambda track: track.getFilePath(), True),
+}
+
+FIELDS_REGEX = re.compile('{(%s)}' % '|'.join(FIELD_GETTERS))
+
+
+def _escaped(getter):
+    """ Return a function that escapes the HTML special characters in the values returned by getter """
+    return lambda track: tools.htmlEscape(getter(track))
+
+
+@functools.lru_cache(maxsize=64)
+def compileFormat(fmtString, htmlSafe=False):
+    """
+    Return a function that replaces the special fields in fmtString by the
+    values of the given track. The template is only parsed once, and only
+    the fields it contains are evaluated. If htmlSafe is True, the values
+    are escaped.
+    """
+    # The pieces alternate between literal text and field names
+    pieces = FIELDS_REGEX.split(fmtString)
+    parts = []
+    for (index, piece) in enumerate(pieces):
+        if index % 2 == 0:
+            if piece:
+                parts.append(piece)
+        else:
+            (getter, escape) = FIELD_GETTERS[piece]
+            if htmlSafe and escape:
+                getter = _escaped(getter)
+            parts.append(getter)
+
+    if all(type(part) is str for part in parts):
+        return lambda track: fmtString
+    if len(parts) == 1:
+        return parts[0]
+    return lambda track: ''.join([part if type(part) is str else part(track) for part in parts])
+
+
+# Strings that are ignored when comparing the album and artist of a track to the label of its parent
+LABEL_CONNECTORS = ['the', 'and', '&', ',', '.', '?', '!', "'", ':', '-', ' ']
+LABEL_CONNECTORS_REGEX = re.compile('|'.join(re.escape(connector) for connector in LABEL_CONNECTORS))
+
+# Maximum number of labels cached per track
+LABEL_CACHE_SIZE = 4
+
+
+@functools.lru_cache(maxsize=4096)
+def normalizeLabel(text):
+    """ Return text in lower case without connectors, parent labels and album names are shared by many rows """
+    return LABEL_CONNECTORS_REGEX.sub('', text.lower())
+
+
 def getFormatSpecialFields(usePango=True):
     """
     Return a string in plain English (or whatever language being used)
@@ -76,66 +161,99 @@ def getFormatSpecialFields(usePango=True):
 
 
 class Track:
-    """ A track and its associated tags """
+    """
+    A track and its associated tags. Each tag is stored in its own slot
+    (None if the tag is unknown) instead of a per-instance dictionary, and
+    strings shared by many tracks (artist, album, genre) are interned.
+    The labels and the search text of the track are cached in labelCache,
+    which must be reset to None when the tags change.
+    """
+
+    __slots__ = TAG_SLOTS + ('labelCache',)
 
     def __init__(self, resource=None, scheme=None):
         """ Constructor """
-        self.tags = {}
-
-        if scheme is not None:
-            self.tags[TAG_SCH] = scheme
-        if resource is not None:
-            self.tags[TAG_RES] = resource
+        for name in TAG_SLOTS:
+            setattr(self, name, None)
+        self.labelCache = None
+
+        self.scheme = scheme
+        self.resource = resource
+
+    @property
+    def tags(self):
+        """ A new dictionary with the known tags, keyed by the TAG_* constants """
+        values = [getattr(self, name) for name in TAG_SLOTS]
+        return {tag: value for (tag, value) in enumerate(values) if value is not None}
+
+    def setTags(self, tags):
+        """ Set the tags given in a dictionary like the one returned by self.tags """
+        for (tag, value) in tags.items():
+            if tag in INTERNED_TAGS:
+                value = intern(value)
+            setattr(self, TAG_SLOTS[tag], value)
+        self.labelCache = None
+
+    def __getstate__(self):
+        """ The state has the same format as before the introduction of slots """
+        return {'tags': self.tags}
+
+    def __setstate__(self, state):
+        Track.__init__(self)
+        self.setTags(state['tags'])
 
     def setNumber(self, nb):
-        self.tags[TAG_NUM] = nb
+        self.number = nb
 
     def setTitle(self, title):
-        self.tags[TAG_TIT] = title
+        self.title = title
 
     def setArtist(self, artist):
-        self.tags[TAG_ART] = artist
+        self.artist = intern(artist)
 
     def setAlbum(self, album):
-        self.tags[TAG_ALB] = album
+        self.album = intern(album)
 
     def setLength(self, length):
-        self.tags[TAG_LEN] = length
+        self.length = length
 
     def setAlbumArtist(self, albumArtist):
-        self.tags[TAG_AAR] = albumArtist
+        self.albumArtist = intern(albumArtist)
 
     def setDiscNumber(self, discNumber):
-        self.tags[TAG_DNB] = discNumber
+        self.discNumber = discNumber
 
     def setGenre(self, genre):
-        self.tags[TAG_GEN] = genre
+        self.genre = intern(genre)
 
     def setDate(self, date):
-        self.tags[TAG_DAT] = date
+        self.date = date
 
     def setMBTrackId(self, id):
-        self.tags[TAG_MBT] = id
+        self.mbTrackId = id
 
     def setBitrate(self, bitrate):
-        self.tags[TAG_BTR] = bitrate
+        self.bitrate = bitrate
 
     def setSampleRate(self, sampleRate):
-        self.tags[TAG_SMP] = sampleRate
+        self.sampleRate = sampleRate
 
     def setVariableBitrate(self):
-        self.tags[TAG_MOD] = 1
+        self.encMode = 1
 
     def __get(self, tag, defaultValue):
-        """Return the value of tag if it exists, or return defaultValue
-
-        We cannot set self.__get to point to self.tags.get, because the Track
-        object has to be pickled.
-        """
-        return self.tags.get(tag, defaultValue)
+        """ Return the value of tag if it exists, or return defaultValue """
+        value = getattr(self, TAG_SLOTS[tag])
+        if value is None:
+            return defaultValue
+        return value
 
     def getFilePath(self):
-        return self.tags[TAG_RES]
+        return self.resource
+
+    def isLoaded(self):
+        """ Return whether the tags have been read """
+        return True
 
     def getNumber(self):
         return self.__get(TAG_NUM, consts.UNKNOWN_TRACK_NUMBER)
@@ -187,14 +305,13 @@ class Track:
 
     def getURI(self):
         """ Return the complete URI to the resource """
-        try:
-            return self.tags[TAG_SCH] + '://' + self.tags[TAG_RES]
-        except:
+        if self.scheme is None or self.resource is None:
             raise RuntimeError('The track is an unknown type of resource')
+        return self.scheme + '://' + self.resource
 
     def getFilename(self):
         """ Return the filename only, not the full path """
-        return os.path.split(self.tags[TAG_RES])[1]
+        return os.path.split(self.getFilePath())[1]
 
     def getExtendedAlbum(self):
         """ Return the album name plus the disc number, if any """
@@ -209,44 +326,14 @@ class Track:
 
     def format(self, fmtString):
         """ Replace the special fields in the given string by their corresponding value """
-        result = fmtString
-
-        result = result.replace('{path}', self.getFilePath())
-        result = result.replace('{album}', self.getAlbum())
-        result = result.replace('{track}', str(self.getNumber()))
-        result = result.replace('{title}', self.getTitle())
-        result = result.replace('{artist}', self.getArtist())
-        result = result.replace('{genre}', self.getGenre())
-        result = result.replace('{date}', str(self.getDate()))
-        result = result.replace('{disc}', str(self.getDiscNumber()))
-        result = result.replace('{bitrate}', self.getBitrate())
-        result = result.replace('{sample_rate}', str(self.getSampleRate()))
-        result = result.replace('{duration_sec}', str(self.getLength()))
-        result = result.replace('{duration_str}', sec2str(self.getLength()))
-
-        return result
+        return compileFormat(fmtString)(self)
 
     def formatHTMLSafe(self, fmtString):
         """
             Replace the special fields in the given string by their corresponding value
             Also ensure that the fields don't contain HTML special characters (&, <, >)
         """
-        result = fmtString
-
-        result = result.replace('{path}', tools.htmlEscape(self.getFilePath()))
-        result = result.replace('{album}', tools.htmlEscape(self.getAlbum()))
-        result = result.replace('{track}', str(self.getNumber()))
-        result = result.replace('{title}', tools.htmlEscape(self.getTitle()))
-        result = result.replace('{artist}', tools.htmlEscape(self.getArtist()))
-        result = result.replace('{genre}', tools.htmlEscape(self.getGenre()))
-        result = result.replace('{date}', str(self.getDate()))
-        result = result.replace('{disc}', str(self.getDiscNumber()))
-        result = result.replace('{bitrate}', self.getBitrate())
-        result = result.replace('{sample_rate}', self.getSampleRate())
-        result = result.replace('{duration_sec}', str(self.getLength()))
-        result = result.replace('{duration_str}', sec2str(self.getLength()))
-
-        return result
+        return compileFormat(fmtString, True)(self)
 
     def __addIfKnown(self, dic, key, tag, unknownValue):
         """ This is an helper function used by the getMPRISMetadata() function  """
@@ -279,33 +366,37 @@ class Track:
         """
         Return a treeview representation
         """
-        title = self.tags.get(TAG_TIT, '')
-        artist = self.tags.get(TAG_ART, '')
+        key = (parent_label, playing)
+        if self.labelCache is None:
+            self.labelCache = {}
+        elif key in self.labelCache:
+            return self.labelCache[key]
+        elif len(self.labelCache) >= LABEL_CACHE_SIZE:
+            self.labelCache.clear()
+
+        label = self.labelCache[key] = self.__makeLabel(parent_label, playing)
+        return label
+
+    def __makeLabel(self, parent_label, playing):
+        """ Build the label returned by get_label() """
+        title = self.title or ''
+        artist = self.artist or ''
 
         album = self.getExtendedAlbum()
         if album == consts.UNKNOWN_ALBUM:
             album = ''
 
-        number = self.tags.get(TAG_NUM, '')
+        number = self.number or ''
         length = self.getLength()
 
         if number:
             number = str(number).zfill(2)
 
-        # Delete whitespace at the end
-        connectors = ['the', 'and', '&', ',', '.', '?', '!', "'", ':', '-', ' ']
-
         if parent_label:
-            parent_label = parent_label.lower()
-            short_album = album.lower()
-            short_artist = artist.lower()
-            for connector in connectors:
-                parent_label = parent_label.replace(connector, '')
-                short_album = short_album.replace(connector, '')
-                short_artist = short_artist.replace(connector, '')
-            if short_album.strip() in parent_label:
+            parent_label = normalizeLabel(parent_label)
+            if normalizeLabel(album).strip() in parent_label:
                 album = ''
-            if short_artist.strip() in parent_label:
+            if normalizeLabel(artist).strip() in parent_label:
                 artist = ''
 
         if title:
@@ -324,17 +415,24 @@ class Track:
         return name
 
     def get_window_title(self):
-        title = self.tags.get(TAG_TIT, '')
-        artist = self.tags.get(TAG_ART, '')
+        title = self.__get(TAG_TIT, '')
+        artist = self.__get(TAG_ART, '')
 
         if not title:
             return self.getBasename()
         return ' - '.join([part for part in [artist, title] if part])
 
     def get_search_text(self):
-        return '|||'.join([self.getFilePath(), self.tags.get(TAG_TIT, ''),
-                           self.tags.get(TAG_ART, ''), self.getExtendedAlbum(),
-                           str(self.getLength()), str(self.tags.get(TAG_NUM, ''))]).lower()
+        """ Return the lower case text searched by the playlist, it is cached under the key None """
+        if self.labelCache is None:
+            self.labelCache = {}
+        elif None in self.labelCache:
+            return self.labelCache[None]
+
+        text = self.labelCache[None] = '|||'.join([
+            self.getFilePath(), self.__get(TAG_TIT, ''), self.__get(TAG_ART, ''), self.getExtendedAlbum(),
+            str(self.getLength()), str(self.__get(TAG_NUM, ''))]).lower()
+        return text
 
     def __repr__(self):
         return '<Track %s>' % self.get_window_title()
@@ -16,12 +16,71 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
-from pogo.media.track import Track
+from pogo import tools
+from pogo.media.track import Track, TAG_SLOTS
 
 
 class FileTrack(Track):
     """ A Track that has been created from a file """
 
-    def __init__(self, resource):
-        """ Constructor """
-        Track.__init__(self, resource, 'file')
+    # The path of a lazy track whose tags have not been read yet, else None
+    __slots__ = ('path',)
+
+    def __init__(self, resource, lazy=False):
+        """
+        Constructor. Lazy tracks only know their path, their tags are read
+        when they are accessed for the first time.
+        """
+        if lazy:
+            self.path = resource
+            self.labelCache = None
+        else:
+            Track.__init__(self, resource, 'file')
+            self.path = None
+
+    def __getattr__(self, name):
+        """ Only called for the unset tag slots of lazy tracks """
+        if name not in TAG_SLOTS or self.path is None:
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def __setstate__(self, state):
+        Track.__setstate__(self, state)
+        self.path = None
+
+    def isLoaded(self):
+        """ Return whether the tags have been read """
+        return self.path is None
+
+    def load(self):
+        """ Read the tags of a lazy track """
+        path = self.path
+        if path is not None:
+            from pogo import media
+            track = media.getTrackFromFile(path)
+            for name in TAG_SLOTS:
+                setattr(self, name, getattr(track, name))
+            self.labelCache = None
+            self.path = None
+
+    def getFilePath(self):
+        # Another thread may read the tags at the same time
+        return self.path or self.resource
+
+    def getURI(self):
+        """ Return the complete URI to the resource """
+        return 'file://' + self.getFilePath()
+
+    def get_label(self, parent_label=None, playing=False):
+        """
+        Return a treeview representation. Lazy tracks are shown by their
+        file name until their tags have been read.
+        """
+        if self.isLoaded():
+            return Track.get_label(self, parent_label, playing)
+
+        label = tools.htmlEscape(self.getBasename())
+        if playing:
+            label = '<b>%s</b>' % label
+        return label
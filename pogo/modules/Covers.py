@@ -23,6 +23,7 @@ import traceback
 
 from pogo import modules
 from pogo import tools
+from pogo.media import library
 from pogo.tools import consts, prefs
 from pogo.tools.log import logger
 
@@ -110,10 +111,10 @@ class Covers(modules.ThreadedModule):
         """ Return the path to a cover file in trackPath, None if no cover found """
         # Create a dictionary with candidates
         candidates = {}
-        for (file, path) in tools.listDir(trackPath, True):
-            (name, ext) = os.path.splitext(file.lower())
-            if ext in ACCEPTED_FILE_FORMATS:
-                candidates[name] = path
+        for entry in tools.scanDir(trackPath, True):
+            (name, ext) = os.path.splitext(entry.name.lower())
+            if ext in ACCEPTED_FILE_FORMATS and entry.is_file():
+                candidates[name] = entry.path
 
         # Check each possible name using the its index in the list as its priority
         for name in prefs.get(__name__, 'user-cover-filenames', PREFS_DFT_USER_COVER_FILENAMES):
@@ -304,7 +305,16 @@ class Covers(modules.ThreadedModule):
         # Should we check for a user cover?
         if (not prefs.get(__name__, 'download-covers', PREFS_DFT_DOWNLOAD_COVERS) or
                 prefs.get(__name__, 'prefer-user-covers', PREFS_DFT_PREFER_USER_COVERS)):
-            rawCover = self.getUserCover(os.path.dirname(track.getFilePath()))
+            trackPath = os.path.dirname(track.getFilePath())
+            rawCover = self.getUserCover(trackPath)
+
+            # Other directories of the album may contain a cover
+            if rawCover is None:
+                for albumPath in library.getAlbumDirs(artist, album):
+                    if albumPath != trackPath:
+                        rawCover = self.getUserCover(albumPath)
+                        if rawCover is not None:
+                            break
 
         # Is it in our cache?
         if rawCover is None:
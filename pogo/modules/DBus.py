@@ -23,7 +23,6 @@ import dbus
 import dbus.service
 from gi.repository import GObject
 
-from pogo import media
 from pogo import modules
 
 from pogo.tools import consts, log, prefs
@@ -233,8 +232,8 @@ class DBusObjectTracklist(dbus.service.Object):
         if decodedURI.startswith('file://'):
             GObject.idle_add(
                 modules.postMsg,
-                consts.MSG_CMD_TRACKLIST_ADD,
-                {'tracks': [media.getTrackFromFile(decodedURI[7:])], 'playNow': playNow})
+                consts.MSG_EVT_LOAD_TRACKS,
+                {'paths': [decodedURI[7:]], 'playNow': playNow})
             return 0
 
         return 1
@@ -273,8 +272,8 @@ class DBusObjectTracklist(dbus.service.Object):
         # uris is a DBus array we want a Python list
         # We add the empty string to convert the uris from DBus.String to unicode
         paths = [uri + '' for uri in uris]
-        GObject.idle_add(modules.postMsg, consts.MSG_CMD_TRACKLIST_ADD,
-                         {'tracks': media.getTracks(paths), 'playNow': playNow})
+        GObject.idle_add(modules.postMsg, consts.MSG_EVT_LOAD_TRACKS,
+                         {'paths': paths, 'playNow': playNow})
 
     @dbus.service.method(consts.dbusInterface, in_signature='asb', out_signature='')
     def SetTracks(self, uris, playNow):
@@ -282,8 +281,11 @@ class DBusObjectTracklist(dbus.service.Object):
         # uris is a DBus array we want a Python list
         # We add the empty string to convert the uris from DBus.String to unicode
         paths = [uri + '' for uri in uris]
-        GObject.idle_add(modules.postMsg, consts.MSG_CMD_TRACKLIST_SET,
-                         {'tracks': media.getTracks(paths), 'playNow': playNow})
+        # Stop loading the old tracks and load the new ones in the background
+        GObject.idle_add(modules.postMsg, consts.MSG_CMD_CANCEL_LOADING)
+        GObject.idle_add(modules.postMsg, consts.MSG_CMD_TRACKLIST_CLR)
+        GObject.idle_add(modules.postMsg, consts.MSG_EVT_LOAD_TRACKS,
+                         {'paths': paths, 'playNow': playNow})
 
 
 class DBusObjectPlayer(dbus.service.Object):
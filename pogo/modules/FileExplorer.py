@@ -21,7 +21,6 @@ from gettext import gettext as _
 import itertools
 import locale
 import os
-from os.path import isdir, isfile
 import urllib.error
 import urllib.parse
 import urllib.request
@@ -218,18 +217,18 @@ class FileExplorer(modules.Module):
         mediaFiles = []
         directories = []
 
-        for (file, path) in tools.listDir(directory):
+        for entry in tools.scanDir(directory):
             # Make directory names prettier
             junk = ['_']
-            pretty_name = file
+            pretty_name = entry.name
             for item in junk:
                 pretty_name = pretty_name.replace(item, ' ')
 
-            if isdir(path):
-                directories.append((icons.dirMenuIcon(), tools.htmlEscape(pretty_name), TYPE_DIR, path))
-            elif isfile(path):
-                if media.isSupported(file):
-                    mediaFiles.append((icons.mediaFileMenuIcon(), tools.htmlEscape(pretty_name), TYPE_FILE, path))
+            if entry.is_dir():
+                directories.append((icons.dirMenuIcon(), tools.htmlEscape(pretty_name), TYPE_DIR, entry.path))
+            elif entry.is_file():
+                if media.isSupported(entry.name):
+                    mediaFiles.append((icons.mediaFileMenuIcon(), tools.htmlEscape(pretty_name), TYPE_FILE, entry.path))
 
         # Individually sort each type of file by name
         mediaFiles.sort(key=self._filename)
@@ -263,14 +262,13 @@ class FileExplorer(modules.Module):
             if self.tree.getItem(child, ROW_TYPE) != TYPE_DIR:
                 break
 
-            # Make sure it's readable
+            # Unreadable directories have no entries
             directory = self.tree.getItem(child, ROW_FULLPATH)
             hasContent = False
-            if os.access(directory, os.R_OK | os.X_OK):
-                for (file, path) in tools.listDir(directory):
-                    if isdir(path) or (isfile(path) and media.isSupported(file)):
-                        hasContent = True
-                        break
+            for entry in tools.scanDir(directory):
+                if entry.is_dir() or (entry.is_file() and media.isSupported(entry.name)):
+                    hasContent = True
+                    break
 
             # Append/remove children if needed
             if hasContent and self.tree.getNbChildren(child) == 0:
@@ -648,7 +646,11 @@ class FileExplorer(modules.Module):
         music_paths = self.get_music_paths_from_tree()
         modules.postMsg(consts.MSG_EVT_MUSIC_PATHS_CHANGED, {'paths': music_paths})
 
+        # Tracks of the current drag'n'drop operation that are read in the background
+        self.preloadJob = None
+
         self.tree.connect('drag-begin', self.onDragBegin)
+        self.tree.connect('drag-failed', self.onDragFailed)
 
     def onAppQuit(self):
         """ The module is going to be unloaded """
@@ -717,6 +719,13 @@ class FileExplorer(modules.Module):
         modules.postMsg(consts.MSG_CMD_FILE_EXPLORER_DRAG_BEGIN, {'paths': paths})
 
         # Preload the tracks to speedup their addition to the playlist.
-        import threading
-        crawler = threading.Thread(target=media.preloadTracks, args=(paths,))
-        crawler.start()
+        if self.preloadJob is not None:
+            self.preloadJob.cancel()
+        self.preloadJob = media.preloadTracks(paths)
+
+    def onDragFailed(self, tree, context, result):
+        """ The drag'n'drop operation has been aborted, stop preloading its tracks """
+        if self.preloadJob is not None:
+            self.preloadJob.cancel()
+            self.preloadJob = None
+        return False
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+import logging
+import os
+import threading
+
+from gi.repository import GObject
+
+from pogo import modules
+from pogo.media import library
+from pogo.tools import consts
+
+
+# Module information
+MOD_INFO = ('Library', 'Index the music folders in the background', '', [], True, False)
+
+# Seconds between two rescans of the music folders
+RESCAN_INTERVAL = 30 * 60
+
+# Niceness of the thread that scans the music folders
+RESCAN_NICENESS = 19
+
+# Files are parsed in the scanning thread, so that rescans run with its
+# low priority and don't compete with the worker pool of the TrackLoader
+RESCAN_WORKERS = 1
+
+# Seconds to sleep after each batch of parsed files
+RESCAN_THROTTLE = 0.05
+
+
+class Library(modules.ThreadedModule):
+
+    def __init__(self):
+        handlers = {
+            consts.MSG_EVT_APP_STARTED: self.onAppStarted,
+            consts.MSG_EVT_MUSIC_PATHS_CHANGED: self.onPathsChanged,
+        }
+        modules.ThreadedModule.__init__(self, handlers)
+
+        # The most recent music folders, None once the module is stopping
+        self.latestPaths = []
+
+    def run(self):
+        """ Lower the priority of the thread, then handle the messages """
+        try:
+            # On Linux, this only affects the calling thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), RESCAN_NICENESS)
+        except (AttributeError, OSError) as error:
+            logging.info('Cannot lower the priority of the library thread: %s' % error)
+        modules.ThreadedModule.run(self)
+
+    def postMsg(self, msg, params={}):
+        """ Enqueue a message, stop indexing if the paths have changed or the application quits """
+        if msg == consts.MSG_EVT_MUSIC_PATHS_CHANGED:
+            self.latestPaths = params['paths']
+        elif msg in (consts.MSG_EVT_APP_QUIT, consts.MSG_EVT_MOD_UNLOADED):
+            self.latestPaths = None
+        modules.ThreadedModule.postMsg(self, msg, params)
+
+    def index(self, paths):
+        """ Index the music folders unless they have changed again meanwhile """
+        def isCancelled():
+            return self.latestPaths is not paths
+
+        def onProgress(done, total):
+            modules.postMsg(consts.MSG_EVT_LIBRARY_SCAN_PROGRESS, {'folder': path, 'done': done, 'total': total})
+
+        if isCancelled():
+            return
+        library.setFolders(paths)
+        for path in paths:
+            if not library.index(path, isCancelled, onProgress, RESCAN_WORKERS, RESCAN_THROTTLE):
+                break
+        modules.postMsg(consts.MSG_EVT_LIBRARY_SCAN_FINISHED)
+
+    def rescan(self):
+        """ Rescan the music folders in the thread of the module """
+        if self.latestPaths:
+            self.threadExecute(self.index, self.latestPaths)
+        return True
+
+    # --== Message handlers ==--
+
+    def onAppStarted(self):
+        """ Rescan the music folders regularly """
+        GObject.timeout_add_seconds(RESCAN_INTERVAL, self.rescan)
+
+    def onPathsChanged(self, paths):
+        """ The music folders have changed """
+        self.index(paths)
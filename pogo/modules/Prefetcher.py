@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+import collections
+import threading
+
+from pogo import modules
+from pogo import media
+from pogo.tools import consts
+
+
+# Module information
+MOD_INFO = ('Prefetcher', 'Read the tags of lazy tracks in the background', '', [], True, False)
+
+# Number of tracks that are read before the tracklist is updated
+BATCH_SIZE = 50
+
+
+class Prefetcher(modules.ThreadedModule):
+
+    def __init__(self):
+        handlers = {
+            consts.MSG_CMD_PREFETCH_TRACKS: self.onPrefetchTracks,
+        }
+        modules.ThreadedModule.__init__(self, handlers)
+
+        # Tracks waiting to be read, shared with the GTK main loop
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+
+    def postMsg(self, msg, params={}):
+        """ Enqueue a message, let urgent tracks jump the queue """
+        if msg == consts.MSG_CMD_PREFETCH_TRACKS:
+            with self.lock:
+                if params.get('urgent', False):
+                    self.pending.extendleft(reversed(params['tracks']))
+                else:
+                    self.pending.extend(params['tracks'])
+            params = {}
+        modules.ThreadedModule.postMsg(self, msg, params)
+
+    def nextBatch(self):
+        """ Return the next tracks whose tags have not been read yet """
+        batch = []
+        with self.lock:
+            while self.pending and len(batch) < BATCH_SIZE:
+                track = self.pending.popleft()
+                if not track.isLoaded():
+                    batch.append(track)
+        return batch
+
+    def onPrefetchTracks(self):
+        """ Read the tags of all pending tracks, batch by batch """
+        batch = self.nextBatch()
+        while batch:
+            # Parse the files in parallel, the tracks then load their tags from the cache
+            list(media.getTracksFromFiles([track.getFilePath() for track in batch]))
+            for track in batch:
+                track.load()
+            modules.postMsg(consts.MSG_EVT_TRACKS_PREFETCHED, {'tracks': batch})
+            batch = self.nextBatch()
@@ -30,6 +30,7 @@ from gi.repository import Gtk
 from pogo import tools
 from pogo import modules
 from pogo import media
+from pogo.media import library
 from pogo.tools import consts
 
 search_text = _('Search in your music folders')
@@ -125,9 +126,12 @@ class Search(modules.ThreadedModule):
                 search.kill()
         self.searches = []
 
-    def filter_results(self, results, search_path, regex):
+    def filter_results(self, results, search_path, regex, known_dirs=None):
         '''
         Remove subpaths of parent directories
+
+        If known_dirs is given, it contains all directories in results and
+        the file system is not accessed.
         '''
         def same_case_bold(match):
             return 'STARTBOLD%sENDBOLD' % match.group(0)
@@ -164,7 +168,12 @@ class Search(modules.ThreadedModule):
             if not is_subpath:
                 name = get_name(path)
 
-                if os.path.isdir(path):
+                if known_dirs is None:
+                    is_dir = os.path.isdir(path)
+                else:
+                    is_dir = path in known_dirs
+
+                if is_dir:
                     dirs.append((path, name))
                 elif media.isSupported(path):
                     files.append((path, name))
@@ -172,7 +181,9 @@ class Search(modules.ThreadedModule):
         return (dirs, files)
 
     def cache_dirs(self, keep_caching):
-        for index, path in enumerate(self.paths):
+        # Indexed music folders need no caching
+        paths = [path for path in self.paths if not library.isIndexed(path)]
+        for index, path in enumerate(paths):
             # Cache dirs one by one after a small timeout
             GObject.timeout_add_seconds(3 * index, self.search_dir, path,
                                         CACHE_QUERY)
@@ -229,13 +240,19 @@ class Search(modules.ThreadedModule):
             if dir == consts.dirBaseUsr and self.found_something:
                 break
 
-            results = self.search_dir(dir, query)
+            # Query the library index instead of the file system if possible
+            known_dirs = None
+            if library.isIndexed(dir):
+                results, known_dirs = library.search(dir, query)
+                logging.info('Results for %s in index of %s: %s' % (query, dir, len(results)))
+            else:
+                results = self.search_dir(dir, query)
 
             # Check if search has been aborted during searching
             if results is None or self.should_stop:
                 break
 
-            dirs, files = self.filter_results(results, dir, regex)
+            dirs, files = self.filter_results(results, dir, regex, known_dirs)
             if not self.should_stop and (dirs or files):
                 self.found_something = True
                 modules.postMsg(consts.MSG_EVT_SEARCH_APPEND,
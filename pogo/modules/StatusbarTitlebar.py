@@ -37,13 +37,22 @@ class StatusbarTitlebar(modules.Module):
             consts.MSG_EVT_UNPAUSED: self.onUnpaused,
             consts.MSG_EVT_NEW_TRACK: self.onNewTrack,
             consts.MSG_EVT_APP_STARTED: self.onAppStarted,
+            consts.MSG_EVT_LIBRARY_SCAN_PROGRESS: self.onLibraryScanProgress,
+            consts.MSG_EVT_LIBRARY_SCAN_FINISHED: self.onLibraryScanFinished,
+            consts.MSG_EVT_EXPORT_PROGRESS: self.onExportProgress,
         }
 
         modules.Module.__init__(self, handlers)
 
     def __updateTitlebar(self):
         """ Update the title bar """
-        if self.currTrack is None:
+        if self.currTrack is None and self.exportProgress is not None:
+            (done, total, throughput) = self.exportProgress
+            self.window.set_title('%s %s' % (consts.appName, _('[exporting %d/%d, %.1f MB/s]') % (
+                done, total, throughput / 1e6)))
+        elif self.currTrack is None and self.scanProgress is not None:
+            self.window.set_title('%s %s' % (consts.appName, _('[indexing %d/%d]') % self.scanProgress))
+        elif self.currTrack is None:
             self.window.set_title(consts.appName)
         elif self.paused:
             self.window.set_title('%s %s' % (self.currTrack.get_window_title(), _('[paused]')))
@@ -60,6 +69,12 @@ class StatusbarTitlebar(modules.Module):
         self.paused = False
         self.currTrack = None
 
+        # Progress (done, total) of the current library scan
+        self.scanProgress = None
+
+        # Progress (done, total, bytes per second) of the current export
+        self.exportProgress = None
+
     def onNewTrack(self, track):
         """ A new track is being played """
         self.paused = False
@@ -81,3 +96,18 @@ class StatusbarTitlebar(modules.Module):
         self.paused = False
         self.currTrack = None
         self.__updateTitlebar()
+
+    def onLibraryScanProgress(self, folder, done, total):
+        """ Some files of a music folder have been indexed """
+        self.scanProgress = (done, total)
+        self.__updateTitlebar()
+
+    def onLibraryScanFinished(self):
+        """ All music folders have been indexed """
+        self.scanProgress = None
+        self.__updateTitlebar()
+
+    def onExportProgress(self, done, total, throughput, finished):
+        """ Some files of the playlist have been exported """
+        self.exportProgress = None if finished else (done, total, throughput)
+        self.__updateTitlebar()
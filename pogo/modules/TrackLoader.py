@@ -16,24 +16,86 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
+import time
+
 from pogo import modules
 from pogo import media
-from pogo.tools import consts
+from pogo.tools import consts, log
 
 
 # Module information
 MOD_INFO = ('TrackLoader', 'Load tracks from disk asynchronously', '', [], True, False)
 MOD_NAME = MOD_INFO[modules.MODINFO_NAME]
 
+# Minimum number of seconds between two additions to the playlist. The
+# first chunk is always added immediately.
+POST_INTERVAL = 0.5
+
+# Insert the tracks before their tags are read, the Prefetcher module reads
+# them in the background and the labels are updated afterwards
+LAZY_LOADING = False
+
 
 class TrackLoader(modules.ThreadedModule):
 
     def __init__(self):
         handlers = {
             consts.MSG_EVT_LOAD_TRACKS: self.onLoadTracks,
+            consts.MSG_CMD_CANCEL_LOADING: lambda: None,
         }
         modules.ThreadedModule.__init__(self, handlers)
 
-    def onLoadTracks(self, paths):
+        # Loads started before the last cancellation are stopped
+        self.generation = 0
+        # Loads without a placeholder get negative ids, the ids of the placeholders of the tracktree are positive
+        self.lastLoadId = 0
+
+    def postMsg(self, msg, params={}):
+        """ Enqueue a message, handle cancellations immediately """
+        if msg == consts.MSG_CMD_CANCEL_LOADING:
+            # The loading thread is busy, so we cannot wait for it to handle the message
+            self.generation += 1
+        elif msg == consts.MSG_EVT_LOAD_TRACKS:
+            params = dict(params, generation=self.generation)
+        modules.ThreadedModule.postMsg(self, msg, params)
+
+    def onLoadTracks(self, paths, generation, playNow=True, highlight=False, loadId=None):
+        """
+        Add the tracks to the playlist chunk by chunk while they are loaded.
+        If loadId is given, the tracks replace the placeholder row that the
+        tracktree has inserted for this load. Otherwise, a new id is used,
+        so that the chunks of concurrent loads are not mixed up.
+        """
+        if loadId is None:
+            self.lastLoadId -= 1
+            loadId = self.lastLoadId
+
+        pending = None
+        lastPost = None
+
+        for chunk in media.iterTracks(paths, lazy=LAZY_LOADING):
+            if generation != self.generation:
+                log.logger.info('[%s] Loading cancelled' % MOD_NAME)
+                pending = None
+                break
+
+            if pending is None:
+                pending = chunk
+            else:
+                pending.extend(chunk)
+
+            now = time.monotonic()
+            if lastPost is None or now - lastPost >= POST_INTERVAL:
+                # Only the first tracks may start the playback
+                self.addTracks(pending, playNow and lastPost is None, highlight, loadId)
+                pending = None
+                lastPost = now
+
+        if pending is not None:
+            self.addTracks(pending, playNow and lastPost is None, highlight, loadId)
+
+        modules.postMsg(consts.MSG_EVT_LOAD_FINISHED, {'loadId': loadId})
+
+    def addTracks(self, tracks, playNow, highlight, loadId):
         modules.postMsg(consts.MSG_CMD_TRACKLIST_ADD,
-                        {'tracks': media.getTracks(paths), 'playNow': True})
+                        {'tracks': tracks, 'playNow': playNow, 'highlight': highlight, 'loadId': loadId})
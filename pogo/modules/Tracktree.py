@@ -18,17 +18,21 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
 
 from gettext import gettext as _
+import itertools
 import logging
 import os
+import pickle
+import time
 import traceback
 
 from gi.repository import Gdk, GdkPixbuf
 from gi.repository import GObject
 from gi.repository import Gtk
 
-from pogo import media, modules, tools
+from pogo import gui, media, modules, tools
 from pogo.gui import fileChooser
-from pogo.tools import consts, icons, prefs, pickleLoad, pickleSave, log
+from pogo.media import export, playlist, playlistIndex
+from pogo.tools import consts, icons, prefs, log, searchIndex
 from pogo.gui.widgets import TrackTreeView
 
 MOD_INFO = ('Tracktree', 'Tracktree', '', [], True, False)
@@ -43,6 +47,25 @@ MOD_INFO = ('Tracktree', 'Tracktree', '', [], True, False)
 
 SAVE_INTERVAL = 600
 
+# Size of the playlist journal in bytes above which it is merged into the saved playlist
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+# Seconds spent restoring the saved playlist before the main loop handles other events
+RESTORE_CHUNK_DURATION = 0.02
+
+# Number of rows visited by highlight() before the main loop handles other events
+HIGHLIGHT_BATCH_SIZE = 2000
+
+# Number of tracks above which insertDir() fills an empty playlist while it is detached from the view
+BULK_INSERT_SIZE = 1000
+
+# Number of files that are copied or transcoded at the same time when exporting the playlist
+PREFS_DFT_EXPORT_WORKERS = export.EXPORT_WORKERS
+PREFS_DFT_TRANSCODE_WORKERS = export.TRANSCODE_WORKERS
+
+# Bitrate of transcoded files in kbit/s
+PREFS_DFT_TRANSCODE_BITRATE = export.TRANSCODE_BITRATE
+
 # Internal d'n'd (reordering)
 DND_REORDERING_ID = 1024
 DND_INTERNAL_TARGET = (consts.DND_INTERNAL_TARGET_NAME, Gtk.TargetFlags.SAME_WIDGET, DND_REORDERING_ID)
@@ -72,66 +95,149 @@ class Tracktree(modules.Module):
             consts.MSG_CMD_FILE_EXPLORER_DRAG_BEGIN: self.onDragBegin,
             consts.MSG_EVT_SEARCH_START: self.onSearchStart,
             consts.MSG_EVT_SEARCH_RESET: self.onSearchReset,
+            consts.MSG_EVT_LOAD_TRACKS: self.onLoadTracks,
+            consts.MSG_EVT_LOAD_FINISHED: self.onLoadFinished,
+            consts.MSG_EVT_TRACKS_PREFETCHED: self.onTracksPrefetched,
         }
 
         modules.Module.__init__(self, handlers)
 
-    def getTreeDump(self, path=None):
-        """ Recursively dump the given tree starting at path (None for the root of the tree) """
-        list = []
-
-        for child in self.tree.iterChildren(path):
-            row = self.tree.getRow(child)
-
-            if self.tree.getNbChildren(child) == 0:
-                grandChildren = None
-            else:
-                grandChildren = self.getTreeDump(child)
-
-            name = row[ROW_NAME].replace('<b>', '').replace('</b>', '')
-
-            list.append([(name, row[ROW_TRK]), grandChildren])
-
-        return list
+    def iterRestoredRows(self, dump, parentRef=None, prevRef=None, lazyTracks=None):
+        """
+        Recursively insert the items of the dump after the row of prevRef,
+        or as the first children of the row of parentRef (None for the root
+        of the tree) if prevRef is None. Yield after each inserted row.
+        Tracks whose tags have not been read yet are appended to lazyTracks.
 
-    def restoreTreeDump(self, dump, parent=None):
-        """ Recursively restore the dump under the given parent (None for the root of the tree) """
+        Rows are located through references instead of iters, so that the
+        playlist may be modified between two rows.
+        """
+        model = self.tree.store
         for item in dump:
             (name, track) = item[0]
 
-            if track:
-                self.tree.appendRow((icons.nullMenuIcon(), name, track), parent)
+            if parentRef is None:
+                parent = None
+            elif parentRef.valid():
+                parent = model.get_iter(parentRef.get_path())
             else:
-                newNode = self.tree.appendRow((icons.mediaDirMenuIcon(), name, None), parent)
-
-                if item[1] is not None:
-                    if len(item[1]) != 0:
-                        # We must expand the row before adding the real children,
-                        # but this works only if there is already at least one child
-                        self.restoreTreeDump(item[1], newNode)
+                # The parent has been removed meanwhile
+                return
 
-    def select_last_played_track(self):
-        last_path = prefs.get(__name__, 'last-played-track', None)
-        if last_path:
-            parent_path = (last_path[0],)
-            GObject.idle_add(self.tree.scroll_to_cell, parent_path)
-            self.tree.get_selection().select_path(parent_path)
-
-    def getTrackDir(self, root=None):
-        flat = False if root else True
-        name = self.tree.getLabel(root) if root else 'playtree'
-        name = name.replace('<b>', '').replace('</b>', '')
-        trackdir = media.TrackDir(name=name, flat=flat)
-
-        for iter in self.tree.iter_children(root):
-            track = self.tree.getTrack(iter)
-            if track:
-                trackdir.tracks.append(track)
+            if prevRef is None:
+                position = 0
+            elif prevRef.valid():
+                position = prevRef.get_path().get_indices()[-1] + 1
             else:
-                subdir = self.getTrackDir(iter)
-                trackdir.subdirs.append(subdir)
-
-        return trackdir
+                position = -1
+
+            icon = icons.nullMenuIcon() if track else icons.mediaDirMenuIcon()
+            self.restoringRow = True
+            newNode = model.insert(parent, position, (icon, name, track))
+            self.restoringRow = False
+            self.indexRow(newNode)
+            if track and lazyTracks is not None and not track.isLoaded():
+                lazyTracks.append(track)
+            prevRef = Gtk.TreeRowReference(model, model.get_path(newNode))
+            yield
+
+            if not track and item[1]:
+                yield from self.iterRestoredRows(item[1], prevRef, None, lazyTracks)
+
+    def restoreTreeDump(self, dump, journaled=False):
+        """
+        Restore the top-level item of the last played track right away,
+        the other items are restored in chunks while the main loop is idle.
+        The restored rows are already in the saved playlist, so they are
+        only journaled if journaled is True (e.g., to convert the saved
+        playlist) or once the playlist is modified during the restore.
+        """
+        start = time.monotonic()
+        self.restoreJournaled = journaled
+        if journaled:
+            self.journal.append((playlist.JOURNAL_RESTORE_START,))
+        last_path = prefs.get(__name__, 'last-played-track', None)
+        current = last_path[0] if last_path and last_path[0] < len(dump) else 0
+
+        lazyTracks = []
+        for _row in self.iterRestoredRows(dump[current:current + 1], lazyTracks=lazyTracks):
+            pass
+        currentIter = self.tree.get_first_iter()
+        currentRef = Gtk.TreeRowReference(self.tree.store, self.tree.store.get_path(currentIter))
+        self.tree.get_selection().select_iter(currentIter)
+        self.prefetchRestoredTracks(lazyTracks)
+        self.onListModified()
+        log.logger.info('[%s] Restored the current album in %.3fs' % (
+            MOD_INFO[modules.MODINFO_NAME], time.monotonic() - start))
+
+        # The items after the current one are needed first for playing
+        rows = itertools.chain(
+            self.iterRestoredRows(dump[current + 1:], None, currentRef, lazyTracks),
+            self.iterRestoredRows(dump[:current], None, None, lazyTracks))
+        self.restoring = rows
+        GObject.idle_add(self.restoreChunk, rows, lazyTracks, currentRef, start)
+
+    def restoreChunk(self, rows, lazyTracks, currentRef, start):
+        """ Restore rows for RESTORE_CHUNK_DURATION seconds, return True until all of them have been restored """
+        if rows is not self.restoring:
+            # The playlist has been replaced or saved meanwhile
+            return False
+
+        deadline = time.monotonic() + RESTORE_CHUNK_DURATION
+        for _row in rows:
+            if time.monotonic() >= deadline:
+                self.prefetchRestoredTracks(lazyTracks)
+                return True
+
+        # The tracklist is only sent once, since each update walks the whole playlist
+        self.stopRestore()
+        self.prefetchRestoredTracks(lazyTracks)
+        self.onListModified()
+        if currentRef.valid():
+            self.tree.scroll_to_cell(currentRef.get_path())
+        log.logger.info('[%s] Restored playlist in %.3fs' % (MOD_INFO[modules.MODINFO_NAME], time.monotonic() - start))
+
+        # Merge the journaled rows, if any, into the saved playlist
+        self.journal.compact()
+        return False
+
+    def prefetchRestoredTracks(self, lazyTracks):
+        """ Read the tags of the restored tracks in the background """
+        # The labels have been saved, the tags are only needed for the playtime and the search
+        if lazyTracks:
+            modules.postMsg(consts.MSG_CMD_PREFETCH_TRACKS, {'tracks': list(lazyTracks)})
+            del lazyTracks[:]
+
+    def stopRestore(self, cancelled=False):
+        """ The restore has been finished or cancelled, the journal describes the tree again """
+        if self.restoring is not None:
+            if cancelled and not self.restoreJournaled:
+                # The saved playlist contains the rows that will not be restored
+                self.journalRestoredRows()
+            self.restoring = None
+            if self.restoreJournaled:
+                self.journal.append((playlist.JOURNAL_RESTORE_END,))
+
+    def journalRestoredRows(self):
+        """ Journal the rows of the partially restored playlist, the next records are relative to them """
+        self.restoreJournaled = True
+        self.journal.append((playlist.JOURNAL_RESTORE_START,))
+
+        def addRows(parent, parentPath):
+            for (index, iter) in enumerate(self.tree.iter_children(parent)):
+                path = parentPath + (index,)
+                self.journal.append((playlist.JOURNAL_INSERT, path, self.getJournalValue(iter)))
+                addRows(iter, path)
+
+        addRows(None, ())
+
+    def finishRestore(self):
+        """ Restore the remaining rows of the saved playlist right away """
+        if self.restoring is not None:
+            for _row in self.restoring:
+                pass
+            self.stopRestore()
+            self.onListModified()
 
     def get_m3u_text(self, root=None):
         text = ''
@@ -139,44 +245,54 @@ class Tracktree(modules.Module):
             track = self.tree.getTrack(iter)
             if track:
                 text += '%s\n' % track.getFilePath()
-            else:
+            elif not self.isPlaceholder(iter):
                 dirname = self.tree.getLabel(iter).replace('<b>', '').replace('</b>', '')
                 text += '# %s\n%s\n' % (dirname, self.get_m3u_text(iter))
         return text
 
+    def isPlaceholder(self, iter):
+        """ Return whether the row stands for tracks that are still being loaded """
+        return self.tree.getItem(iter, ROW_ICO) == icons.infoMenuIcon()
+
+    def addPlaceholder(self, paths, target=None, drop_mode=None):
+        """ Insert a row marking where the tracks from paths will be inserted, return its load id """
+        name = tools.htmlEscape(tools.dirname(paths[0]))
+        if len(paths) > 1:
+            name += ', ...'
+        label = '%s  <span size="smaller" foreground="#909090">%s</span>' % (name, _('loading...'))
+
+        new = self.tree.insert(target, (icons.infoMenuIcon(), label, None), drop_mode)
+        self.lastLoadId += 1
+        self.placeholders[self.lastLoadId] = Gtk.TreeRowReference(self.tree.store, self.tree.store.get_path(new))
+        return self.lastLoadId
+
+    def getPlaceholder(self, loadId):
+        """ Return the iter of the placeholder row of the given load, or None """
+        ref = self.placeholders.get(loadId)
+        if ref is None or not ref.valid():
+            return None
+        return self.tree.store.get_iter(ref.get_path())
+
+    def getMarkPath(self):
+        """ Return the path (as a tuple) of the marked row, or None if there is none """
+        if self.tree.hasMark():
+            return tuple(self.tree.mark.get_path().get_indices())
+        return None
+
     def __getNextTrackIter(self):
-        """ Return the index of the next track, or -1 if there is none """
-        next = None
-        while True:
-            next = self.tree.get_next_iter(next)
-            if not next:
-                return None
-
-            # Check track
-            error = self.tree.getItem(next, ROW_ICO) == icons.errorMenuIcon()
-            track = self.tree.getItem(next, ROW_TRK)
-            if track and not error:
-                # Row is not a directory
-                return next
+        """ Return the iter of the next track, or None if there is none """
+        return self.playlistIndex.getNext(self.getMarkPath())
 
     def __hasNextTrack(self):
         """ Return whether there is a next track """
         return self.__getNextTrackIter() is not None
 
     def __getPreviousTrackIter(self):
-        """ Return the index of the previous track, or -1 if there is none """
-        prev = None
-        while True:
-            prev = self.tree.get_prev_iter(prev)
-            if not prev:
-                return None
-
-            # Check track
-            error = self.tree.getItem(prev, ROW_ICO) == icons.errorMenuIcon()
-            track = self.tree.getItem(prev, ROW_TRK)
-            if track and not error:
-                # Row is not a directory
-                return prev
+        """ Return the iter of the previous track, or None if there is none """
+        path = self.getMarkPath()
+        if path is None:
+            return None
+        return self.playlistIndex.getPrevious(path)
 
     def __hasPreviousTrack(self):
         """ Return whether there is a previous track """
@@ -221,10 +337,7 @@ class Tracktree(modules.Module):
             self.tree.expand(iter)
         else:
             self.tree.setLabel(iter, label)
-            icon = self.tree.getItem(iter, ROW_ICO)
-            has_error = (icon == icons.errorMenuIcon())
-            is_dir = (icon == icons.mediaDirMenuIcon())
-            if not is_dir and not has_error:
+            if track not in self.playlistIndex.failed:
                 self.tree.setItem(iter, ROW_ICO, icons.nullMenuIcon())
 
     def jumpTo(self, iter, sendPlayMsg=True, forced=True):
@@ -246,6 +359,9 @@ class Tracktree(modules.Module):
             self.jumpTo(self.__getNextTrackIter())
             return
 
+        # Restored tracks only know their label, read the tags of the playing one right away
+        if not track.isLoaded():
+            track.load()
         self.set_track_playing(iter, True)
         self.paused = False
 
@@ -255,18 +371,31 @@ class Tracktree(modules.Module):
         modules.postMsg(consts.MSG_EVT_NEW_TRACK, {'track': track})
         modules.postMsg(consts.MSG_EVT_TRACK_MOVED, {'hasPrevious': self.__hasPreviousTrack(), 'hasNext': self.__hasNextTrack()})
 
-    def insert(self, tracks, target=None, drop_mode=None, playNow=True, highlight=False):
+    def insert(self, tracks, target=None, drop_mode=None, playNow=True, highlight=False, loadId=None):
         if type(tracks) == list:
             trackdir = media.TrackDir(None, flat=True)
             trackdir.tracks = tracks
             tracks = trackdir
 
+        if loadId in self.placeholders:
+            # Fill the placeholder row of the load, keep the selection of
+            # the previous chunks
+            placeholder = self.getPlaceholder(loadId)
+            if placeholder is not None:
+                target = placeholder
+                drop_mode = Gtk.TreeViewDropPosition.BEFORE
+        else:
+            self.tree.get_selection().unselect_all()
+
         children_before = self.tree.store.iter_n_children(target)
 
-        self.tree.get_selection().unselect_all()
-        self.insertDir(tracks, target, drop_mode, highlight)
+        lazyTracks = []
+        self.insertDir(tracks, target, drop_mode, highlight, lazyTracks, loadId)
         self.onListModified()
 
+        if lazyTracks:
+            modules.postMsg(consts.MSG_CMD_PREFETCH_TRACKS, {'tracks': lazyTracks})
+
         # We only want to start playback if tracks are appended from DBus
         # or appended (not inserted) into the playlist.
         # In that case target is None. Also don't interrupt playing songs.
@@ -281,62 +410,84 @@ class Tracktree(modules.Module):
                 # If new is None, the tracks could not be added
                 self.jumpTo(new)
 
-    def insertDir(self, trackdir, target=None, drop_mode=None, highlight=False):
+    def insertDir(self, trackdir, target=None, drop_mode=None, highlight=False, lazyTracks=None, loadId=None):
         '''
-        Insert a directory recursively, return the iter of the first
-        added element
+        Insert a directory recursively. Tracks whose tags have not been
+        read yet are appended to lazyTracks. loadId identifies the load
+        whose previous chunk contains the directory of continued chunks.
         '''
-        model = self.tree.store
-        if trackdir.flat:
-            new = target
-        else:
-            string = trackdir.dirname.replace('_', ' ')
-            string = tools.htmlEscape(string)
-            source_row = (icons.mediaDirMenuIcon(), string, None)
-
-            new = self.tree.insert(target, source_row, drop_mode)
-            drop_mode = Gtk.TreeViewDropPosition.INTO_OR_AFTER
-            if highlight:
-                self.tree.select(new)
+        (parent, position) = self.tree.get_insert_position(target, drop_mode)
+        parentLabel = self.tree.getLabel(parent) if parent else None
 
-        dest = new
-        for index, subdir in enumerate(trackdir.subdirs):
-            drop = drop_mode if index == 0 else Gtk.TreeViewDropPosition.AFTER
-            dest = self.insertDir(subdir, dest, drop, highlight)
+        # The view updates itself for each row of an attached model, build
+        # large playlists while it is detached. Only an empty playlist can
+        # be detached, since the view forgets its expanded rows.
+        detach = len(trackdir) >= BULK_INSERT_SIZE and len(self.tree.store) == 0
+        if detach:
+            self.tree.set_model(None)
 
-        dest = new
-        for index, track in enumerate(trackdir.tracks):
-            drop = drop_mode if index == 0 else Gtk.TreeViewDropPosition.AFTER
-            highlight &= trackdir.flat
-            dest = self.insertTrack(track, dest, drop, highlight)
+        albums = []
+        self.insertRows(trackdir, parent, position, parentLabel, highlight, lazyTracks, albums, loadId)
 
-        if not trackdir.flat:
-            # Open albums on the first layer
-            if target is None or model.iter_depth(new) == 0:
-                self.tree.expand(new)
+        if detach:
+            self.tree.set_model(self.tree.store)
 
-        return new
+        # Open albums on the first layer
+        for album in albums:
+            self.tree.expand(album)
 
-    def insertTrack(self, track, target=None, drop_mode=None, highlight=False):
+    def insertRows(self, trackdir, parent, position, parentLabel, highlight, lazyTracks, albums, loadId):
         '''
-        Insert a new track into the tracktree under parentPath
+        Insert the rows of a directory at position under parent (-1 appends
+        them), return the position after the inserted rows. The labels are
+        computed once per directory. New directories on the first layer are
+        appended to albums.
         '''
-        length = track.getLength()
-        self.playtime += length
-
-        name = track.get_label()
+        model = self.tree.store
+        if trackdir.flat:
+            (dirIter, childPosition, dirLabel) = (parent, position, parentLabel)
+        elif trackdir.continued and loadId in self.lastDirs and self.lastDirs[loadId].valid():
+            # Append the tracks to the directory node created for the previous chunk of the load
+            dirIter = model.get_iter(self.lastDirs[loadId].get_path())
+            (childPosition, dirLabel) = (-1, self.tree.getLabel(dirIter))
+        else:
+            dirLabel = trackdir.dirname.replace('_', ' ')
+            dirIter = model.insert(parent, position, (icons.mediaDirMenuIcon(), tools.htmlEscape(dirLabel), None))
+            self.indexRow(dirIter)
+            if loadId is not None:
+                self.lastDirs[loadId] = Gtk.TreeRowReference(model, model.get_path(dirIter))
+            childPosition = -1
+            if position >= 0:
+                position += 1
+            if parent is None:
+                albums.append(dirIter)
+            if highlight:
+                self.tree.select(dirIter)
+
+        for subdir in trackdir.subdirs:
+            childPosition = self.insertRows(
+                subdir, dirIter, childPosition, dirLabel, highlight, lazyTracks, albums, loadId)
+
+        highlight &= trackdir.flat
+        for track in trackdir.tracks:
+            if track.isLoaded():
+                self.playtime += track.getLength()
+
+            icon = icons.errorMenuIcon() if track in self.playlistIndex.failed else icons.nullMenuIcon()
+            new = model.insert(dirIter, childPosition, (icon, track.get_label(dirLabel), track))
+            if childPosition >= 0:
+                childPosition += 1
+            self.indexRow(new)
+            if highlight:
+                self.tree.select(new)
+            if lazyTracks is not None and not track.isLoaded():
+                # The same track object may be in the playlist several times
+                self.lazyRows.setdefault(track, []).append(Gtk.TreeRowReference(model, model.get_path(new)))
+                lazyTracks.append(track)
 
-        row = (icons.nullMenuIcon(), name, track)
-        new_iter = self.tree.insert(target, row, drop_mode)
-        parent = self.tree.store.iter_parent(new_iter)
-        if parent:
-            # adjust track label to parent
-            parent_label = self.tree.getLabel(parent)
-            new_label = track.get_label(parent_label)
-            self.tree.setLabel(new_iter, new_label)
-        if highlight:
-            self.tree.select(new_iter)
-        return new_iter
+        if trackdir.flat:
+            return childPosition
+        return position
 
     def set(self, tracks, playNow):
         """ Replace the tracklist, clear it if tracks is None """
@@ -350,7 +501,12 @@ class Tracktree(modules.Module):
         if self.tree.hasMark() and ((not playNow) or (tracks is None) or tracks.empty()):
             modules.postMsg(consts.MSG_CMD_STOP)
 
+        self.stopRestore(cancelled=True)
+        # Forget the rows at once rather than one "row-deleted" signal at a time
+        self.playlistIndex.clear()
         self.tree.clear()
+        self.lazyRows.clear()
+        self.searchIndex.clear()
 
         if tracks is not None and not tracks.empty():
             self.insert(tracks, playNow=playNow)
@@ -366,13 +522,32 @@ class Tracktree(modules.Module):
         if outfile is not None:
             tools.write_file(outfile, self.get_m3u_text())
 
-    def export_playlist_to_dir(self):
-        """ Save the current tracklist to a playlist """
+    def export_playlist_to_dir(self, format=None):
+        """ Save the current tracklist to a directory, convert the files to format (e.g., 'mp3') if given """
+        if format is None:
+            transcoder = None
+            workers = prefs.get(__name__, 'export-workers', PREFS_DFT_EXPORT_WORKERS)
+        else:
+            transcoder = export.Transcoder(format, prefs.get(__name__, 'transcode-bitrate', PREFS_DFT_TRANSCODE_BITRATE))
+            workers = prefs.get(__name__, 'transcode-workers', PREFS_DFT_TRANSCODE_WORKERS)
+            missing = transcoder.getMissingElements()
+            if missing:
+                gui.errorMsgBox(self.window, _('Unable to convert the playlist'),
+                                _('The following GStreamer elements are not installed: %s') % ', '.join(missing))
+                return
+
         outdir = fileChooser.openDirectory(self.window, _('Export playlist to directory'))
 
         if outdir is not None:
-            trackdir = self.getTrackDir()
-            trackdir.export_to_dir(outdir)
+            if self.exportJob is not None:
+                self.exportJob.cancel()
+            files = self.playlistIndex.getTrackDir().get_export_files(outdir)
+            self.exportJob = export.exportFiles(files, workers, self.onExportProgress, transcoder)
+
+    def onExportProgress(self, job):
+        """ A file has been exported, called by the workers of the export job """
+        modules.postMsg(consts.MSG_EVT_EXPORT_PROGRESS, {
+            'done': job.done, 'total': len(job.files), 'throughput': job.getThroughput(), 'finished': job.finished})
 
     def remove(self, iter=None):
         """ Remove the given track, or the selection if iter is None """
@@ -385,8 +560,9 @@ class Tracktree(modules.Module):
         # reverse list, so that we remove children before their fathers
         for iter in reversed(iters):
             track = self.tree.getTrack(iter)
-            if track:
+            if track and track.isLoaded():
                 self.playtime -= track.getLength()
+            self.unindexRows(iter)
             self.tree.removeRow(iter)
 
         self.tree.selection.unselect_all()
@@ -420,6 +596,18 @@ class Tracktree(modules.Module):
         clear = Gtk.MenuItem.new_with_label(_('Clear Playlist'))
         self.popup_menu.append(clear)
 
+        # Stop loading
+        if self.loading:
+            stop = Gtk.MenuItem.new_with_label(_('Stop loading'))
+            stop.connect('activate', lambda item: modules.postMsg(consts.MSG_CMD_CANCEL_LOADING))
+            self.popup_menu.append(stop)
+
+        # Stop exporting
+        if self.exportJob is not None and not self.exportJob.finished:
+            stop_export = Gtk.MenuItem.new_with_label(_('Stop exporting'))
+            stop_export.connect('activate', lambda item: self.exportJob.cancel())
+            self.popup_menu.append(stop_export)
+
         # Save to m3u
         export_m3u = Gtk.MenuItem.new_with_label(_('Export playlist to file'))
         self.popup_menu.append(export_m3u)
@@ -428,14 +616,24 @@ class Tracktree(modules.Module):
         export_dir = Gtk.MenuItem.new_with_label(_('Export playlist to directory'))
         self.popup_menu.append(export_dir)
 
+        # Convert to dir
+        export_mp3 = Gtk.MenuItem.new_with_label(_('Export playlist to directory as MP3'))
+        self.popup_menu.append(export_mp3)
+        export_opus = Gtk.MenuItem.new_with_label(_('Export playlist to directory as Opus'))
+        self.popup_menu.append(export_opus)
+
         if len(tree.store) == 0:
             clear.set_sensitive(False)
             export_m3u.set_sensitive(False)
             export_dir.set_sensitive(False)
+            export_mp3.set_sensitive(False)
+            export_opus.set_sensitive(False)
         else:
             clear.connect('activate', lambda item: modules.postMsg(consts.MSG_CMD_TRACKLIST_CLR))
             export_m3u.connect('activate', lambda item: self.export_playlist_to_m3u())
             export_dir.connect('activate', lambda item: self.export_playlist_to_dir())
+            export_mp3.connect('activate', lambda item: self.export_playlist_to_dir('mp3'))
+            export_opus.connect('activate', lambda item: self.export_playlist_to_dir('opus'))
 
         self.popup_menu.show_all()
         self.popup_menu.popup(None, None, None, None, button, time)
@@ -450,7 +648,11 @@ class Tracktree(modules.Module):
             else:
                 self.jumpTo(self.tree.get_first_iter())
 
-    def save_track_tree(self):
+    def save_track_tree(self, compact=True):
+        """ Save the playing track, merge the journal into the saved playlist in the background if compact is True """
+        # Don't lose the rows that have not been restored yet
+        self.finishRestore()
+
         # Save playing track
         if self.tree.hasMark():
             last_path = tuple(self.tree.mark.get_path())
@@ -458,19 +660,76 @@ class Tracktree(modules.Module):
             last_path = None
         prefs.set(__name__, 'last-played-track', last_path)
 
-        dump = self.getTreeDump()
-        logging.info('Saving playlist')
-        pickleSave(self.savedPlaylist, dump)
+        if compact:
+            logging.info('Saving playlist')
+            self.journal.compact()
+        else:
+            self.journal.close()
         # tell gobject to keep saving the content in regular intervals
         return True
 
+    def getJournalValue(self, iter):
+        """ Return the value of the row in the journal, None for rows that are not saved """
+        (icon, label, track) = self.tree.store.get(iter, ROW_ICO, ROW_NAME, ROW_TRK)
+        if label is None or icon == icons.infoMenuIcon():
+            # Placeholders of running loads and rows whose values are not set yet
+            return None
+        return (label.replace('<b>', '').replace('</b>', ''), None if track is None else track.getFilePath())
+
+    def addJournalRecord(self, record):
+        """ Append a record to the journal, the records are written once the main loop is idle """
+        if self.restoringRow:
+            if not self.restoreJournaled:
+                return
+            self.journal.append(record)
+        elif self.restoring is not None and not self.restoreJournaled:
+            # The paths of the record are relative to the partially restored
+            # playlist, the modification is included in the journaled rows
+            self.journalRestoredRows()
+        else:
+            self.journal.append(record)
+        if not self.journalFlushPending:
+            self.journalFlushPending = True
+            GObject.idle_add(self.flushJournal)
+
+    def flushJournal(self):
+        """ Write the pending records, start a compaction if the journal has grown too large """
+        self.journalFlushPending = False
+        self.journal.flush()
+        if self.journal.size > JOURNAL_COMPACT_SIZE and self.restoring is None:
+            self.journal.compact()
+        return False
+
     # --== Message handlers ==--
 
     def onAppStarted(self):
         """ This is the real initialization function, called when the module has been loaded """
         wTree = tools.prefs.getWidgetsTree()
         self.playtime = 0
+        self.listModifiedPending = False
+        # The running or last ExportJob
+        self.exportJob = None
         self.bufferedTrack = None
+        # The directory nodes to which the continued chunks of the running loads are added, by load id
+        self.lastDirs = {}
+        # Number of loads the TrackLoader has not finished yet
+        self.loading = 0
+        # Row references to the placeholders of the running loads
+        self.placeholders = {}
+        self.lastLoadId = 0
+        # The row references of the tracks whose tags are read by the Prefetcher, a track may have several rows
+        self.lazyRows = {}
+        # The generator restoring the rows of the saved playlist in the background
+        self.restoring = None
+        # Whether the restored rows are journaled, and whether the row being inserted is a restored one
+        self.restoreJournaled = False
+        self.restoringRow = False
+        # The rows of the playlist, to find the next and previous tracks that can be played and to build the TrackDir
+        self.playlistIndex = playlistIndex.PlaylistIndex()
+        # The tracks and the directory labels of the playlist
+        self.searchIndex = searchIndex.SearchIndex()
+        # Incremented by each search, stops the batches of the previous one
+        self.searchGeneration = 0
         # Retrieve widgets
         self.window = wTree.get_object('win-main')
 
@@ -489,8 +748,11 @@ class Tracktree(modules.Module):
 
         # GTK handlers
         self.tree.connect('exttreeview-button-pressed', self.onMouseButton)
+        self.tree.connect('exttreeview-row-expanded', self.onRowExpanded)
         self.tree.connect('tracktreeview-dnd', self.onDND)
         self.tree.connect('key-press-event', self.onKeyboard)
+        self.tree.get_model().connect('row-inserted', self.onRowInserted)
+        self.tree.get_model().connect('row-changed', self.onRowChanged)
         self.tree.get_model().connect('row-deleted', self.onRowDeleted)
 
         _options, args = prefs.getCmdLine()
@@ -500,29 +762,35 @@ class Tracktree(modules.Module):
 
         # Populate the playlist with the saved playlist
         dump = None
-        if os.path.exists(self.savedPlaylist):
-            try:
-                dump = pickleLoad(self.savedPlaylist)
-            except (EOFError, ImportError, IOError):
-                msg = '[%s] Unable to restore playlist from %s\n\n%s'
-                log.logger.error(msg % (MOD_INFO[modules.MODINFO_NAME],
-                                        self.savedPlaylist, traceback.format_exc()))
+        try:
+            (dump, version, generation) = playlist.load(self.savedPlaylist)
+        except (EOFError, ImportError, IOError, ValueError, KeyError, pickle.UnpicklingError):
+            msg = '[%s] Unable to restore playlist from %s\n\n%s'
+            log.logger.error(msg % (MOD_INFO[modules.MODINFO_NAME],
+                                    self.savedPlaylist, traceback.format_exc()))
+            # Keep the broken playlist and its journals for inspection and start a new one
+            playlist.discard(self.savedPlaylist)
+            generation = 0
+
+        # The modifications of the playlist are journaled as they happen
+        self.journal = playlist.Journal(self.savedPlaylist, generation)
+        self.journalFlushPending = False
 
         if dump:
-            self.restoreTreeDump(dump)
-            log.logger.info('[%s] Restored playlist' % MOD_INFO[modules.MODINFO_NAME])
-            self.tree.collapse_all()
-            self.select_last_played_track()
-            self.onListModified()
+            if version < playlist.FORMAT_VERSION:
+                log.logger.info('[%s] Converting the playlist to format version %d' % (
+                    MOD_INFO[modules.MODINFO_NAME], playlist.FORMAT_VERSION))
+            # Journal the whole playlist to convert it by the next compaction
+            self.restoreTreeDump(dump, journaled=version < playlist.FORMAT_VERSION)
 
         commands, args = tools.separate_commands_and_tracks(args)
 
         # Add commandline tracks to the playlist
         if args:
             log.logger.info('[%s] Filling playlist with files given on command line' % MOD_INFO[modules.MODINFO_NAME])
-            tracks = media.getTracks([os.path.abspath(arg) for arg in args])
+            paths = [os.path.abspath(arg) for arg in args]
             playNow = 'stop' not in commands and 'pause' not in commands
-            modules.postMsg(consts.MSG_CMD_TRACKLIST_ADD, {'tracks': tracks, 'playNow': playNow})
+            modules.postMsg(consts.MSG_EVT_LOAD_TRACKS, {'paths': paths, 'playNow': playNow})
         elif 'play' in commands:
             modules.postMsg(consts.MSG_CMD_TOGGLE_PAUSE)
 
@@ -531,7 +799,9 @@ class Tracktree(modules.Module):
 
     def onAppQuit(self):
         """ The module is going to be unloaded """
-        self.save_track_tree()
+        self.save_track_tree(compact=False)
+        if self.exportJob is not None:
+            self.exportJob.cancel()
 
     def onTrackEnded(self, withError):
         """ The current track has ended, jump to the next one if any """
@@ -540,6 +810,7 @@ class Tracktree(modules.Module):
         # If an error occurred with the current track, flag it as such
         if withError and current_iter:
             self.tree.setItem(current_iter, ROW_ICO, icons.errorMenuIcon())
+            self.playlistIndex.setFailed(self.tree.getTrack(current_iter))
 
         # Find the next 'playable' track (not already flagged)
         next = self.__getNextTrackIter()
@@ -574,30 +845,104 @@ class Tracktree(modules.Module):
         if self.tree.hasMark():
             self.tree.setItem(self.tree.getMark(), ROW_ICO, icon)
 
-    def highlight(self, query, root=None):
-        """Select all rows (and their parents) that contain all parts of *query*."""
-        for iter in self.tree.iter_children(root):
-            track = self.tree.getTrack(iter)
-            if track:
-                if all(part in track.get_search_text() for part in query):
-                    self.tree.select(iter)
+    def getSearchKey(self, iter):
+        """ Return the key of the row in the search index: the track or the lower case directory label """
+        track = self.tree.getTrack(iter)
+        if track:
+            return track
+        return self.tree.getLabel(iter).replace('<b>', '').replace('</b>', '').lower()
+
+    def indexRow(self, iter):
+        """ Add the row to the search index """
+        key = self.getSearchKey(iter)
+        if isinstance(key, str):
+            self.searchIndex.add(key, key)
+        elif key.isLoaded():
+            self.searchIndex.add(key, key.get_search_text())
+        else:
+            # Don't read the tags in the main loop, the row is indexed again once they are known
+            self.searchIndex.add(key, key.getFilePath().lower())
+
+    def unindexRows(self, iter):
+        """ Remove the tracks of the row and its descendants from the search index """
+        # Directory labels are kept until the playlist is replaced
+        track = self.tree.getTrack(iter)
+        if track:
+            self.searchIndex.remove(track)
+        for child in self.tree.iter_children(iter):
+            self.unindexRows(child)
+
+    def highlight(self, query):
+        """ Select all rows (and the parents of the tracks) that contain all parts of query """
+        self.searchGeneration += 1
+        matches = self.searchIndex.search(query)
+        first = self.tree.get_first_iter()
+        if matches and first is not None:
+            self.highlightBatch(self.searchGeneration, matches, self.tree.store.get_path(first), False)
+
+    def highlightBatch(self, generation, matches, path, found):
+        """
+        Select the matching rows among the next HIGHLIGHT_BATCH_SIZE rows,
+        starting at path, and schedule the next batch. The rows are only
+        compared to the matching keys, their texts have been searched by
+        the index.
+        """
+        if generation != self.searchGeneration or not self.tree.isValidPath(path):
+            return False
+
+        iter = self.tree.store.get_iter(path)
+        for count in range(HIGHLIGHT_BATCH_SIZE):
+            key = self.getSearchKey(iter)
+            if key in matches:
+                self.tree.select_synchronously(iter)
+                if not isinstance(key, str):
                     # Highlight all parents as well
                     for parent in self.tree.get_all_parents(iter):
                         self.tree.select_synchronously(parent)
-            else:
-                dirname = self.tree.getLabel(iter).replace('<b>', '').replace('</b>', '')
-                if all(part in dirname.lower() for part in query):
-                    self.tree.select_synchronously(iter)
-                self.highlight(query, iter)
+                if not found:
+                    self.tree.scroll(iter)
+                    found = True
+
+            iter = self.tree.get_next_iter(iter)
+            if iter is None:
+                return False
+
+        GObject.idle_add(self.highlightBatch, generation, matches, self.tree.store.get_path(iter), found)
+        return False
 
     def onSearchStart(self, query):
         query = [part.strip().lower() for part in query.split()]
         GObject.idle_add(self.highlight, query)
-        GObject.idle_add(self.tree.scroll_to_first_selection)
 
     def onSearchReset(self):
+        self.searchGeneration += 1
         self.tree.selection.unselect_all()
 
+    def onLoadTracks(self, paths, playNow=True, highlight=False, loadId=None):
+        self.loading += 1
+
+    def onLoadFinished(self, loadId=None):
+        self.loading -= 1
+
+        placeholder = self.getPlaceholder(loadId)
+        if placeholder is not None:
+            self.tree.removeRow(placeholder)
+        self.placeholders.pop(loadId, None)
+        self.lastDirs.pop(loadId, None)
+
+    def onTracksPrefetched(self, tracks):
+        """ The Prefetcher has read the tags of the given tracks, update their rows """
+        for track in tracks:
+            self.searchIndex.update(track, track.get_search_text())
+            for ref in self.lazyRows.pop(track, []):
+                if not ref.valid():
+                    continue
+                iter = self.tree.store.get_iter(ref.get_path())
+                parent = self.tree.store.iter_parent(iter)
+                parent_label = self.tree.getLabel(parent) if parent else None
+                self.tree.setLabel(iter, track.get_label(parent_label, playing=self.tree.isAtMark(iter)))
+        self.onListModified()
+
     def onPaused(self):
         self.paused = True
         self.onPausedToggled(icons.pauseMenuIcon())
@@ -621,6 +966,13 @@ class Tracktree(modules.Module):
         elif event.button == 3:
             self.onShowPopupMenu(tree, event.button, event.time, path)
 
+    def onRowExpanded(self, tree, path):
+        """ Read the tags of the visible children of an expanded directory first """
+        tracks = [self.tree.getTrack(self.tree.store.get_iter(child)) for child in self.tree.iterChildren(path)]
+        tracks = [track for track in tracks if track is not None and not track.isLoaded()]
+        if tracks:
+            modules.postMsg(consts.MSG_CMD_PREFETCH_TRACKS, {'tracks': tracks, 'urgent': True})
+
     def onKeyboard(self, list, event):
         """ Keyboard shortcuts """
         keyname = Gdk.keyval_name(event.keyval)
@@ -640,9 +992,19 @@ class Tracktree(modules.Module):
 
     def onListModified(self):
         """ Some rows have been added/removed/moved """
-        # Getting the trackdir takes virtually no time, so we can do it on every
-        # paylist change
-        tracks = self.getTrackDir()
+        # Removing a directory deletes its rows one by one, so the
+        # listeners are only notified once the main loop is idle
+        if not self.listModifiedPending:
+            self.listModifiedPending = True
+            GObject.idle_add(self.postTracklist)
+
+    def postTracklist(self):
+        """ Send the current tracklist to the listeners """
+        self.listModifiedPending = False
+
+        # The TrackDir is kept up to date by the index, only the changed
+        # directories recompute their playtime
+        tracks = self.playlistIndex.getTrackDir()
         self.playtime = tracks.get_playtime()
 
         modules.postMsg(
@@ -670,17 +1032,21 @@ class Tracktree(modules.Module):
             return urllib.request.url2pathname(uri)
 
         paths = [get_path(uri) for uri in uris]
-        tracks = media.getTracks(paths)
 
         dropInfo = list.get_dest_row_at_pos(x, y)
 
-        # Insert the tracks, but beware of the AFTER/BEFORE mechanism used by GTK
+        # Mark the drop position, but beware of the AFTER/BEFORE mechanism
+        # used by GTK. The tracks are inserted there by the TrackLoader.
+        self.tree.get_selection().unselect_all()
         if dropInfo is None:
-            self.insert(tracks, playNow=False, highlight=True)
+            loadId = self.addPlaceholder(paths)
         else:
             path, drop_mode = dropInfo
             iter = self.tree.store.get_iter(path)
-            self.insert(tracks, iter, drop_mode, playNow=False, highlight=True)
+            loadId = self.addPlaceholder(paths, iter, drop_mode)
+
+        modules.postMsg(consts.MSG_EVT_LOAD_TRACKS,
+                        {'paths': paths, 'playNow': False, 'highlight': True, 'loadId': loadId})
 
         # We want to allow dropping tracks only when we are sure that no dir is
         # selected. This is needed for dnd from nautilus.
@@ -688,6 +1054,20 @@ class Tracktree(modules.Module):
 
         context.finish(True, False, time)
 
+    def onRowInserted(self, model, path, iter):
+        """ Index and journal the new row, its values may be set by a following "row-changed" signal """
+        track = model.get_value(iter, ROW_TRK)
+        dirname = None
+        if track is None and not self.isPlaceholder(iter):
+            dirname = self.tree.getLabel(iter).replace('<b>', '').replace('</b>', '')
+        self.playlistIndex.insert(tuple(path.get_indices()), track, iter.copy(), dirname)
+        self.addJournalRecord((playlist.JOURNAL_INSERT, tuple(path.get_indices()), self.getJournalValue(iter)))
+
+    def onRowChanged(self, model, path, iter):
+        """ Index and journal the new values of the row """
+        self.playlistIndex.update(tuple(path.get_indices()), model.get_value(iter, ROW_TRK))
+        self.addJournalRecord((playlist.JOURNAL_SET, tuple(path.get_indices()), self.getJournalValue(iter)))
+
     def onRowDeleted(self, model, path):
         """
         Internal drag and drop cannot be caught in PyGTK since the
@@ -698,4 +1078,6 @@ class Tracktree(modules.Module):
         afterwards "row-deleted" signals, so we catch the latter and update the
         buttons.
         """
+        self.playlistIndex.remove(tuple(path.get_indices()))
+        self.addJournalRecord((playlist.JOURNAL_DELETE, tuple(path.get_indices())))
         self.onListModified()
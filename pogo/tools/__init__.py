@@ -27,39 +27,27 @@ from xml.sax.saxutils import escape, unescape
 
 from gi.repository import Gtk
 
-from pogo.tools import consts
+from pogo.tools import consts, dirCache
 
 
-__dirCache = {}
+def readDir(directory):
+    """ Return the sorted os.DirEntry objects of directory, an empty list if it is unreadable """
+    try:
+        with os.scandir(directory) as iterator:
+            return sorted(iterator, key=lambda entry: entry.name.lower())
+    except OSError:
+        return []
 
 
-def listDir(directory, listHiddenFiles=False):
+def scanDir(directory, listHiddenFiles=False):
     """
-    Return a list of tuples (filename, path) of files in the given
-    directory.
+    Return a list of the os.DirEntry objects of the given directory,
+    sorted by name. The entries know the type of the files from the
+    directory listing, so is_dir() and is_file() usually don't need an
+    additional system call.
     """
-    if directory in __dirCache:
-        cachedMTime, list = __dirCache[directory]
-    else:
-        cachedMTime, list = None, None
-
-    if os.path.exists(directory):
-        mTime = os.stat(directory).st_mtime
-    else:
-        mTime = 0
-
-    if mTime != cachedMTime:
-        # Make sure it's readable
-        if os.access(directory, os.R_OK | os.X_OK):
-            list = sorted(os.listdir(directory), key=lambda file: file.lower())
-        else:
-            list = []
-
-        __dirCache[directory] = (mTime, list)
-
-    return [
-        (filename, os.path.join(directory, filename))
-        for filename in list if listHiddenFiles or not filename.startswith('.')]
+    entries = dirCache.getCache().get(directory, readDir)
+    return [entry for entry in entries if listHiddenFiles or not entry.name.startswith('.')]
 
 
 def makedirs(dir):
@@ -194,7 +194,14 @@ DND_INTERNAL_TARGET_NAME = 'exttreeview-internal'
 
     MSG_EVT_MUSIC_PATHS_CHANGED,
     MSG_EVT_LOAD_TRACKS,
+    MSG_EVT_LOAD_FINISHED,
+    MSG_CMD_CANCEL_LOADING,
+    MSG_CMD_PREFETCH_TRACKS,
+    MSG_EVT_TRACKS_PREFETCHED,
+    MSG_EVT_LIBRARY_SCAN_PROGRESS,   # Parameters: 'folder', 'done', 'total'
+    MSG_EVT_LIBRARY_SCAN_FINISHED,
+    MSG_EVT_EXPORT_PROGRESS,         # Parameters: 'done', 'total', 'throughput', 'finished'
 
     # End value
     MSG_END_VALUE
-) = list(range(42))
+) = list(range(49))
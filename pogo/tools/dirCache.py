@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+A bounded cache for directory listings.
+
+The least recently used listings are evicted once the cache is full. On
+Linux, each cached directory is watched with inotify and its listing is
+dropped as soon as the directory changes, so cache hits need no system
+call at all. Without inotify (or when no more watches can be added) the
+modification time of the directory is compared on each lookup instead.
+
+Functions registered with addListener() are called with (directory, name)
+when the file name in directory has changed, with (directory, None) when
+anything in directory may have changed and with (None, None) when all
+directories may have changed.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import threading
+import traceback
+
+
+# Maximum number of cached directories
+MAX_DIRS = 4096
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+# Events that change the listing of a directory
+LISTING_EVENTS = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+# Events that change a file in the directory
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+WATCH_MASK = LISTING_EVENTS | FILE_EVENTS | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """ Report the changes of watched directories from a background thread """
+
+    def __init__(self, callback):
+        """
+        Constructor, raise OSError if inotify is not available.
+        callback(wd, mask, name) is called for each event, name is None
+        for events of the directory itself.
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            self.addWatch = libc.inotify_add_watch
+            self.removeWatch = libc.inotify_rm_watch
+            self.fd = libc.inotify_init1(IN_CLOEXEC)
+        except AttributeError:
+            raise OSError('inotify is not available')
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.callback = callback
+        thread = threading.Thread(target=self.run, name='inotify')
+        thread.daemon = True
+        thread.start()
+
+    def watch(self, directory):
+        """ Return the watch descriptor for directory, or -1 if it cannot be watched """
+        return self.addWatch(self.fd, os.fsencode(directory), WATCH_MASK)
+
+    def unwatch(self, wd):
+        self.removeWatch(self.fd, wd)
+
+    def run(self):
+        """ Read and dispatch the events """
+        while True:
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                (wd, mask, _cookie, length) = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                try:
+                    self.callback(wd, mask, os.fsdecode(name) if name else None)
+                except Exception:
+                    logging.error('Error while handling inotify event\n\n%s' % traceback.format_exc())
+
+
+class DirCache:
+    """ An LRU cache of directory listings """
+
+    def __init__(self, maxSize=MAX_DIRS):
+        """ Constructor """
+        # directory -> [mtime, listing, watch descriptor (-1 if none)], the mtime
+        # and the listing are None once the directory has changed
+        self.entries = collections.OrderedDict()
+        # watch descriptor -> directory
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.maxSize = maxSize
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        try:
+            self.inotify = Inotify(self.onEvent)
+        except OSError as error:
+            logging.info('Directory cache without inotify: %s' % error)
+            self.inotify = None
+
+    def notify(self, directory, name):
+        for listener in _listeners:
+            listener(directory, name)
+
+    def get(self, directory, read):
+        """ Return the listing of directory, call read(directory) if it is not cached """
+        with self.lock:
+            entry = self.entries.get(directory)
+            if entry is not None and entry[1] is not None and entry[2] >= 0:
+                # The watch guarantees that the listing is up to date
+                self.entries.move_to_end(directory)
+                self.hits += 1
+                return entry[1]
+
+        try:
+            mTime = os.stat(directory).st_mtime
+        except OSError:
+            mTime = 0
+
+        with self.lock:
+            if entry is not None and entry[1] is not None and entry[0] == mTime:
+                self.entries.move_to_end(directory)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if entry is not None and entry[2] < 0:
+            # Without a watch we don't know which files have changed
+            self.notify(directory, None)
+
+        # Start watching before reading, so that no change can be missed
+        wd = -1
+        if self.inotify is not None:
+            wd = self.inotify.watch(directory)
+
+        entry = [mTime, None, wd]
+        with self.lock:
+            self.entries.pop(directory, None)
+            self.entries[directory] = entry
+            if wd >= 0:
+                other = self.watches.get(wd)
+                if other is not None and other != directory:
+                    # The same directory has been cached under another name
+                    self.entries.pop(other, None)
+                self.watches[wd] = directory
+
+            while len(self.entries) > self.maxSize:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+        listing = read(directory)
+
+        with self.lock:
+            # Don't store the listing if the directory has changed meanwhile
+            if entry[0] == mTime:
+                entry[1] = listing
+
+        return listing
+
+    def remove(self, directory):
+        """ Remove directory and its watch, the lock must be held """
+        entry = self.entries.pop(directory)
+        if entry[2] >= 0 and self.watches.get(entry[2]) == directory:
+            del self.watches[entry[2]]
+            self.inotify.unwatch(entry[2])
+
+    def clear(self):
+        """ Remove all listings """
+        with self.lock:
+            for directory in list(self.entries):
+                self.remove(directory)
+
+    def onEvent(self, wd, mask, name):
+        """ An inotify event has been received """
+        if mask & IN_Q_OVERFLOW:
+            # Some events have been lost
+            with self.lock:
+                for entry in self.entries.values():
+                    entry[0] = entry[1] = None
+                self.invalidations += len(self.entries)
+            self.notify(None, None)
+            return
+
+        with self.lock:
+            directory = self.watches.get(wd)
+            if directory is None:
+                return
+            entry = self.entries.get(directory)
+            if mask & IN_IGNORED:
+                # The watch has been removed by the kernel
+                del self.watches[wd]
+                self.entries.pop(directory, None)
+            elif mask & LISTING_EVENTS and entry is not None and entry[0] is not None:
+                # Keep the watch to be notified of changes to the files
+                entry[0] = entry[1] = None
+                self.invalidations += 1
+
+        if name is not None and mask & FILE_EVENTS:
+            self.notify(directory, name)
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self.notify(directory, None)
+
+    def getStats(self):
+        """ Return a dictionary with the statistics of the cache """
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'watches': len(self.watches),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+__cache = None
+__cacheLock = threading.Lock()
+_listeners = []
+
+
+def addListener(listener):
+    """ Call listener(directory, name) when files change, see the module documentation """
+    _listeners.append(listener)
+
+
+def getCache():
+    """ Return the shared directory cache, create it if needed """
+    global __cache
+    with __cacheLock:
+        if __cache is None:
+            __cache = DirCache()
+        return __cache
+
+
+def logStats():
+    """ Log the statistics of the shared directory cache if it has been used """
+    with __cacheLock:
+        if __cache is not None:
+            logging.info('Directory cache: %s' % __cache.getStats())
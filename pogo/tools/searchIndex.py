@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""
+An inverted index for substring searches.
+
+The texts are split into words (runs of alphanumeric characters) and each
+word maps to the keys of the texts that contain it. A query part can only
+occur in a text if each of its own words is contained in a word of the
+text, so only the keys of the matching words are checked with a
+substring test. The vocabulary is much smaller than the texts, since
+artists, albums and directories are shared by many tracks.
+"""
+
+import collections
+import re
+
+
+WORDS_REGEX = re.compile(r'\w+')
+
+
+class SearchIndex:
+    """ Find the keys whose texts contain all given query parts """
+
+    def __init__(self):
+        """ Constructor """
+        self.texts = {}
+        self.postings = collections.defaultdict(set)
+        # The same key (e.g., a track that is in the playlist twice) may be added several times
+        self.counts = collections.Counter()
+
+    def __contains__(self, key):
+        return key in self.texts
+
+    def add(self, key, text):
+        """ Add an occurrence of key with the given (lower case) text, replace its previous text """
+        self.counts[key] += 1
+        self.update(key, text)
+
+    def update(self, key, text):
+        """ Replace the text of key, without changing its number of occurrences """
+        if key not in self.counts or self.texts.get(key) == text:
+            return
+        self.unindex(key)
+        self.texts[key] = text
+        for word in set(WORDS_REGEX.findall(text)):
+            self.postings[word].add(key)
+
+    def remove(self, key):
+        """ Remove an occurrence of key, the key is only removed with its last occurrence """
+        if key not in self.counts:
+            return
+        self.counts[key] -= 1
+        if self.counts[key] <= 0:
+            del self.counts[key]
+            self.unindex(key)
+
+    def unindex(self, key):
+        """ Remove the text of key from the postings """
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for word in set(WORDS_REGEX.findall(text)):
+            keys = self.postings[word]
+            keys.discard(key)
+            if not keys:
+                del self.postings[word]
+
+    def clear(self):
+        self.texts.clear()
+        self.postings.clear()
+        self.counts.clear()
+
+    def search(self, parts):
+        """ Return the set of keys whose text contains all (lower case) parts """
+        candidates = None
+        for word in set(word for part in parts for word in WORDS_REGEX.findall(part)):
+            keys = set()
+            for (indexWord, wordKeys) in self.postings.items():
+                if word in indexWord:
+                    keys |= wordKeys
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return set()
+
+        if candidates is None:
+            candidates = self.texts
+        return {key for key in candidates if all(part in self.texts[key] for part in parts)}